@@ -1,17 +1,21 @@
-from flask import Flask, render_template, send_from_directory, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, send_from_directory, send_file, request, redirect, url_for, session, flash, jsonify, has_request_context
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from datetime import datetime
+import time
 import os
 import json
 import requests
+import backend_client as backend
+import pdf_cache
+import pdf_jobs
+import email_outbox
+import email_campaigns
+import local_store
 import pandas as pd
 from werkzeug.utils import secure_filename
-import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
-from PIL import Image as PILImage
-from collections import Counter
 
 # Serve normal static from ./static and allow serving images placed in ./image
 app = Flask(__name__, static_folder='static', template_folder='templates')
@@ -30,6 +34,47 @@ login_manager.login_message_category = 'warning'
 # Backend API configuration
 BACKEND_API_BASE = os.environ.get('BACKEND_API_BASE', 'http://192.168.1.4:8000/')
 
+# Refresh the API access token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 30
+
+
+def store_tokens(token_data):
+    """Keep the API tokens from /api/auth/login or /api/auth/refresh in the session"""
+    session['auth'] = {
+        'access_token': token_data.get('access_token'),
+        'refresh_token': token_data.get('refresh_token'),
+        'expires_at': time.time() + (token_data.get('expires_in') or 0),
+    }
+
+
+def current_access_token():
+    """Access token of the logged-in user for backend calls, refreshed when about to expire"""
+    if not has_request_context():
+        return None
+    auth = session.get('auth')
+    if not auth or not auth.get('access_token'):
+        return None
+    if auth['expires_at'] - TOKEN_REFRESH_MARGIN > time.time():
+        return auth['access_token']
+    
+    try:
+        response = backend.post(f'{BACKEND_API_BASE}/api/auth/refresh',
+                                json={'refresh_token': auth['refresh_token']},
+                                headers={'Authorization': None})
+    except requests.exceptions.RequestException as e:
+        print(f"Token refresh failed: {e}")
+        return auth['access_token']
+    if response.status_code != 200:
+        # Refresh token expired or user no longer allowed; calls go out without a token
+        print(f"Token refresh rejected: {response.status_code}")
+        session.pop('auth', None)
+        return None
+    store_tokens(response.json())
+    return session['auth']['access_token']
+
+
+backend.token_provider = current_access_token
+
 # User class for Flask-Login
 class User(UserMixin):
     def __init__(self, user_data):
@@ -78,30 +123,26 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Send emails left in the outbox by a previous run
+if email_outbox.is_configured():
+    email_outbox.start()
+
 # Image folder for logos
 IMAGE_FOLDER = os.path.join(os.path.dirname(__file__), 'image')
 os.makedirs(IMAGE_FOLDER, exist_ok=True)
 
-FORMS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'forms.json')
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'data', 'config.json')
-BOQ_PATH = os.path.join(os.path.dirname(__file__), 'data', 'boq_items.json')
+
+# Saved forms and BOQ items are kept in local_store (SQLite); the JSON files
+# used before are imported into it when it is created
 
 
 def load_forms():
-    try:
-        with open(FORMS_PATH, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+    return local_store.records('forms')
 
 
 def save_form(entry):
-    forms = load_forms()
-    entry['id'] = (max([f.get('id', 0) for f in forms]) + 1) if forms else 1
-    forms.append(entry)
-    os.makedirs(os.path.dirname(FORMS_PATH), exist_ok=True)
-    with open(FORMS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(forms, f, indent=2)
+    local_store.insert('forms', entry)
 
 
 def load_config():
@@ -120,19 +161,11 @@ def load_config():
 
 
 def load_boq_items():
-    try:
-        with open(BOQ_PATH, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+    return local_store.records('boq_items')
 
 
 def save_boq_item(item):
-    items = load_boq_items()
-    item['id'] = (max([i.get('id', 0) for i in items]) + 1) if items else 1
-    items.append(item)
-    with open(BOQ_PATH, 'w', encoding='utf-8') as f:
-        json.dump(items, f, indent=2)
+    local_store.insert('boq_items', item)
 
 
 def download_and_save_logo(s3_url, company_name, company_id):
@@ -176,72 +209,14 @@ def download_and_save_logo(s3_url, company_name, company_id):
         return None
 
 
-def extract_dominant_color_from_logo(logo_path):
-    """Extract the dominant color from a logo image"""
-    try:
-        # Open image
-        img = PILImage.open(logo_path)
-        
-        # Convert to RGB if needed
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Resize to speed up processing
-        img = img.resize((150, 150))
-        
-        # Get all pixels
-        pixels = list(img.getdata())
-        
-        # Filter out very light colors (close to white) and very dark (close to black)
-        filtered_pixels = []
-        for r, g, b in pixels:
-            # Skip if too light (background)
-            if r > 240 and g > 240 and b > 240:
-                continue
-            # Skip if too dark (shadows)
-            if r < 20 and g < 20 and b < 20:
-                continue
-            filtered_pixels.append((r, g, b))
-        
-        if not filtered_pixels:
-            # If all pixels filtered, return default color
-            return '#3D2B1F'
-        
-        # Count color occurrences
-        color_counter = Counter(filtered_pixels)
-        
-        # Get most common color
-        dominant_color = color_counter.most_common(1)[0][0]
-        
-        # Convert RGB to hex
-        hex_color = '#{:02x}{:02x}{:02x}'.format(dominant_color[0], dominant_color[1], dominant_color[2])
-        
-        print(f"Extracted dominant color from logo: {hex_color}")
-        return hex_color
-        
-    except Exception as e:
-        print(f"Error extracting color from logo: {str(e)}")
-        # Return default color on error
-        return '#3D2B1F'
-
-
 def update_boq_item(item_id, updated_item):
-    items = load_boq_items()
-    for i, item in enumerate(items):
-        if item.get('id') == item_id:
-            updated_item['id'] = item_id
-            updated_item['updated_at'] = datetime.utcnow().isoformat()
-            items[i] = updated_item
-            break
-    with open(BOQ_PATH, 'w', encoding='utf-8') as f:
-        json.dump(items, f, indent=2)
+    updated_item['id'] = item_id
+    updated_item['updated_at'] = datetime.utcnow().isoformat()
+    local_store.replace('boq_items', item_id, updated_item)
 
 
 def delete_boq_item(item_id):
-    items = load_boq_items()
-    items = [item for item in items if item.get('id') != item_id]
-    with open(BOQ_PATH, 'w', encoding='utf-8') as f:
-        json.dump(items, f, indent=2)
+    local_store.delete('boq_items', item_id)
 
 
 def allowed_file(filename):
@@ -274,6 +249,36 @@ def serve_upload(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 
+@app.route('/proposals/pdf/<key>/<filename>')
+def serve_proposal_pdf(key, filename):
+    """Serve a cached proposal PDF under its file name (the key is unguessable, like an upload path)"""
+    try:
+        pdf_path = pdf_cache.lookup(key)
+    except ValueError:
+        pdf_path = None
+    if pdf_path is None:
+        return {'error': 'PDF not found'}, 404
+    return send_file(pdf_path, mimetype='application/pdf', download_name=filename)
+
+
+def proposal_pdf_version(proposal_id, proposal, user):
+    """PDF cache key, file name and URL of this version of a proposal (/full response)"""
+    import re
+    
+    # Create sanitized filename from proposal title
+    proposal_title = proposal.get('title', 'Proposal')
+    # Remove special characters and replace spaces with underscores
+    sanitized_title = re.sub(r'[^\w\s-]', '', proposal_title)
+    sanitized_title = re.sub(r'[-\s]+', '_', sanitized_title)
+    # Consistent PDF filename: ProposalName_ProposalID.pdf
+    pdf_filename = f'{sanitized_title}_{proposal_id}.pdf'
+    
+    # Company details (branding) come from the session
+    company = user.get('company', {}) if isinstance(user.get('company'), dict) else {}
+    key = pdf_cache.version_key(proposal, company)
+    return key, pdf_filename, url_for('serve_proposal_pdf', key=key, filename=pdf_filename)
+
+
 @app.route('/proposals', methods=['GET', 'POST'])
 @login_required
 def index():
@@ -335,34 +340,28 @@ def view_proposal(proposal_id):
         'green': '#90EE90',
     }
     
-    # Load proposal from API
+    # Load proposal, client, items, company clients and project types in one call
     proposal = None
     proposal_items = []
+    clients = []
+    clients_json = '[]'
+    project_types = []
     
     try:
-        # Get proposal details
-        api_url = f'{BACKEND_API_BASE}/api/proposals/{proposal_id}'
+        api_url = f'{BACKEND_API_BASE}/api/proposals/{proposal_id}/full'
         print(f"Fetching proposal from: {api_url}")
-        response = requests.get(api_url, timeout=5)
+        response = backend.get(api_url, params={'include_clients': 'true'}, timeout=5)
         print(f"Proposal response status: {response.status_code}")
         if response.status_code == 200:
             proposal = response.json()
+            client = proposal.pop('client', None) or {}
+            proposal_items = proposal.pop('items', [])
+            project_types = proposal.pop('project_types', [])
+            clients = proposal.pop('clients', None) or []
+            clients_json = json.dumps(clients)
+            proposal['client_name'] = client.get('client_name', 'Unknown Client')
             print(f"Proposal data: {proposal}")
-            
-            # Get client name from clients API
-            if proposal.get('client_id'):
-                try:
-                    client_url = f'{BACKEND_API_BASE}/api/clients/{proposal["client_id"]}'
-                    print(f"Fetching client from: {client_url}")
-                    client_response = requests.get(client_url, timeout=5)
-                    print(f"Client response status: {client_response.status_code}")
-                    if client_response.status_code == 200:
-                        client = client_response.json()
-                        proposal['client_name'] = client.get('client_name', 'Unknown Client')
-                        print(f"Client name: {proposal['client_name']}")
-                except Exception as e:
-                    print(f"Error loading client name: {e}")
-                    proposal['client_name'] = 'Unknown Client'
+            print(f"Loaded {len(proposal_items)} BOQ items")
         else:
             print(f"Proposal not found - Status: {response.status_code}")
             flash(f'Proposal not found', 'danger')
@@ -372,45 +371,6 @@ def view_proposal(proposal_id):
         flash(f'Error loading proposal: {str(e)}', 'danger')
         return redirect(url_for('users'))
     
-    # Load proposal items (BOQ items)
-    try:
-        items_url = f'{BACKEND_API_BASE}/api/proposal-items/proposal/{proposal_id}'
-        print(f"Loading BOQ items from: {items_url}")
-        items_response = requests.get(items_url, timeout=5)
-        print(f"BOQ items response status: {items_response.status_code}")
-        if items_response.status_code == 200:
-            proposal_items = items_response.json()
-            print(f"Loaded {len(proposal_items)} BOQ items")
-        else:
-            print(f"Failed to load BOQ items: {items_response.status_code}")
-            print(f"Response: {items_response.text}")
-    except Exception as e:
-        print(f"Error loading proposal items: {e}")
-    
-    # Load clients for display
-    clients_json = '[]'
-    if company_id:
-        try:
-            api_url = f'{BACKEND_API_BASE}/api/clients/company/{company_id}'
-            response = requests.get(api_url, timeout=5)
-            if response.status_code == 200:
-                clients = response.json()
-                clients_json = json.dumps(clients)
-        except Exception as e:
-            print(f"Error loading clients: {e}")
-    
-    # Load project types
-    project_types = []
-    if company_id:
-        try:
-            api_url = f'{BACKEND_API_BASE}/api/boq-items/project-types/{company_id}'
-            response = requests.get(api_url, timeout=5)
-            if response.status_code == 200:
-                project_types = response.json()
-        except Exception as e:
-            print(f"Error loading project types: {e}")
-            project_types = ['Office', 'Residential', 'Commercial', 'Saloon', 'Other']
-    
     print(f"\n=== Rendering Template ===")
     print(f"Proposal: {proposal}")
     print(f"Proposal Items count: {len(proposal_items)}")
@@ -484,7 +444,7 @@ def edit_proposal(proposal_id):
                     'is_active': True
                 }
                 
-                api_response = requests.put(
+                api_response = backend.put(
                     f'{BACKEND_API_BASE}/api/clients/{client_id}',
                     json=client_payload,
                     timeout=5
@@ -513,7 +473,7 @@ def edit_proposal(proposal_id):
                 'user_id': user.get('id')
             }
             
-            api_response = requests.put(
+            api_response = backend.put(
                 f'{BACKEND_API_BASE}/api/proposals/{proposal_id}',
                 json=proposal_payload,
                 timeout=5
@@ -527,74 +487,34 @@ def edit_proposal(proposal_id):
                 try:
                     boq_items = json.loads(boq_items_json)
                     
-                    # Get existing proposal items from API
-                    existing_items_response = requests.get(
-                        f'{BACKEND_API_BASE}/api/proposal-items/proposal/{proposal_id}',
-                        timeout=5
-                    )
-                    existing_items = existing_items_response.json() if existing_items_response.status_code == 200 else []
-                    existing_item_ids = {item['id'] for item in existing_items}
-                    
-                    # Track which items are being kept/updated
-                    updated_item_ids = set()
-                    
-                    # Process BOQ items - update existing or create new
+                    # Send the full item list in one request; the API updates items
+                    # that carry an existing id, inserts the rest and deletes the
+                    # ones that were removed, all in a single transaction
+                    items_payload = []
                     for item in boq_items:
                         item_id = item.get('id')  # This will be the proposal_item id, not boq_item_id
-                        
-                        item_payload = {
-                            'proposal_id': proposal_id,
-                            'boq_item_id': item.get('boq_item_id'),
+                        items_payload.append({
+                            'id': int(item_id) if item_id else None,
                             'item_name': item.get('item_name', ''),
                             'description': item.get('description', ''),
-                            'unit': item.get('unit', ''),
                             'qty': float(item.get('qty', 0)),
                             'unit_price': float(item.get('unit_price', 0))
-                        }
-                        
-                        if item_id and int(item_id) in existing_item_ids:
-                            # Update existing item
-                            updated_item_ids.add(int(item_id))
-                            item_response = requests.put(
-                                f'{BACKEND_API_BASE}/api/proposal-items/{item_id}',
-                                json=item_payload,
-                                timeout=5
-                            )
-                            
-                            if item_response.status_code == 200:
-                                print(f"Updated BOQ item {item_id}: {item.get('item_name')}")
-                            else:
-                                print(f"Failed to update BOQ item {item_id}: {item_response.status_code}")
-                        else:
-                            # Create new item
-                            item_response = requests.post(
-                                f'{BACKEND_API_BASE}/api/proposal-items/',
-                                json=item_payload,
-                                timeout=5
-                            )
-                            
-                            if item_response.status_code in [200, 201]:
-                                new_item = item_response.json()
-                                print(f"Created new BOQ item: {item.get('item_name')}")
-                                if isinstance(new_item, dict) and 'id' in new_item:
-                                    updated_item_ids.add(new_item['id'])
-                            else:
-                                print(f"Failed to create BOQ item: {item_response.status_code}")
+                        })
                     
-                    # Delete items that were removed (exist in DB but not in submitted form)
-                    items_to_delete = existing_item_ids - updated_item_ids
-                    for item_id_to_delete in items_to_delete:
-                        try:
-                            delete_response = requests.delete(
-                                f'{BACKEND_API_BASE}/api/proposal-items/{item_id_to_delete}',
-                                timeout=5
-                            )
-                            if delete_response.status_code in [200, 204]:
-                                print(f"Deleted BOQ item {item_id_to_delete}")
-                            else:
-                                print(f"Failed to delete BOQ item {item_id_to_delete}: {delete_response.status_code}")
-                        except Exception as e:
-                            print(f"Error deleting BOQ item {item_id_to_delete}: {e}")
+                    items_response = backend.put(
+                        f'{BACKEND_API_BASE}/api/proposal-items/proposal/{proposal_id}/bulk',
+                        json={'items': items_payload},
+                        timeout=10
+                    )
+                    
+                    if items_response.status_code == 200:
+                        result = items_response.json()
+                        print(f"BOQ items saved: {result.get('inserted')} inserted, "
+                              f"{result.get('updated')} updated, {result.get('deleted')} deleted")
+                    else:
+                        print(f"Failed to save BOQ items: {items_response.status_code}")
+                        flash(f'Proposal updated but error with BOQ items: {items_response.text}', 'warning')
+                        return redirect(url_for('view_proposal', proposal_id=proposal_id))
                     
                     flash('Proposal updated successfully!', 'success')
                     return redirect(url_for('view_proposal', proposal_id=proposal_id))
@@ -612,35 +532,31 @@ def edit_proposal(proposal_id):
             flash(f'Error updating proposal: {str(e)}', 'danger')
     
     # Handle GET request (load proposal for editing)
+    # Load proposal, client, items, company clients and project types in one call
     proposal = None
     proposal_items = []
+    clients = []
+    clients_json = '[]'
+    project_types = []
     
     try:
-        # Get proposal details
-        api_url = f'{BACKEND_API_BASE}/api/proposals/{proposal_id}'
+        api_url = f'{BACKEND_API_BASE}/api/proposals/{proposal_id}/full'
         print(f"Fetching proposal from: {api_url}")
-        response = requests.get(api_url, timeout=5)
+        response = backend.get(api_url, params={'include_clients': 'true'}, timeout=5)
         print(f"Proposal response status: {response.status_code}")
         if response.status_code == 200:
             proposal = response.json()
+            client = proposal.pop('client', None) or {}
+            proposal_items = proposal.pop('items', [])
+            project_types = proposal.pop('project_types', [])
+            clients = proposal.pop('clients', None) or []
+            clients_json = json.dumps(clients)
+            proposal['client_name'] = client.get('client_name', 'Unknown Client')
+            proposal['email_address'] = client.get('email_address', '')
+            proposal['mobile_number'] = client.get('mobile_number', '')
+            proposal['contact_address'] = client.get('contact_address', '')
             print(f"Proposal data: {proposal}")
-            
-            # Get client details
-            if proposal.get('client_id'):
-                try:
-                    client_url = f'{BACKEND_API_BASE}/api/clients/{proposal["client_id"]}'
-                    print(f"Fetching client from: {client_url}")
-                    client_response = requests.get(client_url, timeout=5)
-                    print(f"Client response status: {client_response.status_code}")
-                    if client_response.status_code == 200:
-                        client = client_response.json()
-                        proposal['client_name'] = client.get('client_name', 'Unknown Client')
-                        proposal['email_address'] = client.get('email_address', '')
-                        proposal['mobile_number'] = client.get('mobile_number', '')
-                        proposal['contact_address'] = client.get('contact_address', '')
-                        print(f"Client name: {proposal['client_name']}")
-                except Exception as e:
-                    print(f"Error loading client details: {e}")
+            print(f"Loaded {len(proposal_items)} BOQ items")
         else:
             print(f"Proposal not found - Status: {response.status_code}")
             flash(f'Proposal not found', 'danger')
@@ -650,45 +566,6 @@ def edit_proposal(proposal_id):
         flash(f'Error loading proposal: {str(e)}', 'danger')
         return redirect(url_for('users'))
     
-    # Load proposal items (BOQ items)
-    try:
-        items_url = f'{BACKEND_API_BASE}/api/proposal-items/proposal/{proposal_id}'
-        print(f"Loading BOQ items from: {items_url}")
-        items_response = requests.get(items_url, timeout=5)
-        print(f"BOQ items response status: {items_response.status_code}")
-        if items_response.status_code == 200:
-            proposal_items = items_response.json()
-            print(f"Loaded {len(proposal_items)} BOQ items")
-        else:
-            print(f"Failed to load BOQ items: {items_response.status_code}")
-    except Exception as e:
-        print(f"Error loading proposal items: {e}")
-    
-    # Load clients for display
-    clients = []
-    clients_json = '[]'
-    if company_id:
-        try:
-            api_url = f'{BACKEND_API_BASE}/api/clients/company/{company_id}'
-            response = requests.get(api_url, timeout=5)
-            if response.status_code == 200:
-                clients = response.json()
-                clients_json = json.dumps(clients)
-        except Exception as e:
-            print(f"Error loading clients: {e}")
-    
-    # Load project types
-    project_types = []
-    if company_id:
-        try:
-            api_url = f'{BACKEND_API_BASE}/api/boq-items/project-types/{company_id}'
-            response = requests.get(api_url, timeout=5)
-            if response.status_code == 200:
-                project_types = response.json()
-        except Exception as e:
-            print(f"Error loading project types: {e}")
-            project_types = ['Office', 'Residential', 'Commercial', 'Saloon', 'Other']
-    
     print(f"\n=== Rendering Edit Template ===")
     print(f"Proposal: {proposal}")
     print(f"Proposal Items count: {len(proposal_items)}")
@@ -708,25 +585,17 @@ def edit_proposal(proposal_id):
 @app.route('/proposals/<int:proposal_id>/check-pdf', methods=['GET'])
 @login_required
 def check_proposal_pdf(proposal_id):
-    """Check if PDF exists for a proposal"""
+    """Check if the PDF of the current version of a proposal exists"""
     try:
-        import re
-        # Get proposal details to generate filename
-        api_url = f'{BACKEND_API_BASE}/api/proposals/{proposal_id}'
-        response = requests.get(api_url, timeout=5)
+        # Get proposal details with client and items: the PDF version depends on all of them
+        api_url = f'{BACKEND_API_BASE}/api/proposals/{proposal_id}/full'
+        response = backend.get(api_url, timeout=5)
         if response.status_code != 200:
             return jsonify({'exists': False}), 200
         
-        proposal = response.json()
-        proposal_title = proposal.get('title', 'Proposal')
-        sanitized_title = re.sub(r'[^\w\s-]', '', proposal_title)
-        sanitized_title = re.sub(r'[-\s]+', '_', sanitized_title)
-        
-        pdf_filename = f'{sanitized_title}_{proposal_id}.pdf'
-        pdf_path = os.path.join(UPLOAD_FOLDER, pdf_filename)
+        key, pdf_filename, pdf_url = proposal_pdf_version(proposal_id, response.json(), session.get('user'))
         
-        if os.path.exists(pdf_path):
-            pdf_url = f'/uploads/{pdf_filename}'
+        if pdf_cache.lookup(key):
             return jsonify({'exists': True, 'pdf_url': pdf_url, 'filename': pdf_filename}), 200
         else:
             return jsonify({'exists': False}), 200
@@ -739,421 +608,40 @@ def check_proposal_pdf(proposal_id):
 @app.route('/proposals/<int:proposal_id>/generate-pdf', methods=['POST'])
 @login_required
 def generate_proposal_pdf(proposal_id):
-    """Generate PDF for a proposal"""
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib import colors as rl_colors
-    from reportlab.lib.units import inch, cm
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT, TA_JUSTIFY
-    from io import BytesIO
-    import re
+    """
+    Start generating the PDF of a proposal.
     
+    Returns 200 with pdf_url if the PDF of this version of the proposal is
+    cached (and force_regenerate is not set), otherwise 202 with a job to poll
+    at status_url.
+    """
     user = session.get('user')
     
     try:
-        # Get proposal details
-        api_url = f'{BACKEND_API_BASE}/api/proposals/{proposal_id}'
-        response = requests.get(api_url, timeout=5)
+        # Get proposal details with client and items in one call
+        api_url = f'{BACKEND_API_BASE}/api/proposals/{proposal_id}/full'
+        response = backend.get(api_url, timeout=5)
         if response.status_code != 200:
             return {'error': 'Proposal not found'}, 404
         
         proposal = response.json()
+        key, pdf_filename, pdf_url = proposal_pdf_version(proposal_id, proposal, user)
         
-        # Create sanitized filename from proposal title
-        proposal_title = proposal.get('title', 'Proposal')
-        # Remove special characters and replace spaces with underscores
-        sanitized_title = re.sub(r'[^\w\s-]', '', proposal_title)
-        sanitized_title = re.sub(r'[-\s]+', '_', sanitized_title)
-        
-        # Create consistent PDF filename: ProposalName_ProposalID.pdf
-        pdf_filename = f'{sanitized_title}_{proposal_id}.pdf'
-        pdf_path = os.path.join(UPLOAD_FOLDER, pdf_filename)
-        
-        # Check if PDF already exists and force regenerate flag
+        # Check if this version is cached and force regenerate flag
         force_regenerate = request.get_json().get('force_regenerate', False) if request.is_json else False
         
-        if os.path.exists(pdf_path) and not force_regenerate:
-            # PDF already exists, return existing file
-            pdf_url = f'/uploads/{pdf_filename}'
+        if pdf_cache.lookup(key) and not force_regenerate:
+            # Unchanged since the last render, return the cached file
             return {'pdf_url': pdf_url, 'filename': pdf_filename, 'already_exists': True}, 200
         
-        # Get client details
-        client = None
-        if proposal.get('client_id'):
-            client_url = f'{BACKEND_API_BASE}/api/clients/{proposal["client_id"]}'
-            client_response = requests.get(client_url, timeout=5)
-            if client_response.status_code == 200:
-                client = client_response.json()
-        
-        # Get proposal items
-        items_url = f'{BACKEND_API_BASE}/api/proposal-items/proposal/{proposal_id}'
-        items_response = requests.get(items_url, timeout=5)
-        proposal_items = items_response.json() if items_response.status_code == 200 else []
-        
-        # Get company details from session
+        # Rendered by the backend in the background; a render of the same
+        # proposal version that is already queued or running is joined instead
+        # of repeated
         company = user.get('company', {}) if isinstance(user.get('company'), dict) else {}
-        
-        # Create PDF
-        doc = SimpleDocTemplate(
-            pdf_path, 
-            pagesize=A4, 
-            topMargin=0.5*inch, 
-            bottomMargin=0.5*inch,
-            leftMargin=0.5*inch,
-            rightMargin=0.5*inch
-        )
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # Page width for calculations
-        page_width = A4[0] - 1*inch  # Account for margins
-        
-        # Default brand color
-        brand_color = '#3D2B1F'
-        
-        # ==================== HEADER SECTION ====================
-        # Company Logo and Details in header
-        header_data = []
-        
-        # Try to load company logo and extract color
-        logo_img = None
-        logo_path_for_color = None
-        if company.get('logo_url'):
-            logo_path_candidates = [
-                os.path.join(IMAGE_FOLDER, os.path.basename(company['logo_url'])),
-                os.path.join(os.path.dirname(__file__), company['logo_url'].lstrip('/')),
-            ]
-            for logo_path in logo_path_candidates:
-                if os.path.exists(logo_path):
-                    try:
-                        logo_img = Image(logo_path, width=1.2*inch, height=1.2*inch, kind='proportional')
-                        logo_path_for_color = logo_path
-                        break
-                    except:
-                        pass
-        
-        # Extract dominant color from logo
-        if logo_path_for_color:
-            brand_color = extract_dominant_color_from_logo(logo_path_for_color)
-            print(f"Using logo brand color: {brand_color}")
-        else:
-            print(f"Using default brand color: {brand_color}")
-        
-        # Company info paragraph
-        company_info = []
-        if company.get('company_name'):
-            company_info.append(f"<b><font size=14>{company.get('company_name')}</font></b>")
-        if company.get('contact_address'):
-            company_info.append(f"{company.get('contact_address')}")
-        if company.get('city') or company.get('state') or company.get('pincode'):
-            location = f"{company.get('city', '')}, {company.get('state', '')} - {company.get('pincode', '')}"
-            company_info.append(location.strip(', -'))
-        if company.get('contact_email'):
-            company_info.append(f"Email: {company.get('contact_email')}")
-        if company.get('contact_phone'):
-            company_info.append(f"Phone: {company.get('contact_phone')}")
-        if company.get('gstin'):
-            company_info.append(f"<b>GSTIN:</b> {company.get('gstin')}")
-        
-        company_para_style = ParagraphStyle(
-            'CompanyInfo',
-            parent=styles['Normal'],
-            fontSize=9,
-            leading=12,
-            textColor=rl_colors.HexColor(brand_color)
-        )
-        company_para = Paragraph('<br/>'.join(company_info), company_para_style) if company_info else Paragraph('', company_para_style)
-        
-        # Create header table with logo and company info
-        if logo_img:
-            header_data = [[logo_img, company_para]]
-            header_table = Table(header_data, colWidths=[1.5*inch, page_width - 1.5*inch])
-        else:
-            header_data = [[company_para]]
-            header_table = Table(header_data, colWidths=[page_width])
-        
-        header_table.setStyle(TableStyle([
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ]))
-        story.append(header_table)
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Horizontal line with brand color
-        line_table = Table([['']], colWidths=[page_width])
-        line_table.setStyle(TableStyle([
-            ('LINEABOVE', (0, 0), (-1, 0), 2, rl_colors.HexColor(brand_color)),
-            ('TOPPADDING', (0, 0), (-1, -1), 0),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-        ]))
-        story.append(line_table)
-        story.append(Spacer(1, 0.15*inch))
-        
-        # ==================== QUOTATION TITLE ====================
-        title_style = ParagraphStyle(
-            'QuotationTitle',
-            parent=styles['Heading1'],
-            fontSize=20,
-            textColor=rl_colors.HexColor(brand_color),
-            spaceAfter=15,
-            alignment=TA_CENTER,
-            fontName='Helvetica-Bold'
-        )
-        story.append(Paragraph("QUOTATION", title_style))
-        story.append(Spacer(1, 0.15*inch))
-        
-        # ==================== CLIENT & PROJECT DETAILS GRID ====================
-        # Create a grid with client details on left and project details on right
-        grid_cell_style = ParagraphStyle(
-            'GridCell',
-            parent=styles['Normal'],
-            fontSize=9,
-            leading=11,
-            textColor=rl_colors.black
-        )
-        
-        # Client details
-        client_details = []
-        client_details.append(Paragraph("<b><font size=10>CLIENT DETAILS</font></b>", grid_cell_style))
-        if client:
-            if client.get('client_name'):
-                client_details.append(Paragraph(f"<b>Name:</b> {client.get('client_name')}", grid_cell_style))
-            if client.get('mobile_number'):
-                client_details.append(Paragraph(f"<b>Mobile:</b> {client.get('mobile_number')}", grid_cell_style))
-            if client.get('email_address'):
-                client_details.append(Paragraph(f"<b>Email:</b> {client.get('email_address')}", grid_cell_style))
-            if client.get('contact_address'):
-                client_details.append(Paragraph(f"<b>Address:</b> {client.get('contact_address')}", grid_cell_style))
-        
-        # Project details
-        project_details = []
-        project_details.append(Paragraph("<b><font size=10>PROJECT DETAILS</font></b>", grid_cell_style))
-        if proposal.get('title'):
-            project_details.append(Paragraph(f"<b>Project:</b> {proposal.get('title')}", grid_cell_style))
-        if proposal.get('project_type'):
-            project_details.append(Paragraph(f"<b>Type:</b> {proposal.get('project_type')}", grid_cell_style))
-        if proposal.get('area'):
-            project_details.append(Paragraph(f"<b>Area:</b> {proposal.get('area')} sq.ft", grid_cell_style))
-        if proposal.get('description'):
-            project_details.append(Paragraph(f"<b>Description:</b> {proposal.get('description')}", grid_cell_style))
-        if proposal.get('material_preferences'):
-            project_details.append(Paragraph(f"<b>Materials:</b> {proposal.get('material_preferences')}", grid_cell_style))
-        if proposal.get('special_requirement'):
-            project_details.append(Paragraph(f"<b>Special Req:</b> {proposal.get('special_requirement')}", grid_cell_style))
-        
-        # Date
-        from datetime import datetime
-        current_date = datetime.now().strftime('%d-%b-%Y')
-        project_details.append(Paragraph(f"<b>Date:</b> {current_date}", grid_cell_style))
-        
-        # Create grid table
-        grid_data = [[client_details, project_details]]
-        grid_table = Table(grid_data, colWidths=[page_width/2 - 0.1*inch, page_width/2 - 0.1*inch])
-        grid_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), rl_colors.HexColor('#f8f8f8')),
-            ('BOX', (0, 0), (-1, -1), 1, rl_colors.HexColor(brand_color)),
-            ('INNERGRID', (0, 0), (-1, -1), 0.5, rl_colors.grey),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 10),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-            ('TOPPADDING', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-        ]))
-        story.append(grid_table)
-        story.append(Spacer(1, 0.25*inch))
-        
-        # ==================== BOQ ITEMS TABLE ====================
-        if proposal_items:
-            # BOQ Heading
-            boq_heading_style = ParagraphStyle(
-                'BOQHeading',
-                parent=styles['Heading2'],
-                fontSize=12,
-                textColor=rl_colors.HexColor(brand_color),
-                spaceAfter=10,
-                fontName='Helvetica-Bold'
-            )
-            story.append(Paragraph("BILL OF QUANTITIES", boq_heading_style))
-            
-            # BOQ Table Header
-            boq_data = [[
-                Paragraph('<b>S.No</b>', grid_cell_style),
-                Paragraph('<b>Item Description</b>', grid_cell_style),
-                Paragraph('<b>Qty</b>', grid_cell_style),
-                Paragraph('<b>Unit Price (₹)</b>', grid_cell_style),
-                Paragraph('<b>Amount (₹)</b>', grid_cell_style)
-            ]]
-            
-            total_amount = 0
-            
-            for idx, item in enumerate(proposal_items, 1):
-                item_qty = item.get('qty', 0)
-                unit_price = item.get('unit_price', 0)
-                item_total = item_qty * unit_price
-                total_amount += item_total
-                
-                # Item description with name and details
-                item_name = item.get('item_name', 'N/A')
-                desc = item.get('description', '')
-                
-                item_text = f"<b>{item_name}</b>"
-                if desc:
-                    item_text += f"<br/><font size=8>{desc}</font>"
-                
-                item_para = Paragraph(item_text, grid_cell_style)
-                
-                boq_data.append([
-                    Paragraph(str(idx), grid_cell_style),
-                    item_para,
-                    Paragraph(str(item_qty), grid_cell_style),
-                    Paragraph(f"{unit_price:,.2f}", grid_cell_style),
-                    Paragraph(f"<b>{item_total:,.2f}</b>", grid_cell_style)
-                ])
-            
-            # BOQ Table
-            boq_table = Table(
-                boq_data, 
-                colWidths=[0.5*inch, 3.2*inch, 0.6*inch, 1.2*inch, 1.3*inch]
-            )
-            boq_table.setStyle(TableStyle([
-                # Header row styling with logo brand color
-                ('BACKGROUND', (0, 0), (-1, 0), rl_colors.HexColor(brand_color)),
-                ('TEXTCOLOR', (0, 0), (-1, 0), rl_colors.white),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                ('TOPPADDING', (0, 0), (-1, 0), 10),
-                
-                # Data rows styling
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # S.No center
-                ('ALIGN', (2, 1), (2, -1), 'CENTER'),  # Qty center
-                ('ALIGN', (3, 1), (3, -1), 'LEFT'),    # Unit Price left align
-                ('ALIGN', (4, 1), (4, -1), 'LEFT'),    # Amount left align
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                
-                # Grid and borders with logo brand color
-                ('GRID', (0, 0), (-1, -1), 0.5, rl_colors.grey),
-                ('BOX', (0, 0), (-1, -1), 1.5, rl_colors.HexColor(brand_color)),
-                
-                # Padding
-                ('LEFTPADDING', (0, 0), (-1, -1), 6),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-                ('TOPPADDING', (0, 1), (-1, -1), 8),
-                ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-                
-                # Alternate row colors for better readability
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [rl_colors.white, rl_colors.HexColor('#f9f9f9')])
-            ]))
-            story.append(boq_table)
-            story.append(Spacer(1, 0.1*inch))
-            
-            # ==================== TOTAL SECTION ====================
-            # Create total table aligned with BOQ amount column
-            # BOQ columns: [0.5, 3.2, 0.6, 1.2, 1.3] inches
-            # Total should align with last column (1.3 inch for amount)
-            
-            total_data = [
-                ['Subtotal:', f"₹ {total_amount:,.2f}"],
-            ]
-            
-            # Add GST if available in company details
-            gst_amount = 0
-            if company.get('gstin'):
-                gst_rate = 18  # Default GST rate
-                gst_amount = total_amount * gst_rate / 100
-                total_data.append([f'GST ({gst_rate}%):', f"₹ {gst_amount:,.2f}"])
-            
-            grand_total = total_amount + gst_amount
-            total_data.append(['', ''])  # Empty row for spacing
-            total_data.append(['GRAND TOTAL:', f"₹ {grand_total:,.2f}"])
-            
-            # Create total table - match BOQ table width structure
-            # Empty space + label + amount columns
-            empty_space_width = 0.5*inch + 3.2*inch + 0.6*inch  # S.No + Description + Qty columns
-            label_width = 1.2*inch  # Unit Price column width
-            amount_width = 1.3*inch  # Amount column width
-            
-            total_table = Table(total_data, colWidths=[label_width, amount_width])
-            total_table.setStyle(TableStyle([
-                ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-                ('ALIGN', (1, 0), (1, -1), 'LEFT'),  # Left align amounts to match BOQ
-                ('FONTNAME', (0, 0), (-1, -2), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -2), 10),
-                ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, -1), (-1, -1), 14),
-                ('TEXTCOLOR', (0, -1), (-1, -1), rl_colors.HexColor(brand_color)),
-                ('LINEABOVE', (0, -1), (-1, -1), 2, rl_colors.HexColor(brand_color)),
-                ('TOPPADDING', (0, -1), (-1, -1), 8),
-                ('BOTTOMPADDING', (0, 0), (-1, -2), 4),
-                ('LEFTPADDING', (0, 0), (-1, -1), 6),  # Match BOQ padding
-                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ]))
-            
-            # Wrapper to position total table aligned with BOQ columns
-            # Create empty spacer and total table side by side
-            total_wrapper = Table([[Spacer(empty_space_width, 0), total_table]], colWidths=[empty_space_width, label_width + amount_width])
-            total_wrapper.setStyle(TableStyle([
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                ('TOPPADDING', (0, 0), (-1, -1), 0),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-            ]))
-            story.append(total_wrapper)
-            story.append(Spacer(1, 0.3*inch))
-        else:
-            total_amount = 0
-        
-        # ==================== FOOTER SECTION ====================
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=8,
-            textColor=rl_colors.grey,
-            alignment=TA_CENTER
-        )
-        
-        terms_style = ParagraphStyle(
-            'Terms',
-            parent=styles['Normal'],
-            fontSize=9,
-            leading=12,
-            textColor=rl_colors.black
-        )
-        
-        # Terms and conditions
-        story.append(Paragraph("<b>Terms & Conditions:</b>", terms_style))
-        terms = [
-            "1. The above quotation is valid for 30 days from the date of issue.",
-            "2. Payment terms: 50% advance, 30% on material delivery, 20% on completion.",
-            "3. GST as applicable will be charged extra.",
-            "4. Any changes to the scope of work will be charged separately.",
-        ]
-        for term in terms:
-            story.append(Paragraph(term, terms_style))
-        
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Company signature area
-        signature_text = f"""
-        <br/><br/>
-        <b>For {company.get('company_name', 'Company Name')}</b><br/>
-        <br/><br/><br/>
-        Authorized Signatory
-        """
-        story.append(Paragraph(signature_text, terms_style))
-        
-        # Build PDF
-        doc.build(story)
-        
-        # Return PDF URL
-        pdf_url = f'/uploads/{pdf_filename}'
-        return {'pdf_url': pdf_url, 'filename': pdf_filename}, 200
+        render_url = f'{BACKEND_API_BASE}/api/proposals/{proposal_id}/pdf'
+        job = pdf_jobs.submit(key, pdf_filename, pdf_url, render_url, company, headers=backend.auth_headers())
+        job['status_url'] = url_for('get_pdf_job', job_id=job['job_id'])
+        return job, 202
         
     except Exception as e:
         print(f"Error generating PDF: {str(e)}")
@@ -1162,6 +650,54 @@ def generate_proposal_pdf(proposal_id):
         return {'error': str(e)}, 500
 
 
+@app.route('/proposals/pdf-jobs/<job_id>', methods=['GET'])
+@login_required
+def get_pdf_job(job_id):
+    """Status of a PDF job: queued, running, completed (with pdf_url) or failed (with error)"""
+    job = pdf_jobs.get(job_id)
+    if job is None:
+        return {'error': 'PDF job not found'}, 404
+    return job, 200
+
+
+def build_proposal_email(proposal, recipient_email, pdf_filename=None, pdf_path=None):
+    """Email of a proposal (/full response) to recipient_email, with the PDF at pdf_path attached"""
+    msg = MIMEMultipart()
+    msg['From'] = email_outbox.SENDER_EMAIL
+    msg['To'] = recipient_email
+    msg['Subject'] = f"Proposal: {proposal.get('title', 'Your Proposal')}"
+    
+    # Email body
+    client = proposal.get('client')
+    client_name = client.get('client_name', 'Valued Client') if client else 'Valued Client'
+    body = f"""
+Dear {client_name},
+
+Please find attached the proposal for your project: {proposal.get('title', 'N/A')}
+
+Project Details:
+- Project Type: {proposal.get('project_type', 'N/A')}
+- Area: {proposal.get('area', 'N/A')} sq.ft
+- Total Amount: ₹{proposal.get('amount', 0):,.2f}
+
+{proposal.get('description', '')}
+
+If you have any questions, please feel free to contact us.
+
+Best regards,
+Your Company Name
+"""
+    
+    msg.attach(MIMEText(body, 'plain'))
+    
+    if pdf_path:
+        with open(pdf_path, 'rb') as f:
+            pdf_attachment = MIMEApplication(f.read(), _subtype='pdf')
+            pdf_attachment.add_header('Content-Disposition', 'attachment', filename=pdf_filename)
+            msg.attach(pdf_attachment)
+    return msg
+
+
 @app.route('/proposals/<int:proposal_id>/send-email', methods=['POST'])
 @login_required
 def send_proposal_email(proposal_id):
@@ -1176,107 +712,140 @@ def send_proposal_email(proposal_id):
         if not recipient_email:
             return jsonify({'error': 'Email address is required'}), 400
         
-        # Get proposal details
-        api_url = f'{BACKEND_API_BASE}/api/proposals/{proposal_id}'
-        response = requests.get(api_url, timeout=5)
+        # Get proposal details with its client in one call
+        api_url = f'{BACKEND_API_BASE}/api/proposals/{proposal_id}/full'
+        response = backend.get(api_url, timeout=5)
         if response.status_code != 200:
             return jsonify({'error': 'Proposal not found'}), 404
         
         proposal = response.json()
         
-        # Get client details
-        client = None
-        if proposal.get('client_id'):
-            client_url = f'{BACKEND_API_BASE}/api/clients/{proposal["client_id"]}'
-            client_response = requests.get(client_url, timeout=5)
-            if client_response.status_code == 200:
-                client = client_response.json()
-        
-        # Email configuration (you should set these as environment variables)
-        smtp_server = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
-        smtp_port = int(os.environ.get('SMTP_PORT', '587'))
-        sender_email = os.environ.get('SENDER_EMAIL', '')
-        sender_password = os.environ.get('SENDER_PASSWORD', '').replace(' ', '')  # Remove spaces from app password
-        
-        # Check if email is configured
-        if not sender_email or not sender_password:
+        # Check if email is configured (SMTP settings are read by email_outbox)
+        if not email_outbox.is_configured():
             print(f"Email not configured. Would send to: {recipient_email}")
             print(f"Proposal: {proposal.get('title')}")
             print(f"PDF: {pdf_filename}")
             return jsonify({'message': 'Email configuration not set. Email would be sent in production.', 'warning': True}), 200
         
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = recipient_email
-        msg['Subject'] = f"Proposal: {proposal.get('title', 'Your Proposal')}"
+        # Attach PDF if provided: the cached PDF of this proposal version, or
+        # a PDF generated before the cache existed
+        pdf_path = None
+        if pdf_filename:
+            pdf_path = pdf_cache.lookup(proposal_pdf_version(proposal_id, proposal, user)[0])
+            if pdf_path is None:
+                pdf_path = os.path.join(UPLOAD_FOLDER, os.path.basename(pdf_filename))
+            if not os.path.exists(pdf_path):
+                return jsonify({'error': 'PDF file not found'}), 404
         
-        # Email body
-        client_name = client.get('client_name', 'Valued Client') if client else 'Valued Client'
-        body = f"""
-Dear {client_name},
-
-Please find attached the proposal for your project: {proposal.get('title', 'N/A')}
-
-Project Details:
-- Project Type: {proposal.get('project_type', 'N/A')}
-- Area: {proposal.get('area', 'N/A')} sq.ft
-- Total Amount: ₹{proposal.get('amount', 0):,.2f}
-
-{proposal.get('description', '')}
+        msg = build_proposal_email(proposal, recipient_email, pdf_filename, pdf_path)
+        
+        # Sent in the background by the outbox, which keeps the SMTP
+        # connection open and retries temporary failures
+        email_id = email_outbox.enqueue(msg)
+        print(f"Email {email_id} to {recipient_email} queued")
+        return jsonify({
+            'message': 'Email queued for sending',
+            'email_id': email_id,
+            'status_url': url_for('get_email_status', email_id=email_id)
+        }), 202
+        
+    except Exception as e:
+        print(f"Error in send_proposal_email: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
 
-If you have any questions, please feel free to contact us.
 
-Best regards,
-Your Company Name
-"""
-        
-        msg.attach(MIMEText(body, 'plain'))
+@app.route('/proposals/send-emails', methods=['POST'])
+@login_required
+def send_proposal_emails():
+    """
+    Email several proposals, each to its client, with its PDF attached.
+    
+    Takes {"proposal_ids": [...]}. PDFs that are not cached are rendered
+    first, in parallel. Returns 202 with a campaign to poll at status_url for
+    the status of each recipient.
+    """
+    user = session.get('user')
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        proposal_ids = data.get('proposal_ids')
+        if not isinstance(proposal_ids, list) or not proposal_ids:
+            return jsonify({'error': 'proposal_ids must be a non-empty list'}), 400
+        try:
+            # Each proposal is sent once, in the order given
+            proposal_ids = list(dict.fromkeys(int(proposal_id) for proposal_id in proposal_ids))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'proposal_ids must be proposal ids'}), 400
+        
+        if not email_outbox.is_configured():
+            print(f"Email not configured. Would send proposals: {proposal_ids}")
+            return jsonify({'message': 'Email configuration not set. Emails would be sent in production.', 'warning': True}), 200
+        
+        # All proposals with their clients and items, fetched in parallel
+        responses = backend.get_many(
+            *[f'{BACKEND_API_BASE}/api/proposals/{proposal_id}/full' for proposal_id in proposal_ids],
+            timeout=5
+        )
         
-        # Attach PDF if provided
-        if pdf_filename:
-            pdf_path = os.path.join(UPLOAD_FOLDER, pdf_filename)
-            if os.path.exists(pdf_path):
-                with open(pdf_path, 'rb') as f:
-                    pdf_attachment = MIMEApplication(f.read(), _subtype='pdf')
-                    pdf_attachment.add_header('Content-Disposition', 'attachment', filename=pdf_filename)
-                    msg.attach(pdf_attachment)
+        company = user.get('company', {}) if isinstance(user.get('company'), dict) else {}
+        entries = []
+        for proposal_id, response in zip(proposal_ids, responses):
+            entry = {'proposal_id': proposal_id}
+            if isinstance(response, Exception):
+                entry['error'] = f'Could not load proposal: {response}'
+            elif response.status_code != 200:
+                entry['error'] = 'Proposal not found'
             else:
-                return jsonify({'error': 'PDF file not found'}), 404
+                proposal = response.json()
+                entry['recipient'] = (proposal.get('client') or {}).get('email_address')
+                if not entry['recipient']:
+                    entry['error'] = 'Client has no email address'
+                else:
+                    key, pdf_filename, pdf_url = proposal_pdf_version(proposal_id, proposal, user)
+                    entry.update(
+                        proposal=proposal, key=key, filename=pdf_filename, pdf_url=pdf_url, company=company,
+                        render_url=f'{BACKEND_API_BASE}/api/proposals/{proposal_id}/pdf'
+                    )
+            entries.append(entry)
         
-        # Send email
-        try:
-            print(f"Attempting to send email to {recipient_email}")
-            print(f"SMTP Server: {smtp_server}:{smtp_port}")
-            print(f"Sender Email: {sender_email}")
-            
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.set_debuglevel(1)  # Enable debug output
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
-            server.quit()
-            
-            print(f"✓ Email sent successfully to {recipient_email}")
-            return jsonify({'message': 'Email sent successfully'}), 200
-            
-        except smtplib.SMTPAuthenticationError as auth_error:
-            print(f"✗ Authentication failed: {str(auth_error)}")
-            return jsonify({'error': 'Email authentication failed. Check your App Password.'}), 500
-        except smtplib.SMTPException as smtp_error:
-            print(f"✗ SMTP error: {str(smtp_error)}")
-            return jsonify({'error': f'SMTP error: {str(smtp_error)}'}), 500
-        except Exception as email_error:
-            print(f"Error sending email: {str(email_error)}")
-            return jsonify({'error': f'Failed to send email: {str(email_error)}'}), 500
+        campaign = email_campaigns.submit(
+            entries,
+            lambda entry, pdf_path: build_proposal_email(entry['proposal'], entry['recipient'], entry['filename'], pdf_path),
+            headers=backend.auth_headers()
+        )
+        print(f"Campaign {campaign['campaign_id']}: {len(entries)} proposal emails")
+        campaign['status_url'] = url_for('get_email_campaign', campaign_id=campaign['campaign_id'])
+        return jsonify(campaign), 202
         
     except Exception as e:
-        print(f"Error in send_proposal_email: {str(e)}")
+        print(f"Error in send_proposal_emails: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/emails/campaigns/<campaign_id>', methods=['GET'])
+@login_required
+def get_email_campaign(campaign_id):
+    """Status of a bulk send and of each of its recipients"""
+    campaign = email_campaigns.get(campaign_id)
+    if campaign is None:
+        return jsonify({'error': 'Campaign not found'}), 404
+    return jsonify(campaign), 200
+
+
+@app.route('/emails/<int:email_id>', methods=['GET'])
+@login_required
+def get_email_status(email_id):
+    """Status of a queued email: queued, sent or failed (with error)"""
+    email = email_outbox.get(email_id)
+    if email is None:
+        return jsonify({'error': 'Email not found'}), 404
+    return jsonify(email), 200
+
+
 @app.route('/proposals/new', methods=['GET', 'POST'])
 @login_required
 def new_proposal():
@@ -1291,29 +860,33 @@ def new_proposal():
     # Get company_id from user session
     company_id = user.get('company_id') or user.get('company', {}).get('id')
     
-    # Load clients from API
+    # Load clients and project types from API (independent, so in parallel)
     clients = []
     clients_json = '[]'
+    project_types = []
     
     if company_id:
+        clients_response, types_response = backend.get_many(
+            f'{BACKEND_API_BASE}/api/clients/company/{company_id}',
+            f'{BACKEND_API_BASE}/api/boq-items/project-types/{company_id}',
+            timeout=5
+        )
+        
         try:
-            api_url = f'{BACKEND_API_BASE}/api/clients/company/{company_id}'
-            response = requests.get(api_url, timeout=5)
-            if response.status_code == 200:
-                clients = response.json()
+            if isinstance(clients_response, Exception):
+                raise clients_response
+            if clients_response.status_code == 200:
+                clients = clients_response.json()
                 clients_json = json.dumps(clients)
         except Exception as e:
             flash(f'Could not load clients: {str(e)}', 'warning')
             print(f"Error loading clients: {e}")
-    
-    # Load project types from API
-    project_types = []
-    if company_id:
+        
         try:
-            api_url = f'{BACKEND_API_BASE}/api/boq-items/project-types/{company_id}'
-            response = requests.get(api_url, timeout=5)
-            if response.status_code == 200:
-                project_types = response.json()
+            if isinstance(types_response, Exception):
+                raise types_response
+            if types_response.status_code == 200:
+                project_types = types_response.json()
         except Exception as e:
             print(f"Error loading project types: {e}")
             # Fallback to some default types if API fails
@@ -1355,7 +928,7 @@ def new_proposal():
             try:
                 # Check if client already exists
                 check_url = f'{BACKEND_API_BASE}/api/clients/company/{company_id}'
-                check_response = requests.get(check_url, timeout=5)
+                check_response = backend.get(check_url, timeout=5)
                 
                 if check_response.status_code == 200:
                     existing_clients = check_response.json()
@@ -1379,7 +952,7 @@ def new_proposal():
                             'is_active': True
                         }
                         
-                        api_response = requests.post(
+                        api_response = backend.post(
                             f'{BACKEND_API_BASE}/api/clients/',
                             json=client_payload,
                             timeout=5
@@ -1418,55 +991,29 @@ def new_proposal():
                     'project_type': proposal_data['project_type'],
                     'area': proposal_data['area'],
                     'material_preferences': proposal_data['material_preferences'],
-                    'special_requirement': proposal_data['special_requirement']
+                    'special_requirement': proposal_data['special_requirement'],
+                    # BOQ items are created together with the proposal in one request
+                    'items': [
+                        {
+                            'item_name': item.get('item_name', ''),
+                            'description': item.get('description', ''),
+                            'qty': item.get('qty', 0),
+                            'unit_price': item.get('unit_price', 0)
+                        }
+                        for item in boq_items
+                    ]
                 }
                 
-                api_response = requests.post(
+                api_response = backend.post(
                     f'{BACKEND_API_BASE}/api/proposals/',
                     json=proposal_payload,
-                    timeout=5
+                    timeout=10
                 )
                 
                 if api_response.status_code in [200, 201]:
-                    created_proposal = api_response.json()
-                    proposal_id = created_proposal.get('id')
                     flash(f'Proposal "{proposal_data["title"]}" created successfully in database', 'success')
-                    
-                    # Save BOQ items to API if proposal created successfully
-                    if proposal_id and boq_items:
-                        saved_items = 0
-                        failed_items = 0
-                        
-                        for item in boq_items:
-                            try:
-                                item_payload = {
-                                    'item_name': item.get('item_name', ''),
-                                    'description': item.get('description', ''),
-                                    'qty': item.get('qty', 0),
-                                    'unit_price': item.get('unit_price', 0),
-                                    'proposal_id': proposal_id
-                                }
-                                
-                                item_response = requests.post(
-                                    f'{BACKEND_API_BASE}/api/proposal-items/',
-                                    json=item_payload,
-                                    timeout=5
-                                )
-                                
-                                if item_response.status_code in [200, 201]:
-                                    saved_items += 1
-                                else:
-                                    failed_items += 1
-                                    print(f"Failed to save item: {item_response.status_code}")
-                                    
-                            except Exception as item_error:
-                                failed_items += 1
-                                print(f"Error saving BOQ item: {str(item_error)}")
-                        
-                        if saved_items > 0:
-                            flash(f'{saved_items} BOQ item(s) saved successfully', 'success')
-                        if failed_items > 0:
-                            flash(f'{failed_items} BOQ item(s) failed to save', 'warning')
+                    if boq_items:
+                        flash(f'{len(boq_items)} BOQ item(s) saved successfully', 'success')
                     
                 else:
                     error_detail = api_response.json() if api_response.text else {}
@@ -1528,7 +1075,7 @@ def login():
             print(f"API URL: {api_url}")
             print(f"Payload: {payload}")
             
-            response = requests.post(api_url, json=payload, timeout=5)
+            response = backend.post(api_url, json=payload, timeout=5)
             
             print(f"Response Status: {response.status_code}")
             print(f"Response Body: {response.text}")
@@ -1557,6 +1104,8 @@ def login():
                     'username': user_data.get('full_name', email.split('@')[0])
                 }
                 
+                store_tokens(api_data)
+                
                 # Make session permanent
                 session.permanent = True
                 
@@ -1599,6 +1148,7 @@ def login():
 def logout():
     logout_user()
     session.pop('user', None)
+    session.pop('auth', None)
     flash('Logged out successfully', 'info')
     return redirect(url_for('login'))
 
@@ -1628,31 +1178,16 @@ def users():
     if company_id:
         try:
             api_url = f'{BACKEND_API_BASE}/api/proposals/company/{company_id}'
-            response = requests.get(api_url, timeout=5)
+            # The API joins ClientDetails and returns client_name with each proposal
+            response = backend.get(api_url, params={'include_client_name': 'true'}, timeout=5)
             if response.status_code == 200:
                 proposals = response.json()
                 
-                # Load all clients to map client names
-                clients = []
-                try:
-                    clients_url = f'{BACKEND_API_BASE}/api/clients/company/{company_id}'
-                    clients_response = requests.get(clients_url, timeout=5)
-                    if clients_response.status_code == 200:
-                        clients = clients_response.json()
-                except Exception as e:
-                    print(f"Error loading clients: {e}")
-                
-                # Add client names to proposals
                 for proposal in proposals:
-                    client_id = proposal.get('client_id')
-                    if client_id:
-                        client = next((c for c in clients if c['id'] == client_id), None)
-                        if client:
-                            proposal['client_name'] = client.get('client_name', 'Unknown')
-                        else:
-                            proposal['client_name'] = 'Unknown'
-                    else:
+                    if not proposal.get('client_id'):
                         proposal['client_name'] = 'N/A'
+                    elif not proposal.get('client_name'):
+                        proposal['client_name'] = 'Unknown'
                 
                 # Sort by created date (most recent first)
                 proposals = sorted(proposals, key=lambda p: p.get('created_at', ''), reverse=True)
@@ -1725,7 +1260,7 @@ def profile():
                 print(f"Calling PUT {api_url}")
                 print(f"User data: {user_data}")
                 
-                response = requests.put(api_url, json=user_data, timeout=5)
+                response = backend.put(api_url, json=user_data, timeout=5)
                 print(f"User update response: {response.status_code}")
                 
                 if response.status_code == 200:
@@ -1767,7 +1302,7 @@ def profile():
                 print(f"Calling PUT {api_url}")
                 print(f"Company data: {company_data}")
                 
-                response = requests.put(api_url, json=company_data, timeout=5)
+                response = backend.put(api_url, json=company_data, timeout=5)
                 print(f"Company update response: {response.status_code}")
                 
                 if response.status_code == 200:
@@ -1869,7 +1404,7 @@ def boq():
                                 'basic_rate': item['basic_rate'],
                                 'premium_rate': item['premium_rate']
                             }
-                            api_response = requests.post(
+                            api_response = backend.post(
                                 f'{BACKEND_API_BASE}/api/boq-items/',
                                 json=api_payload,
                                 timeout=5
@@ -1968,7 +1503,7 @@ def boq():
                             'basic_rate': item['basic_rate'],
                             'premium_rate': item['premium_rate']
                         }
-                        api_response = requests.post(
+                        api_response = backend.post(
                             f'{BACKEND_API_BASE}/api/boq-items/',
                             json=api_payload,
                             timeout=5
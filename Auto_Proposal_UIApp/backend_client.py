@@ -0,0 +1,168 @@
+"""
+Shared HTTP client for the backend API (BACKEND_API_BASE).
+
+All backend calls go through one requests.Session, so connections are kept
+alive and reused instead of opening a new TCP connection per call. Settings
+(environment variables):
+
+- BACKEND_POOL_SIZE (default 10): connections kept open per backend host;
+  size it to the number of request threads
+- BACKEND_RETRIES (default 2): retries with exponential backoff
+  (BACKEND_RETRY_BACKOFF, default 0.2 s) on connection errors, and on 502/503/504
+  for idempotent methods (GET, PUT, DELETE); a POST is never resent once sent
+- BACKEND_TIMEOUT (default 5 s): used when a call does not pass timeout=
+- BACKEND_SLOW_MS (default 1000): calls slower than this are logged as warnings;
+  every call is logged at DEBUG level with its status and latency
+
+get() is a conditional GET: responses with an ETag are kept in an LRU of
+BACKEND_CACHE_SIZE entries (default 256) and revalidated with If-None-Match,
+so a 304 Not Modified is answered from the cached response.
+
+get_many() runs independent GETs in parallel on BACKEND_FANOUT_WORKERS threads
+(default 8), so a page that needs several of them waits for the slowest
+call rather than for their sum.
+
+Calls carry the bearer token returned by token_provider (set by the app to the
+logged-in user's access token) unless they pass their own Authorization
+header. Code running outside the request thread takes auth_headers() along.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.environ.get('BACKEND_POOL_SIZE', '10'))
+RETRIES = int(os.environ.get('BACKEND_RETRIES', '2'))
+RETRY_BACKOFF = float(os.environ.get('BACKEND_RETRY_BACKOFF', '0.2'))
+TIMEOUT = float(os.environ.get('BACKEND_TIMEOUT', '5'))
+SLOW_MS = float(os.environ.get('BACKEND_SLOW_MS', '1000'))
+CACHE_SIZE = int(os.environ.get('BACKEND_CACHE_SIZE', '256'))
+FANOUT_WORKERS = int(os.environ.get('BACKEND_FANOUT_WORKERS', '8'))
+
+
+def create_session(pool_size=POOL_SIZE, retries=RETRIES):
+    retry = Retry(
+        total=retries,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS']),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+session = create_session()
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+_fanout = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='backend-fanout')
+
+# Callable returning the access token for the current request, or None
+token_provider = None
+
+
+def auth_headers(headers=None):
+    """headers plus the Authorization header of the current user (if any and not already set)."""
+    headers = dict(headers or {})
+    if 'Authorization' not in headers and token_provider is not None:
+        token = token_provider()
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+    return headers
+
+
+def request(method, url, **kwargs):
+    """session.request() with the default timeout and latency logging."""
+    kwargs.setdefault('timeout', TIMEOUT)
+    kwargs['headers'] = auth_headers(kwargs.get('headers'))
+    started = time.perf_counter()
+    try:
+        response = session.request(method, url, **kwargs)
+    except requests.exceptions.RequestException as e:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.warning('%s %s failed after %.0f ms: %s', method, url, elapsed_ms, e)
+        raise
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    level = logging.WARNING if elapsed_ms >= SLOW_MS else logging.DEBUG
+    logger.log(level, '%s %s -> %s in %.0f ms', method, url, response.status_code, elapsed_ms)
+    return response
+
+
+def get(url, params=None, **kwargs):
+    """
+    GET a backend resource, revalidating a cached copy with If-None-Match.
+
+    A 304 Not Modified is answered from the cached 200 response, so unchanged
+    lists and records are not downloaded and parsed again.
+    """
+    headers = auth_headers(kwargs.pop('headers', None))
+    key = (url, tuple(sorted((params or {}).items())), headers.get('Authorization'))
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        headers['If-None-Match'] = cached.headers['ETag']
+
+    response = request('GET', url, params=params, headers=headers, **kwargs)
+
+    if response.status_code == 304 and cached is not None:
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+        return cached
+    if response.status_code == 200 and response.headers.get('ETag'):
+        with _cache_lock:
+            _cache[key] = response
+            _cache.move_to_end(key)
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return response
+
+
+def get_many(*calls, **kwargs):
+    """
+    get() several independent URLs in parallel.
+    
+    Each call is a URL or a (url, params) tuple; kwargs (e.g. timeout) apply
+    to all of them. Returns the responses in call order; a call that raised
+    has its exception in its place, so one failed fetch does not hide the
+    others.
+    """
+    def fetch(call):
+        url, params = call if isinstance(call, tuple) else (call, None)
+        return get(url, params=params, **kwargs)
+
+    # The token is looked up here, in the request thread
+    kwargs['headers'] = auth_headers(kwargs.get('headers'))
+    futures = [_fanout.submit(fetch, call) for call in calls]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('DELETE', url, **kwargs)
@@ -0,0 +1,114 @@
+"""
+Benchmark: page render time with a new connection per backend call vs the
+shared keep-alive session of backend_client.
+
+Starts a stub backend on localhost that answers the calls the proposal view
+makes, points BACKEND_API_BASE at it and renders /proposals/view/1 through
+Flask's test client --requests times in each mode.
+
+--connect-delay-ms delays every new backend connection, to model the TCP/TLS
+handshake to a backend that is not on the same host.
+
+    python bench_backend_client.py --requests 500 --connect-delay-ms 5
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+PROPOSAL = {
+    "id": 1, "proposal_id": "P-1", "company_id": 1, "client_id": 1, "title": "Benchmark proposal",
+    "client": {"id": 1, "client_name": "Stub Client"},
+    "items": [{"id": i, "description": f"Item {i}", "quantity": 1, "rate": 10.0} for i in range(50)],
+    "project_types": ["Home", "Office"],
+    "clients": [{"id": i, "client_name": f"Client {i}"} for i in range(100)],
+}
+
+
+class StubBackend(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; without this, Nagle + delayed ACK
+    # stall every response on a kept-alive connection by ~40 ms
+    disable_nagle_algorithm = True
+    connect_delay = 0.0
+
+    def setup(self):
+        time.sleep(self.connect_delay)
+        super().setup()
+
+    def do_GET(self):
+        body = json.dumps(PROPOSAL).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ConnectionPerCall:
+    """The previous behaviour: module-level requests calls, one connection each."""
+
+    def request(self, method, url, **kwargs):
+        return requests.request(method, url, **kwargs)
+
+
+def render_times(client, count):
+    times = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = client.get("/proposals/view/1")
+        times.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.status_code
+    return times
+
+
+def report(label, times):
+    times = sorted(times)
+    print(f"{label:<22} mean {statistics.mean(times):7.2f} ms   "
+          f"p50 {times[len(times) // 2]:7.2f} ms   p95 {times[int(len(times) * 0.95)]:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pooled backend client")
+    parser.add_argument("--requests", type=int, default=300, help="Page renders per mode")
+    parser.add_argument("--connect-delay-ms", type=float, default=0.0, help="Delay per new backend connection")
+    args = parser.parse_args()
+
+    StubBackend.connect_delay = args.connect_delay_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubBackend)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["BACKEND_API_BASE"] = f"http://127.0.0.1:{server.server_port}"
+
+    import app as ui
+    import backend_client
+
+    ui.app.config["TESTING"] = True
+    client = ui.app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = {"user_id": 1, "email": "bench@example.com", "company_id": 1}
+        session["_user_id"] = "1"
+
+    pooled = backend_client.session
+    results = {}
+    for label, session in (("connection per call", ConnectionPerCall()), ("keep-alive session", pooled)):
+        backend_client.session = session
+        render_times(client, 10)
+        results[label] = render_times(client, args.requests)
+    backend_client.session = pooled
+
+    print(f"{args.requests} renders of /proposals/view/1, connect delay {args.connect_delay_ms} ms")
+    for label, times in results.items():
+        report(label, times)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark: emailing --proposals proposals one send-email click at a time vs
+one bulk send (email_campaigns).
+
+Starts a stub backend whose PDF render takes --render-delay-ms and a local
+SMTP server (aiosmtpd, pip install aiosmtpd) whose handshake takes
+--handshake-delay-ms per connection and whose DATA takes --data-delay-ms per
+message. None of the PDFs are cached at the start of either run.
+
+One at a time: render the PDF, build the message, connect and send, then the
+next proposal. Bulk: email_campaigns.submit() with all proposals, until every
+recipient is sent.
+
+    python bench_email_campaign.py --proposals 30 --render-delay-ms 300
+"""
+import argparse
+import asyncio
+import os
+import smtplib
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aiosmtpd.controller import Controller
+
+from bench_email_outbox import CountingHandler
+
+
+class SlowDataHandler(CountingHandler):
+    data_delay = 0.0
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.data_delay)
+        return await super().handle_DATA(server, session, envelope)
+
+
+class StubRenderer(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    render_delay = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.render_delay)
+        body = b"%PDF-1.4\n" + os.urandom(50 * 1024)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_entries(run, count, backend_base):
+    import pdf_cache
+    entries = []
+    for i in range(count):
+        proposal = {"id": i, "title": f"Bench {run} {i}", "amount": 1000.0 * i,
+                    "client": {"client_name": f"Client {i}", "email_address": f"client{i}@example.com"}}
+        entries.append({
+            "proposal_id": i, "recipient": f"client{i}@example.com", "proposal": proposal,
+            "key": pdf_cache.version_key(proposal, {}), "filename": f"Bench_{i}.pdf", "pdf_url": None,
+            "render_url": f"{backend_base}/api/proposals/{i}/pdf", "company": {},
+        })
+    return entries
+
+
+def build_message(entry, pdf_path):
+    import app as ui
+    return ui.build_proposal_email(entry["proposal"], entry["recipient"], entry["filename"], pdf_path)
+
+
+def one_at_a_time(entries, port):
+    """A send-email click per proposal: render, build, connect and send."""
+    import pdf_cache
+    import pdf_jobs
+    for entry in entries:
+        job = pdf_jobs.submit(entry["key"], entry["filename"], entry["pdf_url"], entry["render_url"], entry["company"])
+        assert pdf_jobs.wait(job["job_id"])["status"] == "completed"
+        msg = build_message(entry, pdf_cache.lookup(entry["key"]))
+        server = smtplib.SMTP("127.0.0.1", port)
+        server.send_message(msg)
+        server.quit()
+
+
+def bulk(entries):
+    import email_campaigns
+    campaign = email_campaigns.submit(entries, build_message)
+    while campaign["status"] != "completed":
+        time.sleep(0.01)
+        campaign = email_campaigns.get(campaign["campaign_id"])
+    assert campaign["counts"] == {"sent": len(entries)}, campaign["counts"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk proposal emails")
+    parser.add_argument("--proposals", type=int, default=30)
+    parser.add_argument("--render-delay-ms", type=float, default=300.0)
+    parser.add_argument("--handshake-delay-ms", type=float, default=100.0)
+    parser.add_argument("--data-delay-ms", type=float, default=50.0)
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("PDF_CACHE_DIR", os.path.join(workdir, "pdf_cache"))
+    os.environ.setdefault("OUTBOX_DB", os.path.join(workdir, "outbox.db"))
+    os.environ.setdefault("PDF_JOBS_DB", os.path.join(workdir, "pdf_jobs.db"))
+    os.environ.setdefault("CAMPAIGN_DB", os.path.join(workdir, "campaigns.db"))
+
+    StubRenderer.render_delay = args.render_delay_ms / 1000
+    backend = ThreadingHTTPServer(("127.0.0.1", 0), StubRenderer)
+    threading.Thread(target=backend.serve_forever, daemon=True).start()
+    backend_base = f"http://127.0.0.1:{backend.server_port}"
+
+    import email_outbox
+    email_outbox.SMTP_SERVER, email_outbox.SMTP_PORT = "127.0.0.1", args.port
+    email_outbox.SENDER_EMAIL, email_outbox.SENDER_PASSWORD = "bench@example.com", ""
+    email_outbox.SMTP_STARTTLS = False
+
+    SlowDataHandler.handshake_delay = args.handshake_delay_ms / 1000
+    SlowDataHandler.data_delay = args.data_delay_ms / 1000
+    handler = SlowDataHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=args.port)
+    controller.start()
+
+    print(f"{args.proposals} proposals, render {args.render_delay_ms} ms, "
+          f"handshake {args.handshake_delay_ms} ms, DATA {args.data_delay_ms} ms")
+    for run, label in ((1, "one at a time"), (2, "bulk")):
+        handler.received = handler.connections = 0
+        entries = make_entries(run, args.proposals, backend_base)
+        started = time.perf_counter()
+        if run == 1:
+            one_at_a_time(entries, args.port)
+        else:
+            bulk(entries)
+        elapsed = time.perf_counter() - started
+        assert handler.received == args.proposals
+        print(f"{label:<15} all sent after {elapsed:6.2f} s   {handler.connections} SMTP connections")
+
+    controller.stop()
+    backend.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark: sending proposal emails in the request (a new SMTP connection per
+email) vs queuing them in email_outbox.
+
+Starts a local SMTP server (aiosmtpd, pip install aiosmtpd) that accepts and
+counts messages. --handshake-delay-ms delays the EHLO of every new connection,
+to model the connect/STARTTLS/login round trips to a real mail server. Reports
+how long the request waits per email, and how long until all emails are sent.
+
+    python bench_email_outbox.py --emails 100 --handshake-delay-ms 200
+"""
+import argparse
+import asyncio
+import os
+import smtplib
+import tempfile
+import time
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from aiosmtpd.controller import Controller
+
+
+class CountingHandler:
+    handshake_delay = 0.0
+
+    def __init__(self):
+        self.received = 0
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        await asyncio.sleep(self.handshake_delay)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 OK'
+
+
+def make_message(i):
+    msg = MIMEMultipart()
+    msg['From'] = 'bench@example.com'
+    msg['To'] = f'client{i}@example.com'
+    msg['Subject'] = f'Proposal: Bench {i}'
+    msg.attach(MIMEText(f'Dear Client {i},\n\nPlease find attached the proposal.', 'plain'))
+    msg.attach(MIMEApplication(os.urandom(50 * 1024), _subtype='pdf'))
+    return msg
+
+
+def send_per_connection(port, msg):
+    """The previous route: connect, send and quit inside the request."""
+    server = smtplib.SMTP('127.0.0.1', port)
+    server.send_message(msg)
+    server.quit()
+
+
+def report(label, waits, total):
+    waits = sorted(waits)
+    print(f"{label:<22} request p50 {waits[len(waits) // 2] * 1000:8.2f} ms   "
+          f"p95 {waits[int(len(waits) * 0.95)] * 1000:8.2f} ms   all sent after {total:6.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the email outbox")
+    parser.add_argument("--emails", type=int, default=50)
+    parser.add_argument("--handshake-delay-ms", type=float, default=100.0)
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    os.environ.setdefault('OUTBOX_DB', os.path.join(tempfile.mkdtemp(), 'outbox.db'))
+    import email_outbox
+    email_outbox.SMTP_SERVER, email_outbox.SMTP_PORT = '127.0.0.1', args.port
+    email_outbox.SENDER_EMAIL, email_outbox.SENDER_PASSWORD = 'bench@example.com', ''
+    email_outbox.SMTP_STARTTLS = False
+
+    CountingHandler.handshake_delay = args.handshake_delay_ms / 1000
+    handler = CountingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=args.port)
+    controller.start()
+    messages = [make_message(i) for i in range(args.emails)]
+
+    print(f"{args.emails} emails, handshake delay {args.handshake_delay_ms} ms")
+
+    waits = []
+    started = time.perf_counter()
+    for msg in messages:
+        t = time.perf_counter()
+        send_per_connection(args.port, msg)
+        waits.append(time.perf_counter() - t)
+    report("connection per email", waits, time.perf_counter() - started)
+    print(f"{'':<22} {handler.connections} SMTP connections")
+
+    handler.received = handler.connections = 0
+    waits = []
+    started = time.perf_counter()
+    ids = []
+    for msg in messages:
+        t = time.perf_counter()
+        ids.append(email_outbox.enqueue(msg))
+        waits.append(time.perf_counter() - t)
+    while any(email['status'] not in ('sent', 'failed') for email in email_outbox.get_many(ids).values()):
+        time.sleep(0.005)
+    report("outbox", waits, time.perf_counter() - started)
+    print(f"{'':<22} {handler.connections} SMTP connections")
+    assert handler.received == args.emails
+    assert all(email_outbox.get(email_id)['status'] == 'sent' for email_id in ids)
+
+    controller.stop()
+
+
+if __name__ == "__main__":
+    main()
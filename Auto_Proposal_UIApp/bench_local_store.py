@@ -0,0 +1,150 @@
+"""
+Benchmark: the JSON-file BOQ store used before vs local_store (SQLite), with
+--entries BOQ items already stored.
+
+Times save, update and delete of one item (--ops times each) and loading all
+items, then has --threads threads save --ops items each at the same time and
+counts the saves that failed and the items that were lost or got a
+duplicate id.
+
+    python bench_local_store.py --entries 100000 --ops 20
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+
+def make_item(i):
+    return {
+        's_no': str(i), 'project_type': 'Office', 'title': f'Item {i}',
+        'description': 'Providing and fixing suspended false ceiling with GI channels and gypsum boards, finished flush.',
+        'unit': 'sft', 'basic_rate': 80.0, 'premium_rate': 100.0, 'created_at': '2025-11-18T10:41:46',
+    }
+
+
+class JsonStore:
+    """The previous functions: every call reads and rewrites the whole file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _write(self, items):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(items, f, indent=2)
+
+    def save(self, item):
+        items = self.load()
+        item['id'] = (max([i.get('id', 0) for i in items]) + 1) if items else 1
+        items.append(item)
+        self._write(items)
+
+    def update(self, item_id, updated_item):
+        items = self.load()
+        for i, item in enumerate(items):
+            if item.get('id') == item_id:
+                updated_item['id'] = item_id
+                items[i] = updated_item
+                break
+        self._write(items)
+
+    def delete(self, item_id):
+        self._write([item for item in self.load() if item.get('id') != item_id])
+
+
+class SqliteStore:
+    def __init__(self, store):
+        self.store = store
+
+    def load(self):
+        return self.store.records('boq_items')
+
+    def save(self, item):
+        self.store.insert('boq_items', item)
+
+    def update(self, item_id, updated_item):
+        self.store.replace('boq_items', item_id, updated_item)
+
+    def delete(self, item_id):
+        self.store.delete('boq_items', item_id)
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - started) * 1000
+
+
+def concurrent_saves(store, threads, per_thread):
+    """Save from several threads at once; returns (failed saves, lost items, duplicate ids)."""
+    before = len(store.load())
+    failed = []
+
+    def save_items():
+        for _ in range(per_thread):
+            try:
+                store.save(make_item(-1))
+            except ValueError:
+                # The JSON store read a file another thread was writing
+                failed.append(1)
+
+    workers = [threading.Thread(target=save_items) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    items = store.load()
+    ids = [item['id'] for item in items]
+    saved = threads * per_thread - len(failed)
+    return len(failed), before + saved - len(items), len(ids) - len(set(ids))
+
+
+def run(label, store, ops, threads):
+    save = [timed(store.save, make_item(i)) for i in range(ops)]
+    ids = [item['id'] for item in store.load()[-ops:]]
+    update = [timed(store.update, item_id, make_item(item_id)) for item_id in ids]
+    delete = [timed(store.delete, item_id) for item_id in ids]
+    load = [timed(store.load) for _ in range(3)]
+    failed, lost, duplicates = concurrent_saves(store, threads, ops)
+    print(f"{label:<6} save {statistics.median(save):9.2f} ms   update {statistics.median(update):9.2f} ms   "
+          f"delete {statistics.median(delete):9.2f} ms   load all {statistics.median(load):8.1f} ms   "
+          f"concurrent: {failed} failed, {lost} lost, {duplicates} duplicate ids")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local store")
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--ops", type=int, default=20, help="Operations of each kind, and saves per thread")
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    items = [dict(make_item(i), id=i) for i in range(1, args.entries + 1)]
+    json_path = os.path.join(workdir, 'boq_items.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(items, f, indent=2)
+
+    # The store imports the JSON file when it is created, as the migration does
+    os.environ['LOCAL_STORE_DB'] = os.path.join(workdir, 'store.db')
+    import local_store
+    local_store.FORMS_JSON, local_store.BOQ_JSON = os.path.join(workdir, 'forms.json'), json_path
+    started = time.perf_counter()
+    assert len(local_store.records('boq_items')) == args.entries
+    print(f"{args.entries} BOQ items, imported into SQLite in {time.perf_counter() - started:.1f} s")
+
+    run("json", JsonStore(json_path), args.ops, args.threads)
+    run("sqlite", SqliteStore(local_store), args.ops, args.threads)
+
+
+if __name__ == "__main__":
+    main()
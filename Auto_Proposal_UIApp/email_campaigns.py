@@ -0,0 +1,206 @@
+"""
+Bulk sending of proposal emails (campaigns).
+
+submit() takes one entry per proposal and returns at once. Renders of the
+PDFs that are not in the PDF cache are queued with pdf_jobs right away, so
+they run in parallel (PDF_WORKERS at a time). Then, on CAMPAIGN_WORKERS
+background threads (default 4), each entry waits for its PDF, its message is
+built and queued in email_outbox, whose pool of SMTP connections sends it.
+
+get() reports the status of every recipient: preparing, then the outbox
+status (queued, sending, sent or failed), or failed with the error that
+stopped the email from being queued. Campaigns are kept in SQLite
+(CAMPAIGN_DB, default uploads/campaigns.db), so any of the app's processes
+can report them, for CAMPAIGN_RETENTION_SECONDS (default 3600); queued
+emails are sent even after their campaign is gone. A recipient still
+preparing after CAMPAIGN_STALE_SECONDS (default 1800) was left by a process
+that stopped and is reported failed.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import email_outbox
+import pdf_cache
+import pdf_jobs
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('CAMPAIGN_WORKERS', '4'))
+RETENTION_SECONDS = int(os.environ.get('CAMPAIGN_RETENTION_SECONDS', '3600'))
+STALE_SECONDS = float(os.environ.get('CAMPAIGN_STALE_SECONDS', '1800'))
+DB_PATH = os.environ.get('CAMPAIGN_DB', os.path.join(os.path.dirname(__file__), 'uploads', 'campaigns.db'))
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS campaigns (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_campaigns_created ON campaigns (created_at);
+CREATE TABLE IF NOT EXISTS campaign_recipients (
+    campaign_id TEXT NOT NULL REFERENCES campaigns (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    proposal_id INTEGER,
+    recipient TEXT,
+    status TEXT NOT NULL,
+    email_id INTEGER,
+    error TEXT,
+    PRIMARY KEY (campaign_id, position)
+);
+'''
+
+_executor = None
+_executor_lock = threading.Lock()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='email-campaign')
+        return _executor
+
+
+@contextmanager
+def _db():
+    """A connection to the campaign tables, committed and closed on exit."""
+    global _initialized
+    with _init_lock:
+        if not _initialized:
+            os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+            db = sqlite3.connect(DB_PATH, timeout=30)
+            try:
+                db.execute('PRAGMA journal_mode=WAL')
+                db.executescript(_SCHEMA)
+            finally:
+                db.close()
+            _initialized = True
+    db = sqlite3.connect(DB_PATH, timeout=30)
+    db.row_factory = sqlite3.Row
+    db.execute('PRAGMA foreign_keys=ON')
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def get(campaign_id):
+    """The campaign with the status of each recipient, or None if it does not exist (or has expired)."""
+    with _db() as db:
+        campaign = db.execute('SELECT created_at FROM campaigns WHERE id = ?', (campaign_id,)).fetchone()
+        if campaign is None:
+            return None
+        rows = db.execute(
+            'SELECT proposal_id, recipient, status, email_id, error FROM campaign_recipients '
+            'WHERE campaign_id = ? ORDER BY position',
+            (campaign_id,)
+        ).fetchall()
+    created_at = campaign['created_at']
+    recipients = [dict(row, sent_at=None) for row in rows]
+    if created_at < time.time() - STALE_SECONDS:
+        for recipient in recipients:
+            if recipient['status'] == 'preparing':
+                recipient.update(status='failed', error='Abandoned: the process preparing it stopped')
+
+    emails = email_outbox.get_many(r['email_id'] for r in recipients if r['email_id'] is not None)
+    for recipient in recipients:
+        email = emails.get(recipient['email_id'])
+        if email is not None:
+            recipient.update(status=email['status'], error=email['error'], sent_at=email['sent_at'])
+
+    counts = Counter(recipient['status'] for recipient in recipients)
+    done = counts['sent'] + counts['failed']
+    return {
+        'campaign_id': campaign_id,
+        'status': 'completed' if done == len(recipients) else 'running',
+        'counts': dict(counts),
+        'recipients': recipients,
+        'created_at': created_at,
+    }
+
+
+def submit(entries, build_message, headers=None):
+    """
+    Queue the emails of a campaign; returns the campaign as get() does.
+
+    Each entry is a dict with proposal_id and recipient, plus either error
+    (reported as failed, nothing is sent) or the proposal and its PDF cache
+    key, filename, pdf_url, render_url and company (as for pdf_jobs.submit).
+    build_message(entry, pdf_path) returns the email.message.Message to send;
+    it runs on a background thread.
+    """
+    campaign_id = uuid.uuid4().hex
+    recipients = []
+    pending = []
+    for entry in entries:
+        recipient = {
+            'proposal_id': entry['proposal_id'],
+            'recipient': entry.get('recipient'),
+            'status': 'preparing',
+            'email_id': None,
+            'error': None,
+            'sent_at': None,
+        }
+        if entry.get('error'):
+            recipient.update(status='failed', error=entry['error'])
+        else:
+            # Missing PDFs are all queued now, so they render in parallel
+            job_id = None
+            if pdf_cache.lookup(entry['key']) is None:
+                job_id = pdf_jobs.submit(entry['key'], entry['filename'], entry['pdf_url'], entry['render_url'],
+                                         entry['company'], headers=headers)['job_id']
+            pending.append((len(recipients), entry, job_id))
+        recipients.append(recipient)
+
+    now = time.time()
+    with _db() as db:
+        db.execute('DELETE FROM campaigns WHERE created_at < ?', (now - RETENTION_SECONDS,))
+        db.execute('INSERT INTO campaigns (id, created_at) VALUES (?, ?)', (campaign_id, now))
+        db.executemany(
+            'INSERT INTO campaign_recipients (campaign_id, position, proposal_id, recipient, status, error) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(campaign_id, position, r['proposal_id'], r['recipient'], r['status'], r['error'])
+             for position, r in enumerate(recipients)]
+        )
+
+    executor = _get_executor()
+    for position, entry, job_id in pending:
+        executor.submit(_prepare, (campaign_id, position), entry, job_id, build_message)
+    return get(campaign_id)
+
+
+def _update(recipient, **values):
+    """Set the columns of a recipient, given as (campaign id, position)."""
+    with _db() as db:
+        db.execute(
+            f"UPDATE campaign_recipients SET {', '.join(f'{name} = ?' for name in values)} "
+            'WHERE campaign_id = ? AND position = ?',
+            (*values.values(), *recipient)
+        )
+
+
+def _prepare(recipient, entry, job_id, build_message):
+    """Wait for the PDF of an entry, then build its message and queue it."""
+    try:
+        if job_id is not None:
+            job = pdf_jobs.wait(job_id)
+            if job is None or job['status'] != 'completed':
+                raise RuntimeError(f"PDF could not be rendered: {job['error'] if job else 'job expired'}")
+        pdf_path = pdf_cache.lookup(entry['key'])
+        if pdf_path is None:
+            raise RuntimeError('PDF file not found')
+        email_id = email_outbox.enqueue(build_message(entry, pdf_path))
+    except Exception as e:
+        logger.error('Email of proposal %s to %s not queued: %s', entry['proposal_id'], entry['recipient'], e)
+        _update(recipient, status='failed', error=str(e))
+    else:
+        _update(recipient, status='queued', email_id=email_id)
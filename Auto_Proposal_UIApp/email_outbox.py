@@ -0,0 +1,334 @@
+"""
+Outbox for emails sent by the app.
+
+enqueue() stores the complete message in a SQLite queue (OUTBOX_DB, default
+uploads/outbox.db) and returns at once; background threads send it. Each of
+the OUTBOX_CONNECTIONS threads (default 3) keeps its own authenticated SMTP
+connection open between messages (closed after SMTP_IDLE_SECONDS, default 60,
+without mail) and sends queued messages over it in batches of up to
+OUTBOX_BATCH_SIZE (default 20); a burst of messages is split between them.
+
+A message whose send fails temporarily (connection errors, 4xx replies) is
+retried after OUTBOX_RETRY_SECONDS (default 30), doubling per attempt, up to
+OUTBOX_MAX_ATTEMPTS (default 5). A permanent rejection (5xx) fails it
+at once.
+
+A sender thread claims its batch by marking it sending with its owner name and
+claimed_at. Other threads and processes sharing the queue leave a claim alone
+for OUTBOX_LEASE_SECONDS (default: twice BATCH_SIZE * SMTP_TIMEOUT, the
+longest a batch can take); only an older claim, left by a process that
+stopped mid-batch, is taken over and sent again.
+
+SMTP settings: SMTP_SERVER, SMTP_PORT, SENDER_EMAIL, SENDER_PASSWORD,
+SMTP_STARTTLS (default true), SMTP_TIMEOUT (default 30 s).
+
+Status of a message goes queued -> sent | failed.
+"""
+import logging
+import os
+import smtplib
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from email import message_from_bytes
+from email.utils import getaddresses
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.environ.get('OUTBOX_DB', os.path.join(os.path.dirname(__file__), 'uploads', 'outbox.db'))
+BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '20'))
+CONNECTIONS = max(1, int(os.environ.get('OUTBOX_CONNECTIONS', '3')))
+MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '5'))
+RETRY_SECONDS = float(os.environ.get('OUTBOX_RETRY_SECONDS', '30'))
+
+SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
+SENDER_EMAIL = os.environ.get('SENDER_EMAIL', '')
+SENDER_PASSWORD = os.environ.get('SENDER_PASSWORD', '').replace(' ', '')  # Remove spaces from app password
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', 'true').lower() == 'true'
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', '30'))
+SMTP_IDLE_SECONDS = float(os.environ.get('SMTP_IDLE_SECONDS', '60'))
+LEASE_SECONDS = float(os.environ.get('OUTBOX_LEASE_SECONDS', str(2 * BATCH_SIZE * SMTP_TIMEOUT)))
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    subject TEXT,
+    message BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    claimed_by TEXT,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_outbox_due ON outbox (status, next_attempt_at, id);
+'''
+
+# Queued and due, or claimed by a sender whose lease ran out
+_DUE = ("(status = 'queued' AND next_attempt_at <= :now) "
+        "OR (status = 'sending' AND (claimed_at IS NULL OR claimed_at <= :stale))")
+
+_wake = threading.Event()
+_stop = threading.Event()
+_start_lock = threading.Lock()
+_workers = []
+
+
+def is_configured():
+    return bool(SENDER_EMAIL and SENDER_PASSWORD)
+
+
+@contextmanager
+def _db():
+    """A connection to the queue, committed and closed on exit."""
+    db = sqlite3.connect(DB_PATH, timeout=30)
+    db.row_factory = sqlite3.Row
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def _init_db():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    with _db() as db:
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(_SCHEMA)
+        columns = {row['name'] for row in db.execute('PRAGMA table_info(outbox)')}
+        # Queues created before claims had an owner and a lease
+        for column, definition in (('claimed_by', 'TEXT'), ('claimed_at', 'REAL')):
+            if column not in columns:
+                db.execute(f'ALTER TABLE outbox ADD COLUMN {column} {definition}')
+
+
+def start():
+    """Start the sender threads (once); enqueue() calls this too."""
+    with _start_lock:
+        if not _workers:
+            _init_db()
+            _stop.clear()
+        for i in range(CONNECTIONS):
+            if i == len(_workers):
+                _workers.append(None)
+            if _workers[i] is None or not _workers[i].is_alive():
+                _workers[i] = threading.Thread(target=_run, name=f'email-outbox-{i}', daemon=True)
+                _workers[i].start()
+
+
+def stop(timeout=None):
+    """Stop the sender threads after their current batch; start() restarts them."""
+    with _start_lock:
+        _stop.set()
+        _wake.set()
+        for worker in _workers:
+            if worker is not None:
+                worker.join(timeout)
+        _workers.clear()
+
+
+def enqueue(msg):
+    """Queue an email.message.Message for sending; returns its outbox id."""
+    # Stored as sent on the wire: SMTP needs CRLF line endings and sendmail() does not convert bytes
+    start()
+    now = time.time()
+    with _db() as db:
+        email_id = db.execute(
+            'INSERT INTO outbox (recipient, subject, message, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)',
+            (msg['To'], msg['Subject'], msg.as_bytes(policy=msg.policy.clone(linesep='\r\n')), now, now)
+        ).lastrowid
+    _wake.set()
+    return email_id
+
+
+def get(email_id):
+    """Status of a queued email as a dict, or None if it does not exist."""
+    with _db() as db:
+        row = db.execute(
+            'SELECT id, recipient, subject, status, attempts, error, created_at, sent_at FROM outbox WHERE id = ?',
+            (email_id,)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def get_many(email_ids):
+    """Status of several queued emails, as {id: dict}; ids that do not exist are left out."""
+    email_ids = list(email_ids)
+    statuses = {}
+    with _db() as db:
+        # Bounded number of parameters per query
+        for i in range(0, len(email_ids), 500):
+            chunk = email_ids[i:i + 500]
+            rows = db.execute(
+                'SELECT id, recipient, subject, status, attempts, error, created_at, sent_at FROM outbox '
+                f'WHERE id IN ({", ".join("?" * len(chunk))})',
+                chunk
+            ).fetchall()
+            statuses.update((row['id'], dict(row)) for row in rows)
+    return statuses
+
+
+def _owner():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'
+
+
+def _claim_batch():
+    """Claim a share of the due messages (up to BATCH_SIZE) for this thread and return them."""
+    owner = _owner()
+    with _db() as db:
+        # Taken before reading, so two sender threads never claim the same message
+        db.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        window = {'now': now, 'stale': now - LEASE_SECONDS}
+        due = db.execute(f'SELECT COUNT(*) FROM outbox WHERE {_DUE}', window).fetchone()[0]
+        # Split between the connections, so a burst is sent over all of them
+        limit = max(1, min(BATCH_SIZE, -(-due // CONNECTIONS)))
+        rows = db.execute(
+            f'SELECT id, message, attempts FROM outbox WHERE {_DUE} ORDER BY next_attempt_at, id LIMIT :limit',
+            {**window, 'limit': limit}
+        ).fetchall()
+        db.executemany(
+            "UPDATE outbox SET status = 'sending', claimed_by = ?, claimed_at = ? WHERE id = ?",
+            [(owner, now, row['id']) for row in rows]
+        )
+    if due > len(rows):
+        # Wake the other sender threads for the rest
+        _wake.set()
+    return rows
+
+
+def _next_due():
+    """When the next message becomes due: its retry time, or when a claim on it expires."""
+    with _db() as db:
+        row = db.execute(
+            "SELECT MIN(CASE WHEN status = 'queued' THEN next_attempt_at ELSE COALESCE(claimed_at, 0) + ? END) "
+            "FROM outbox WHERE status IN ('queued', 'sending')",
+            (LEASE_SECONDS,)
+        ).fetchone()
+    return row[0]
+
+
+# A sender only settles messages it still holds the claim on
+_CLAIMED = "id = ? AND status = 'sending' AND claimed_by = ?"
+
+
+def _mark_sent(email_id):
+    with _db() as db:
+        db.execute(f"UPDATE outbox SET status = 'sent', error = NULL, sent_at = ?, claimed_by = NULL WHERE {_CLAIMED}",
+                   (time.time(), email_id, _owner()))
+
+
+def _mark_failed(email_id, attempts, error, permanent):
+    attempts += 1
+    with _db() as db:
+        if permanent or attempts >= MAX_ATTEMPTS:
+            db.execute(f"UPDATE outbox SET status = 'failed', attempts = ?, error = ?, claimed_by = NULL WHERE {_CLAIMED}",
+                       (attempts, error, email_id, _owner()))
+        else:
+            retry_at = time.time() + RETRY_SECONDS * 2 ** (attempts - 1)
+            db.execute(
+                "UPDATE outbox SET status = 'queued', attempts = ?, error = ?, next_attempt_at = ?, claimed_by = NULL "
+                f"WHERE {_CLAIMED}",
+                (attempts, error, retry_at, email_id, _owner())
+            )
+
+
+class _Connection:
+    """An SMTP connection that is opened on demand and kept open between messages."""
+
+    def __init__(self):
+        self.smtp = None
+        self.last_used = 0.0
+
+    def send(self, message):
+        if self.smtp is None:
+            self.open()
+        try:
+            self.smtp.sendmail(SENDER_EMAIL, _recipients(message), message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the idle connection; reconnect once
+            self.open()
+            self.smtp.sendmail(SENDER_EMAIL, _recipients(message), message)
+        self.last_used = time.time()
+
+    def open(self):
+        self.close()
+        smtp = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        try:
+            if SMTP_STARTTLS:
+                smtp.starttls()
+            if SENDER_PASSWORD:
+                smtp.login(SENDER_EMAIL, SENDER_PASSWORD)
+        except Exception:
+            smtp.close()
+            raise
+        self.smtp = smtp
+
+    def close_if_idle(self):
+        if self.smtp is not None and time.time() - self.last_used > SMTP_IDLE_SECONDS:
+            self.close()
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self.smtp.close()
+            self.smtp = None
+
+
+def _recipients(message):
+    msg = message_from_bytes(message)
+    return [address for _, address in getaddresses(msg.get_all('To', []) + msg.get_all('Cc', []))]
+
+
+def _is_permanent(error):
+    """5xx replies (bad recipient, message rejected) will not succeed on retry."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    code = getattr(error, 'smtp_code', None)
+    return code is not None and 500 <= code < 600 and not isinstance(error, smtplib.SMTPAuthenticationError)
+
+
+def _send_batch(connection, rows):
+    for row in rows:
+        try:
+            connection.send(row['message'])
+        except (smtplib.SMTPException, OSError) as e:
+            logger.warning('Email %s failed (attempt %s): %s', row['id'], row['attempts'] + 1, e)
+            _mark_failed(row['id'], row['attempts'], str(e), _is_permanent(e))
+            if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused)):
+                # The connection is in an unknown state
+                connection.close()
+        else:
+            _mark_sent(row['id'])
+
+
+def _run():
+    connection = _Connection()
+    while not _stop.is_set():
+        try:
+            # Cleared before looking at the queue, so an enqueue() from now on wakes the wait below
+            _wake.clear()
+            if _stop.is_set():
+                break
+            rows = _claim_batch()
+            if rows:
+                _send_batch(connection, rows)
+                continue
+
+            next_due = _next_due()
+            timeout = SMTP_IDLE_SECONDS if next_due is None else max(0.0, min(next_due - time.time(), SMTP_IDLE_SECONDS))
+            _wake.wait(timeout)
+            connection.close_if_idle()
+        except Exception as e:
+            logger.exception('Email outbox error: %s', e)
+            connection.close()
+            time.sleep(1)
+    connection.close()
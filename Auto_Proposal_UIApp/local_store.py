@@ -0,0 +1,165 @@
+"""
+Local store for the app's own records: saved proposal forms and BOQ items.
+
+Records are kept in SQLite (LOCAL_STORE_DB, default data/store.db) in WAL
+mode, one row per record under an INTEGER PRIMARY KEY id with the rest of
+the record as JSON, so a save, update or delete touches one row instead of
+rewriting a whole file, ids are assigned by SQLite, and concurrent requests
+and workers do not overwrite each other's writes. Each thread keeps its own
+connection.
+
+The first time the database is created, the records in the JSON files that
+were used before (data/forms.json, data/boq_items.json) are imported. To
+import them again (records whose id already exists are kept):
+
+    python local_store.py migrate [--forms data/forms.json] [--boq data/boq_items.json]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
+DB_PATH = os.environ.get('LOCAL_STORE_DB', os.path.join(DATA_FOLDER, 'store.db'))
+FORMS_JSON = os.path.join(DATA_FOLDER, 'forms.json')
+BOQ_JSON = os.path.join(DATA_FOLDER, 'boq_items.json')
+
+TABLES = ('forms', 'boq_items')
+
+_SCHEMA = [f'CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, data TEXT NOT NULL)' for table in TABLES]
+# PRAGMA user_version once the schema exists and the JSON files were imported
+_VERSION = 1
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _connect():
+    """This thread's connection, creating the database on first use."""
+    global _initialized
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                _init_db()
+                _initialized = True
+    db = getattr(_local, 'db', None)
+    if db is None:
+        db = sqlite3.connect(DB_PATH, timeout=30)
+        db.execute('PRAGMA synchronous=NORMAL')
+        _local.db = db
+    return db
+
+
+def _init_db():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    db = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        db.execute('PRAGMA journal_mode=WAL')
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            if db.execute('PRAGMA user_version').fetchone()[0] < _VERSION:
+                for statement in _SCHEMA:
+                    db.execute(statement)
+                for table, path in (('forms', FORMS_JSON), ('boq_items', BOQ_JSON)):
+                    _import(db, table, _read_json(path))
+                db.execute(f'PRAGMA user_version = {_VERSION}')
+    finally:
+        db.close()
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def _import(db, table, records):
+    """Insert records with their own ids (new ids for those without); returns (imported, skipped)."""
+    imported = skipped = 0
+    for record in records:
+        record = dict(record)
+        record_id = record.pop('id', None)
+        cursor = db.execute(f'INSERT OR IGNORE INTO {table} (id, data) VALUES (?, ?)',
+                            (record_id, json.dumps(record)))
+        if cursor.rowcount:
+            imported += 1
+        else:
+            skipped += 1
+    return imported, skipped
+
+
+def _record(row):
+    record = json.loads(row[1])
+    record['id'] = row[0]
+    return record
+
+
+def records(table):
+    """All records of a table, in id order."""
+    # Built into one JSON array by SQLite, so Python parses a single document
+    # instead of one per row
+    records = _connect().execute(
+        f"SELECT json_group_array(json_set(data, '$.id', id)) FROM (SELECT id, data FROM {table} ORDER BY id)"
+    ).fetchone()[0]
+    return json.loads(records)
+
+
+def get(table, record_id):
+    row = _connect().execute(f'SELECT id, data FROM {table} WHERE id = ?', (record_id,)).fetchone()
+    return _record(row) if row else None
+
+
+def insert(table, record):
+    """Store a new record and set its id (one more than the largest id so far)."""
+    data = json.dumps({name: value for name, value in record.items() if name != 'id'})
+    db = _connect()
+    with db:
+        record['id'] = db.execute(f'INSERT INTO {table} (data) VALUES (?)', (data,)).lastrowid
+    return record['id']
+
+
+def replace(table, record_id, record):
+    """Replace the record with this id; returns False if there is none."""
+    data = json.dumps({name: value for name, value in record.items() if name != 'id'})
+    db = _connect()
+    with db:
+        return db.execute(f'UPDATE {table} SET data = ? WHERE id = ?', (data, record_id)).rowcount > 0
+
+
+def delete(table, record_id):
+    """Delete the record with this id; returns False if there is none."""
+    db = _connect()
+    with db:
+        return db.execute(f'DELETE FROM {table} WHERE id = ?', (record_id,)).rowcount > 0
+
+
+def migrate(forms_path=FORMS_JSON, boq_path=BOQ_JSON):
+    """Import the records of the JSON files; returns {table: (imported, skipped)}."""
+    db = _connect()
+    with db:
+        return {
+            table: _import(db, table, _read_json(path))
+            for table, path in (('forms', forms_path), ('boq_items', boq_path))
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local store of forms and BOQ items')
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = commands.add_parser('migrate', help='Import records from the JSON files')
+    migrate_parser.add_argument('--forms', default=FORMS_JSON)
+    migrate_parser.add_argument('--boq', default=BOQ_JSON)
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        for table, (imported, skipped) in migrate(args.forms, args.boq).items():
+            print(f'{table}: {imported} imported, {skipped} skipped (id already stored)')
+    print(f'Store: {DB_PATH}')
+
+
+if __name__ == '__main__':
+    main()
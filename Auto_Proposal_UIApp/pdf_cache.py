@@ -0,0 +1,95 @@
+"""
+Content-addressed cache of rendered proposal PDFs.
+
+A PDF is stored as <key>.pdf in PDF_CACHE_DIR (default uploads/pdf_cache),
+where the key is a hash of everything the PDF is rendered from: the proposal
+fields, its items and client, the company details and the logo file. Any edit
+gives a new key and so a fresh render; an unchanged proposal is served from
+disk. The issue date printed on the PDF is not part of the key.
+
+Old versions are evicted least recently used first: a lookup refreshes the
+file's mtime, and evict() removes files older than PDF_CACHE_MAX_AGE_DAYS
+(default 30), then the least recently used ones until the cache is under
+PDF_CACHE_MAX_MB (default 500).
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+CACHE_DIR = os.environ.get('PDF_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'uploads', 'pdf_cache'))
+MAX_BYTES = int(float(os.environ.get('PDF_CACHE_MAX_MB', '500')) * 1024 * 1024)
+MAX_AGE_SECONDS = int(float(os.environ.get('PDF_CACHE_MAX_AGE_DAYS', '30')) * 86400)
+
+# Image folder for logos (same as app.IMAGE_FOLDER)
+IMAGE_FOLDER = os.path.join(os.path.dirname(__file__), 'image')
+
+# Parts of the /full response that are not rendered into the PDF
+_UNUSED_FIELDS = ('project_types', 'clients')
+_KEY_RE = re.compile(r'[0-9a-f]{64}')
+
+_evict_lock = threading.Lock()
+
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+
+def logo_candidates(company):
+    """Paths where the company's logo may have been saved locally."""
+    if not company.get('logo_url'):
+        return []
+    return [
+        os.path.join(IMAGE_FOLDER, os.path.basename(company['logo_url'])),
+        os.path.join(os.path.dirname(__file__), company['logo_url'].lstrip('/')),
+    ]
+
+
+def version_key(proposal, company):
+    """Hash of the render inputs of a proposal PDF (proposal is the /full response)."""
+    proposal = {name: value for name, value in proposal.items() if name not in _UNUSED_FIELDS}
+    logos = []
+    for logo_path in logo_candidates(company):
+        if os.path.exists(logo_path):
+            stat = os.stat(logo_path)
+            logos.append([logo_path, stat.st_size, stat.st_mtime_ns])
+    payload = json.dumps([proposal, company, logos], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def path_for(key):
+    if not _KEY_RE.fullmatch(key):
+        raise ValueError(f'Invalid PDF cache key: {key}')
+    return os.path.join(CACHE_DIR, f'{key}.pdf')
+
+
+def lookup(key):
+    """Path of the cached PDF of key (marked as recently used), or None."""
+    path = path_for(key)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def evict():
+    """Remove expired PDFs, then the least recently used until under the size limit."""
+    with _evict_lock:
+        entries = []
+        for entry in os.scandir(CACHE_DIR):
+            if entry.name.endswith('.pdf') and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        cutoff = time.time() - MAX_AGE_SECONDS
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if mtime >= cutoff and total <= MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
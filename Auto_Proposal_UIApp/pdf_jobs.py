@@ -0,0 +1,215 @@
+"""
+Background jobs for proposal PDF rendering.
+
+A render is submitted with the proposal's pdf_cache key. The PDF is rendered
+by the backend (POST /api/proposals/{id}/pdf, with the company logo if it is
+stored here) and written into the PDF cache. Up to PDF_WORKERS renders
+(default 4) are requested at once, on background threads, so a render does
+not hold a Flask request thread. While a render of a key is queued or
+running, submitting the same key returns the same job instead of rendering
+it again.
+
+Job status goes queued -> running -> completed | failed. Jobs are kept in a
+SQLite table (PDF_JOBS_DB, default uploads/pdf_jobs.db) shared by the app's
+processes, so a job can be polled from any of them and a render is joined
+across processes too; finished jobs are kept for PDF_JOB_RETENTION_SECONDS
+(default 3600). A job still queued or running after PDF_JOB_STALE_SECONDS
+(default 600) was left by a process that stopped; it is reported failed and
+no longer holds back a new render of its key.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import backend_client as backend
+import pdf_cache
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('PDF_WORKERS', '4'))
+# Rendering takes longer than the other backend calls
+RENDER_TIMEOUT = float(os.environ.get('PDF_RENDER_TIMEOUT', '60'))
+RETENTION_SECONDS = int(os.environ.get('PDF_JOB_RETENTION_SECONDS', '3600'))
+STALE_SECONDS = float(os.environ.get('PDF_JOB_STALE_SECONDS', '600'))
+DB_PATH = os.environ.get('PDF_JOBS_DB', os.path.join(os.path.dirname(__file__), 'uploads', 'pdf_jobs.db'))
+# How often wait() looks at a job rendered by another process
+POLL_SECONDS = 0.2
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pdf_jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    filename TEXT,
+    pdf_url TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_pdf_jobs_key ON pdf_jobs (key, status);
+CREATE INDEX IF NOT EXISTS ix_pdf_jobs_finished ON pdf_jobs (finished_at);
+'''
+_COLUMNS = 'id, status, filename, pdf_url, error, created_at, finished_at'
+
+_executor = None
+_executor_lock = threading.Lock()
+_init_lock = threading.Lock()
+_initialized = False
+# job id -> Event set when a job of this process finishes
+_finished = {}
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='pdf-job')
+        return _executor
+
+
+@contextmanager
+def _db():
+    """A connection to the job table, committed and closed on exit."""
+    global _initialized
+    with _init_lock:
+        if not _initialized:
+            os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+            db = sqlite3.connect(DB_PATH, timeout=30)
+            try:
+                db.execute('PRAGMA journal_mode=WAL')
+                db.executescript(_SCHEMA)
+            finally:
+                db.close()
+            _initialized = True
+    db = sqlite3.connect(DB_PATH, timeout=30)
+    db.row_factory = sqlite3.Row
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def _public(row):
+    job = dict(row)
+    job['job_id'] = job.pop('id')
+    if job['status'] in ('queued', 'running') and job['created_at'] < time.time() - STALE_SECONDS:
+        job.update(status='failed', error='Abandoned: the process rendering it stopped')
+    if job['status'] != 'completed':
+        # Only a finished render has a file to link to
+        job['pdf_url'] = None
+    return job
+
+
+def get(job_id):
+    """The job as a dict, or None if it does not exist (or has expired)."""
+    with _db() as db:
+        row = db.execute(f'SELECT {_COLUMNS} FROM pdf_jobs WHERE id = ?', (job_id,)).fetchone()
+    return _public(row) if row else None
+
+
+def wait(job_id, timeout=None):
+    """Wait until the job has finished (or timeout seconds) and return it, as get()."""
+    finished = _finished.get(job_id)
+    if finished is not None:
+        finished.wait(timeout)
+        return get(job_id)
+
+    # Rendered by another process
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        job = get(job_id)
+        if job is None or job['status'] in ('completed', 'failed'):
+            return job
+        if deadline is not None and time.monotonic() >= deadline:
+            return job
+        time.sleep(POLL_SECONDS if deadline is None else max(0.0, min(POLL_SECONDS, deadline - time.monotonic())))
+
+
+def _render(render_url, company, pdf_path, headers):
+    """Have the backend render the PDF and save it to pdf_path."""
+    logo = None
+    for logo_path in pdf_cache.logo_candidates(company):
+        if os.path.exists(logo_path):
+            logo = logo_path
+            break
+    
+    if logo:
+        with open(logo, 'rb') as f:
+            response = backend.post(render_url, files={'logo': (os.path.basename(logo), f)}, headers=headers,
+                                    timeout=RENDER_TIMEOUT)
+    else:
+        response = backend.post(render_url, headers=headers, timeout=RENDER_TIMEOUT)
+    if response.status_code != 200:
+        raise RuntimeError(f'Backend could not render the PDF ({response.status_code}): {response.text[:200]}')
+    
+    # Written to a temporary file first, so a half-written PDF is never served
+    tmp_path = f'{pdf_path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(response.content)
+    os.replace(tmp_path, pdf_path)
+    return pdf_path
+
+
+def submit(key, filename, pdf_url, render_url, company, headers=None):
+    """Queue a render (by the backend, at render_url) into the PDF cache, or join the one already running for key."""
+    now = time.time()
+    with _db() as db:
+        # Taken before reading, so two processes never start the same render
+        db.execute('BEGIN IMMEDIATE')
+        db.execute('DELETE FROM pdf_jobs WHERE finished_at < ?', (now - RETENTION_SECONDS,))
+        active = db.execute(
+            f"SELECT {_COLUMNS} FROM pdf_jobs WHERE key = ? AND status IN ('queued', 'running') AND created_at >= ? "
+            'ORDER BY created_at DESC LIMIT 1',
+            (key, now - STALE_SECONDS)
+        ).fetchone()
+        if active is not None:
+            return _public(active)
+
+        job_id = uuid.uuid4().hex
+        db.execute(
+            "INSERT INTO pdf_jobs (id, key, status, filename, pdf_url, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, key, filename, pdf_url, now)
+        )
+    _finished[job_id] = threading.Event()
+    job = get(job_id)
+
+    try:
+        future = _get_executor().submit(_run, job_id, render_url, company, pdf_cache.path_for(key), headers)
+    except Exception as e:
+        _finish(job_id, error=str(e))
+        return get(job_id)
+    future.add_done_callback(lambda done: _done(job_id, done))
+    return job
+
+
+def _run(job_id, render_url, company, pdf_path, headers):
+    with _db() as db:
+        db.execute("UPDATE pdf_jobs SET status = 'running' WHERE id = ? AND status = 'queued'", (job_id,))
+    return _render(render_url, company, pdf_path, headers)
+
+
+def _done(job_id, future):
+    error = future.exception()
+    if error is not None:
+        logger.error('PDF job %s failed: %s', job_id, error)
+        _finish(job_id, error=str(error))
+    else:
+        _finish(job_id)
+        pdf_cache.evict()
+
+
+def _finish(job_id, error=None):
+    with _db() as db:
+        db.execute(
+            'UPDATE pdf_jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?',
+            ('failed' if error else 'completed', error, time.time(), job_id)
+        )
+    finished = _finished.pop(job_id, None)
+    if finished is not None:
+        finished.set()
@@ -0,0 +1,156 @@
+"""
+Backend client: ETag revalidation cache, auth headers and parallel get_many().
+
+Run with: python -m pytest test_backend_client.py
+"""
+import threading
+
+import pytest
+import requests
+
+import backend_client
+
+
+def response(status_code, body=b'', etag=None):
+    r = requests.Response()
+    r.status_code = status_code
+    r._content = body
+    if etag:
+        r.headers['ETag'] = etag
+    return r
+
+
+class Session:
+    """Stands in for the requests.Session; answers from a url -> handler map."""
+
+    def __init__(self):
+        self.calls = []
+        self.handlers = {}
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return self.handlers[url](kwargs)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    fake = Session()
+    monkeypatch.setattr(backend_client, 'session', fake)
+    monkeypatch.setattr(backend_client, '_cache', backend_client.OrderedDict())
+    monkeypatch.setattr(backend_client, 'token_provider', None)
+    return fake
+
+
+def etagged(body, etag):
+    """Handler serving body with etag, or 304 when revalidated with it."""
+    def handle(kwargs):
+        if kwargs['headers'].get('If-None-Match') == etag:
+            return response(304)
+        return response(200, body, etag)
+    return handle
+
+
+def test_unchanged_resource_is_answered_from_the_cache(session):
+    session.handlers['/items'] = etagged(b'[1, 2]', '"v1"')
+
+    first = backend_client.get('/items')
+    second = backend_client.get('/items')
+
+    assert second is first
+    assert second.json() == [1, 2]
+    assert 'If-None-Match' not in session.calls[0][2]['headers']
+    assert session.calls[1][2]['headers']['If-None-Match'] == '"v1"'
+
+
+def test_changed_resource_replaces_the_cached_copy(session):
+    session.handlers['/items'] = etagged(b'[1]', '"v1"')
+    backend_client.get('/items')
+    session.handlers['/items'] = etagged(b'[1, 2]', '"v2"')
+
+    assert backend_client.get('/items').json() == [1, 2]
+    assert backend_client.get('/items').json() == [1, 2]
+    assert session.calls[2][2]['headers']['If-None-Match'] == '"v2"'
+
+
+def test_response_without_etag_or_error_is_not_cached(session):
+    session.handlers['/plain'] = lambda kwargs: response(200, b'{}')
+    session.handlers['/broken'] = lambda kwargs: response(500, b'', '"e"')
+
+    for url in ('/plain', '/plain', '/broken', '/broken'):
+        backend_client.get(url)
+
+    assert all('If-None-Match' not in kwargs['headers'] for _, _, kwargs in session.calls)
+
+
+def test_cache_is_kept_per_params_and_per_user(session, monkeypatch):
+    session.handlers['/items'] = etagged(b'[]', '"v1"')
+    token = threading.local()
+    monkeypatch.setattr(backend_client, 'token_provider', lambda: getattr(token, 'value', None))
+
+    token.value = 'alice'
+    backend_client.get('/items', params={'page': 1})
+    backend_client.get('/items', params={'page': 2})
+    token.value = 'bob'
+    backend_client.get('/items', params={'page': 1})
+
+    assert all('If-None-Match' not in kwargs['headers'] for _, _, kwargs in session.calls)
+    assert session.calls[2][2]['headers']['Authorization'] == 'Bearer bob'
+
+
+def test_least_recently_used_entry_is_dropped(session, monkeypatch):
+    monkeypatch.setattr(backend_client, 'CACHE_SIZE', 2)
+    for url in ('/a', '/b', '/c'):
+        session.handlers[url] = etagged(b'{}', f'"{url}"')
+
+    backend_client.get('/a')
+    backend_client.get('/b')
+    backend_client.get('/a')   # /b is now the least recently used
+    backend_client.get('/c')
+
+    assert [key[0] for key in backend_client._cache] == ['/a', '/c']
+
+
+def test_get_many_runs_calls_in_parallel_and_keeps_their_order(session):
+    # Each call waits for the other two, so this only finishes if they run together
+    barrier = threading.Barrier(3, timeout=5)
+
+    def handle(body):
+        def run(kwargs):
+            barrier.wait()
+            return response(200, body)
+        return run
+
+    session.handlers['/a'] = handle(b'"a"')
+    session.handlers['/b'] = handle(b'"b"')
+    session.handlers['/c'] = handle(b'"c"')
+
+    results = backend_client.get_many('/a', ('/b', {'q': 'x'}), '/c', timeout=3)
+
+    assert [r.json() for r in results] == ['a', 'b', 'c']
+    params = {url: kwargs['params'] for _, url, kwargs in session.calls}
+    assert params == {'/a': None, '/b': {'q': 'x'}, '/c': None}
+    assert all(kwargs['timeout'] == 3 for _, _, kwargs in session.calls)
+
+
+def test_get_many_returns_the_exception_of_a_failed_call(session):
+    def down(kwargs):
+        raise requests.exceptions.ConnectionError('refused')
+
+    session.handlers['/ok'] = lambda kwargs: response(200, b'1')
+    session.handlers['/down'] = down
+
+    ok, failed = backend_client.get_many('/ok', '/down')
+
+    assert ok.json() == 1
+    assert isinstance(failed, requests.exceptions.ConnectionError)
+
+
+def test_get_many_uses_the_token_of_the_calling_thread(session, monkeypatch):
+    token = threading.local()
+    token.value = 'alice'
+    monkeypatch.setattr(backend_client, 'token_provider', lambda: getattr(token, 'value', None))
+    session.handlers['/me'] = lambda kwargs: response(200, b'{}')
+
+    backend_client.get_many('/me', '/me')
+
+    assert [kwargs['headers']['Authorization'] for _, _, kwargs in session.calls] == ['Bearer alice'] * 2
@@ -0,0 +1,184 @@
+"""
+Campaigns: PDFs rendered or taken from the cache, messages queued in the
+outbox, per-recipient status kept in SQLite.
+
+Run with: python -m pytest test_email_campaigns.py
+"""
+import threading
+import time
+
+import pytest
+
+import email_campaigns
+import pdf_cache
+
+CACHED = 'a' * 64
+MISSING = 'b' * 64
+
+
+class Outbox:
+    """Stands in for email_outbox: enqueue() records, get_many() reports the set statuses."""
+
+    def __init__(self):
+        self.messages = {}
+        self.statuses = {}
+
+    def enqueue(self, message):
+        email_id = len(self.messages) + 1
+        self.messages[email_id] = message
+        self.statuses[email_id] = {'status': 'queued', 'error': None, 'sent_at': None}
+        return email_id
+
+    def get_many(self, email_ids):
+        return {email_id: self.statuses[email_id] for email_id in email_ids if email_id in self.statuses}
+
+
+class Jobs:
+    """Stands in for pdf_jobs: renders write the PDF when released."""
+
+    def __init__(self):
+        self.submitted = []
+        self.released = threading.Event()
+        self.fail = set()
+
+    def submit(self, key, filename, pdf_url, render_url, company, headers=None):
+        self.submitted.append(key)
+        return {'job_id': key, 'status': 'queued'}
+
+    def wait(self, job_id, timeout=None):
+        assert self.released.wait(10)
+        if job_id in self.fail:
+            return {'job_id': job_id, 'status': 'failed', 'error': 'backend down'}
+        with open(pdf_cache.path_for(job_id), 'wb') as f:
+            f.write(b'%PDF')
+        return {'job_id': job_id, 'status': 'completed', 'error': None}
+
+
+@pytest.fixture
+def fakes(tmp_path, monkeypatch):
+    outbox, jobs = Outbox(), Jobs()
+    monkeypatch.setattr(email_campaigns, 'DB_PATH', str(tmp_path / 'campaigns.db'))
+    monkeypatch.setattr(email_campaigns, '_initialized', False)
+    monkeypatch.setattr(pdf_cache, 'CACHE_DIR', str(tmp_path))
+    for name in ('enqueue', 'get_many'):
+        monkeypatch.setattr(email_campaigns.email_outbox, name, getattr(outbox, name))
+    for name in ('submit', 'wait'):
+        monkeypatch.setattr(email_campaigns.pdf_jobs, name, getattr(jobs, name))
+    (tmp_path / f'{CACHED}.pdf').write_bytes(b'%PDF')
+    yield outbox, jobs
+    jobs.released.set()
+
+
+def entry(proposal_id, key, recipient=None):
+    return {
+        'proposal_id': proposal_id, 'recipient': recipient or f'client{proposal_id}@example.com',
+        'key': key, 'filename': f'P{proposal_id}.pdf', 'pdf_url': f'/pdf/{key}', 'render_url': '/render',
+        'company': {}, 'proposal': {'id': proposal_id},
+    }
+
+
+def build(entry, pdf_path):
+    return f"to {entry['recipient']} with {pdf_path}"
+
+
+def settled(campaign_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        campaign = email_campaigns.get(campaign_id)
+        if 'preparing' not in campaign['counts']:
+            return campaign
+        time.sleep(0.02)
+    raise AssertionError(f'still preparing: {email_campaigns.get(campaign_id)}')
+
+
+def test_recipients_are_queued_once_their_pdf_exists(fakes):
+    outbox, jobs = fakes
+    campaign = email_campaigns.submit(
+        [entry(1, CACHED), entry(2, MISSING), {'proposal_id': 3, 'error': 'Client has no email address'}], build
+    )
+
+    # Only the missing PDF is rendered
+    assert jobs.submitted == [MISSING]
+    statuses = [r['status'] for r in campaign['recipients']]
+    assert statuses[1:] == ['preparing', 'failed']
+    assert campaign['status'] == 'running'
+
+    jobs.released.set()
+    campaign = settled(campaign['campaign_id'])
+
+    assert [r['proposal_id'] for r in campaign['recipients']] == [1, 2, 3]
+    assert [r['status'] for r in campaign['recipients']] == ['queued', 'queued', 'failed']
+    assert campaign['recipients'][2]['error'] == 'Client has no email address'
+    assert sorted(outbox.messages.values()) == sorted(
+        f"to client{n}@example.com with {pdf_cache.path_for(key)}" for n, key in ((1, CACHED), (2, MISSING))
+    )
+
+
+def test_outbox_status_is_reported(fakes):
+    outbox, jobs = fakes
+    campaign = settled(email_campaigns.submit([entry(1, CACHED), entry(2, CACHED)], build)['campaign_id'])
+    first, second = (r['email_id'] for r in campaign['recipients'])
+
+    outbox.statuses[first].update(status='sent', sent_at=123.0)
+    outbox.statuses[second].update(status='failed', error='550 No such user')
+    campaign = email_campaigns.get(campaign['campaign_id'])
+
+    assert campaign['status'] == 'completed'
+    assert campaign['counts'] == {'sent': 1, 'failed': 1}
+    assert campaign['recipients'][0]['sent_at'] == 123.0
+    assert campaign['recipients'][1]['error'] == '550 No such user'
+
+
+def test_failed_render_fails_the_recipient(fakes):
+    outbox, jobs = fakes
+    jobs.fail.add(MISSING)
+    jobs.released.set()
+
+    campaign = settled(email_campaigns.submit([entry(1, MISSING)], build)['campaign_id'])
+
+    assert campaign['recipients'][0]['status'] == 'failed'
+    assert 'backend down' in campaign['recipients'][0]['error']
+    assert not outbox.messages
+
+
+def test_same_proposal_twice_is_tracked_per_recipient(fakes):
+    outbox, jobs = fakes
+    entries = [entry(1, CACHED, 'a@example.com'), entry(1, CACHED, 'a@example.com')]
+
+    campaign = settled(email_campaigns.submit(entries, build)['campaign_id'])
+
+    assert [r['email_id'] for r in campaign['recipients']] == [1, 2]
+
+
+def test_campaign_is_stored_for_other_processes(fakes):
+    campaign = settled(email_campaigns.submit([entry(1, CACHED)], build)['campaign_id'])
+
+    # A fresh process opens the same database
+    email_campaigns._initialized = False
+    assert email_campaigns.get(campaign['campaign_id']) == campaign
+    assert email_campaigns.get('missing') is None
+
+
+def test_abandoned_recipients_are_failed(fakes):
+    with email_campaigns._db() as db:
+        db.execute("INSERT INTO campaigns (id, created_at) VALUES ('dead', ?)",
+                   (time.time() - email_campaigns.STALE_SECONDS - 1,))
+        db.execute("INSERT INTO campaign_recipients (campaign_id, position, proposal_id, recipient, status) "
+                   "VALUES ('dead', 0, 1, 'a@example.com', 'preparing')")
+
+    campaign = email_campaigns.get('dead')
+
+    assert campaign['status'] == 'completed'
+    assert 'Abandoned' in campaign['recipients'][0]['error']
+
+
+def test_expired_campaigns_are_purged(fakes, monkeypatch):
+    old = settled(email_campaigns.submit([entry(1, CACHED)], build)['campaign_id'])
+    monkeypatch.setattr(email_campaigns, 'RETENTION_SECONDS', -1)
+
+    email_campaigns.submit([], build)
+
+    assert email_campaigns.get(old['campaign_id']) is None
+    with email_campaigns._db() as db:
+        assert db.execute('SELECT COUNT(*) FROM campaign_recipients WHERE campaign_id = ?',
+                          (old['campaign_id'],)).fetchone()[0] == 0
@@ -0,0 +1,184 @@
+"""
+Outbox against a local SMTP server: batching, retry with backoff, claims.
+
+Run with: python -m pytest test_email_outbox.py (needs aiosmtpd)
+"""
+import socket
+import sqlite3
+import time
+from email.mime.text import MIMEText
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+
+import email_outbox
+
+
+class Recorder:
+    """SMTP handler that records deliveries; some recipients are refused."""
+
+    def __init__(self):
+        self.deliveries = []   # (recipient, time, client port) per DATA, refused ones too
+        self.defer_once = set()
+        self.defer_always = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        recipient = envelope.rcpt_tos[0]
+        self.deliveries.append((recipient, time.time(), session.peer[1]))
+        if recipient in self.defer_always or recipient in self.defer_once:
+            self.defer_once.discard(recipient)
+            return '451 4.3.0 Try again later'
+        if recipient.startswith('bounce'):
+            return '550 5.1.1 No such user'
+        return '250 OK'
+
+    def delivered(self, recipient):
+        return [d for d in self.deliveries if d[0] == recipient]
+
+
+@pytest.fixture
+def smtp(tmp_path, monkeypatch):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    recorder = Recorder()
+    controller = aiosmtpd_controller.Controller(recorder, hostname='127.0.0.1', port=port)
+    controller.start()
+
+    email_outbox.stop()
+    for name, value in {
+        'DB_PATH': str(tmp_path / 'outbox.db'), 'SMTP_SERVER': '127.0.0.1', 'SMTP_PORT': port,
+        'SMTP_STARTTLS': False, 'SENDER_EMAIL': 'app@example.com', 'SENDER_PASSWORD': '',
+        'CONNECTIONS': 2, 'BATCH_SIZE': 3, 'RETRY_SECONDS': 0.3, 'MAX_ATTEMPTS': 3,
+    }.items():
+        monkeypatch.setattr(email_outbox, name, value)
+    yield recorder
+    email_outbox.stop(timeout=10)
+    controller.stop()
+
+
+def message(recipient, subject='Proposal'):
+    msg = MIMEText('Please find the proposal attached.\nRegards')
+    msg['From'] = 'app@example.com'
+    msg['To'] = recipient
+    msg['Subject'] = subject
+    return msg
+
+
+def wait_settled(email_ids, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        statuses = email_outbox.get_many(email_ids)
+        if all(statuses[i]['status'] in ('sent', 'failed') for i in email_ids):
+            return statuses
+        time.sleep(0.05)
+    raise AssertionError(f'not settled: {email_outbox.get_many(email_ids)}')
+
+
+def test_burst_is_sent_in_batches_over_kept_connections(smtp):
+    ids = [email_outbox.enqueue(message(f'client{i}@example.com')) for i in range(10)]
+
+    statuses = wait_settled(ids)
+
+    assert [statuses[i]['status'] for i in ids] == ['sent'] * 10
+    assert sorted(d[0] for d in smtp.deliveries) == sorted(f'client{i}@example.com' for i in range(10))
+    # Every message went over one of the CONNECTIONS connections, not one each
+    assert len({d[2] for d in smtp.deliveries}) <= email_outbox.CONNECTIONS
+
+
+def test_temporary_failure_is_retried_after_backoff(smtp):
+    smtp.defer_once.add('later@example.com')
+
+    email_id = email_outbox.enqueue(message('later@example.com'))
+    status = wait_settled([email_id])[email_id]
+
+    assert status['status'] == 'sent'
+    assert status['attempts'] == 1
+    first, second = smtp.delivered('later@example.com')
+    assert second[1] - first[1] >= email_outbox.RETRY_SECONDS
+
+
+def test_permanent_failure_is_not_retried(smtp):
+    email_id = email_outbox.enqueue(message('bounce@example.com'))
+    status = wait_settled([email_id])[email_id]
+
+    assert status['status'] == 'failed'
+    assert status['attempts'] == 1
+    assert '550' in status['error']
+    assert len(smtp.delivered('bounce@example.com')) == 1
+
+
+def test_gives_up_after_max_attempts(smtp, monkeypatch):
+    monkeypatch.setattr(email_outbox, 'RETRY_SECONDS', 0.05)
+    smtp.defer_always.add('busy@example.com')
+
+    email_id = email_outbox.enqueue(message('busy@example.com'))
+    status = wait_settled([email_id])[email_id]
+
+    assert status['status'] == 'failed'
+    assert status['attempts'] == email_outbox.MAX_ATTEMPTS
+    assert '451' in status['error']
+    assert len(smtp.delivered('busy@example.com')) == email_outbox.MAX_ATTEMPTS
+
+
+def wire(msg):
+    return msg.as_bytes(policy=msg.policy.clone(linesep='\r\n'))
+
+
+def claimed(recipient, claimed_at):
+    """A message being sent by another process, as its claim left it."""
+    email_outbox._init_db()
+    with email_outbox._db() as db:
+        return db.execute(
+            'INSERT INTO outbox (recipient, subject, message, status, next_attempt_at, created_at, claimed_by, claimed_at) '
+            "VALUES (?, 'Claimed', ?, 'sending', 0, 0, 'other-host:1:email-outbox-0', ?)",
+            (recipient, wire(message(recipient)), claimed_at)
+        ).lastrowid
+
+
+def test_only_expired_claims_are_taken_over(smtp, monkeypatch):
+    monkeypatch.setattr(email_outbox, 'LEASE_SECONDS', 1.0)
+    dead = claimed('dead@example.com', time.time() - 5)   # its process died mid-batch
+    live = claimed('live@example.com', time.time())       # still being sent
+
+    # Starting (a restart, or another process) leaves the live claim alone
+    email_outbox.start()
+    assert wait_settled([dead])[dead]['status'] == 'sent'
+    assert email_outbox.get(live)['status'] == 'sending'
+    assert not smtp.delivered('live@example.com')
+
+    # Until its lease runs out
+    assert wait_settled([live])[live]['status'] == 'sent'
+    assert len(smtp.delivered('live@example.com')) == 1
+
+
+def test_late_result_of_a_taken_over_claim_is_ignored(smtp):
+    email_id = claimed('late@example.com', time.time())
+
+    # This thread does not hold the claim
+    email_outbox._mark_failed(email_id, 0, 'timed out', permanent=False)
+    email_outbox._mark_sent(email_id)
+
+    status = email_outbox.get(email_id)
+    assert (status['status'], status['attempts']) == ('sending', 0)
+
+
+def test_queue_from_before_claims_is_migrated(smtp):
+    with sqlite3.connect(email_outbox.DB_PATH) as db:
+        db.execute('CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, recipient TEXT NOT NULL, '
+                   "subject TEXT, message BLOB NOT NULL, status TEXT NOT NULL DEFAULT 'queued', "
+                   'attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, error TEXT, '
+                   'created_at REAL NOT NULL, sent_at REAL)')
+        email_id = db.execute(
+            "INSERT INTO outbox (recipient, subject, message, status, next_attempt_at, created_at) "
+            "VALUES ('old@example.com', 'Old', ?, 'sending', 0, 0)",
+            (wire(message('old@example.com')),)
+        ).lastrowid
+    db.close()
+
+    email_outbox.start()
+
+    # Claimed before claims had an owner and a lease: taken over at once
+    assert wait_settled([email_id])[email_id]['status'] == 'sent'
+    assert len(smtp.delivered('old@example.com')) == 1
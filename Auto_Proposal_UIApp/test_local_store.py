@@ -0,0 +1,104 @@
+"""
+Local store: import of the old JSON files, record CRUD and concurrent writes.
+
+Run with: python -m pytest test_local_store.py
+"""
+import json
+import sqlite3
+import threading
+
+import pytest
+
+import local_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    forms = tmp_path / 'forms.json'
+    forms.write_text(json.dumps([{'id': 3, 'title': 'Old form'}, {'id': 7, 'title': 'Older form'}]), encoding='utf-8')
+    monkeypatch.setattr(local_store, 'DB_PATH', str(tmp_path / 'data' / 'store.db'))
+    monkeypatch.setattr(local_store, 'FORMS_JSON', str(forms))
+    monkeypatch.setattr(local_store, 'BOQ_JSON', str(tmp_path / 'missing.json'))
+    monkeypatch.setattr(local_store, '_initialized', False)
+    monkeypatch.setattr(local_store, '_local', threading.local())
+    yield tmp_path
+    db = getattr(local_store._local, 'db', None)
+    if db is not None:
+        db.close()
+
+
+def test_json_files_are_imported_once(store, monkeypatch):
+    assert local_store.records('forms') == [{'title': 'Old form', 'id': 3}, {'title': 'Older form', 'id': 7}]
+    assert local_store.records('boq_items') == []
+
+    # Another process starting later does not import the files again
+    local_store.delete('forms', 3)
+    local_store._local.db.close()
+    monkeypatch.setattr(local_store, '_initialized', False)
+    monkeypatch.setattr(local_store, '_local', threading.local())
+    assert [form['id'] for form in local_store.records('forms')] == [7]
+    with sqlite3.connect(local_store.DB_PATH) as db:
+        assert db.execute('PRAGMA user_version').fetchone()[0] == local_store._VERSION
+        assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    db.close()
+
+
+def test_insert_get_replace_delete(store):
+    item = {'id': 99, 'title': 'Tiles', 'rate': 12.5, 'tags': ['floor'], 'active': True, 'note': 'Café'}
+
+    item_id = local_store.insert('boq_items', item)
+
+    # The id is assigned by the store, not taken from the record
+    assert item_id == item['id'] == 1
+    assert local_store.get('boq_items', item_id) == item
+    assert local_store.records('boq_items') == [item]
+
+    assert local_store.replace('boq_items', item_id, {'title': 'Large tiles'})
+    assert local_store.get('boq_items', item_id) == {'title': 'Large tiles', 'id': item_id}
+    assert not local_store.replace('boq_items', 42, {'title': 'Nothing'})
+
+    assert local_store.delete('boq_items', item_id)
+    assert not local_store.delete('boq_items', item_id)
+    assert local_store.get('boq_items', item_id) is None
+
+
+def test_new_ids_follow_the_imported_ones(store):
+    assert local_store.insert('forms', {'title': 'New form'}) == 8
+
+
+def test_migrate_skips_stored_ids(store):
+    local_store.records('forms')
+    again = store / 'again.json'
+    again.write_text(json.dumps([{'id': 3, 'title': 'Changed'}, {'id': 10, 'title': 'Extra'}, {'title': 'No id'}]),
+                     encoding='utf-8')
+
+    result = local_store.migrate(forms_path=str(again), boq_path=str(store / 'missing.json'))
+
+    assert result == {'forms': (2, 1), 'boq_items': (0, 0)}
+    assert [(form['id'], form['title']) for form in local_store.records('forms')] == [
+        (3, 'Old form'), (7, 'Older form'), (10, 'Extra'), (11, 'No id'),
+    ]
+
+
+def test_concurrent_inserts_get_distinct_ids(store):
+    ids = []
+    errors = []
+
+    def add(n):
+        try:
+            for i in range(20):
+                ids.append(local_store.insert('boq_items', {'title': f'{n}-{i}'}))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            local_store._local.db.close()
+
+    threads = [threading.Thread(target=add, args=(n,)) for n in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert sorted(ids) == list(range(1, 101))
+    assert len(local_store.records('boq_items')) == 100
@@ -0,0 +1,101 @@
+"""
+PDF cache: version keys, lookups and eviction.
+
+Run with: python -m pytest test_pdf_cache.py
+"""
+import os
+import time
+
+import pytest
+
+import pdf_cache
+
+PROPOSAL = {'id': 7, 'title': 'Office fit-out', 'items': [{'item_name': 'Tiles', 'qty': 2}], 'client': {'id': 3}}
+COMPANY = {'id': 1, 'company_name': 'Acme', 'logo_url': '/image/acme.png'}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    folder = tmp_path / 'cache'
+    folder.mkdir()
+    monkeypatch.setattr(pdf_cache, 'CACHE_DIR', str(folder))
+    monkeypatch.setattr(pdf_cache, 'IMAGE_FOLDER', str(tmp_path))
+    return folder
+
+
+def cached(key, size=10, age=0):
+    path = pdf_cache.path_for(key)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_key_follows_the_render_inputs(cache):
+    key = pdf_cache.version_key(PROPOSAL, COMPANY)
+    assert len(key) == 64
+    assert pdf_cache.version_key(dict(PROPOSAL), dict(COMPANY)) == key
+
+    edited = {**PROPOSAL, 'items': [{'item_name': 'Tiles', 'qty': 3}]}
+    assert pdf_cache.version_key(edited, COMPANY) != key
+    assert pdf_cache.version_key(PROPOSAL, {**COMPANY, 'company_name': 'Acme Ltd'}) != key
+    # Lists of the edit form are not rendered
+    assert pdf_cache.version_key({**PROPOSAL, 'clients': [{'id': 4}], 'project_types': ['Office']}, COMPANY) == key
+
+
+def test_key_follows_the_logo_file(cache, tmp_path):
+    without_logo = pdf_cache.version_key(PROPOSAL, COMPANY)
+    logo = tmp_path / 'acme.png'
+    logo.write_bytes(b'png')
+    with_logo = pdf_cache.version_key(PROPOSAL, COMPANY)
+    assert with_logo != without_logo
+
+    logo.write_bytes(b'a new logo')
+    assert pdf_cache.version_key(PROPOSAL, COMPANY) != with_logo
+
+
+def test_logo_candidates(cache, tmp_path):
+    assert pdf_cache.logo_candidates({'logo_url': None}) == []
+    assert pdf_cache.logo_candidates(COMPANY)[0] == os.path.join(str(tmp_path), 'acme.png')
+
+
+@pytest.mark.parametrize('key', ['', 'A' * 64, 'a' * 63, '../' + 'a' * 61, 'a' * 64 + '/', 'a' * 64 + '\n'])
+def test_invalid_key_is_rejected(cache, key):
+    with pytest.raises(ValueError):
+        pdf_cache.path_for(key)
+
+
+def test_lookup_marks_the_pdf_recently_used(cache):
+    assert pdf_cache.lookup('a' * 64) is None
+
+    path = cached('a' * 64, age=3600)
+    assert pdf_cache.lookup('a' * 64) == path
+    assert os.path.getmtime(path) > time.time() - 60
+
+
+def test_evict_removes_expired_pdfs(cache, monkeypatch):
+    monkeypatch.setattr(pdf_cache, 'MAX_AGE_SECONDS', 100)
+    old = cached('a' * 64, age=200)
+    new = cached('b' * 64, age=50)
+
+    pdf_cache.evict()
+
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+
+
+def test_evict_removes_least_recently_used_until_under_the_limit(cache, monkeypatch):
+    monkeypatch.setattr(pdf_cache, 'MAX_BYTES', 25)
+    oldest = cached('a' * 64, age=30)
+    middle = cached('b' * 64, age=20)
+    newest = cached('c' * 64, age=10)
+    (cache / 'notes.txt').write_bytes(b'x' * 100)
+    # A lookup makes the oldest the most recently used
+    pdf_cache.lookup('a' * 64)
+
+    pdf_cache.evict()
+
+    assert os.path.exists(oldest) and os.path.exists(newest)
+    assert not os.path.exists(middle)
+    assert (cache / 'notes.txt').exists()
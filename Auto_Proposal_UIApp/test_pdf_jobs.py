@@ -0,0 +1,162 @@
+"""
+PDF jobs: renders into the cache, joining a running render, failures, and
+jobs seen from another process through the SQLite table.
+
+Run with: python -m pytest test_pdf_jobs.py
+"""
+import threading
+import time
+
+import pytest
+
+import pdf_cache
+import pdf_jobs
+
+KEY = 'a' * 64
+
+
+class Response:
+    def __init__(self, status_code=200, content=b'%PDF-1.4 rendered', text=''):
+        self.status_code = status_code
+        self.content = content
+        self.text = text
+
+
+class Backend:
+    """Stands in for backend_client.post; a render blocks until release() when gated."""
+
+    def __init__(self):
+        self.calls = []
+        self.response = Response()
+        self.gate = None
+
+    def post(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        if self.gate is not None:
+            assert self.gate.wait(10)
+        return self.response
+
+    def hold(self):
+        self.gate = threading.Event()
+
+    def release(self):
+        self.gate.set()
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    fake = Backend()
+    monkeypatch.setattr(pdf_jobs.backend, 'post', fake.post)
+    monkeypatch.setattr(pdf_jobs, 'DB_PATH', str(tmp_path / 'pdf_jobs.db'))
+    monkeypatch.setattr(pdf_jobs, '_initialized', False)
+    monkeypatch.setattr(pdf_cache, 'CACHE_DIR', str(tmp_path))
+    yield fake
+    if fake.gate is not None:
+        fake.release()
+    # Renders still running would finish into the next test's table
+    for finished in list(pdf_jobs._finished.values()):
+        finished.wait(10)
+
+
+def submit(key=KEY, company=None):
+    return pdf_jobs.submit(key, 'Proposal.pdf', f'/pdf/{key}', '/api/proposals/1/pdf', company or {},
+                           headers={'Authorization': 'Bearer t'})
+
+
+def test_render_is_written_to_the_cache(backend):
+    job = submit()
+    assert job['status'] in ('queued', 'running')
+    assert job['pdf_url'] is None
+
+    done = pdf_jobs.wait(job['job_id'], timeout=10)
+
+    assert done['status'] == 'completed'
+    assert done['pdf_url'] == f'/pdf/{KEY}'
+    assert done['error'] is None and done['finished_at'] is not None
+    with open(pdf_cache.lookup(KEY), 'rb') as f:
+        assert f.read() == b'%PDF-1.4 rendered'
+    url, kwargs = backend.calls[0]
+    assert url == '/api/proposals/1/pdf'
+    assert kwargs['headers'] == {'Authorization': 'Bearer t'}
+    assert 'files' not in kwargs
+
+
+def test_same_key_joins_the_running_render(backend):
+    backend.hold()
+    first = submit()
+    second = submit()
+    other = submit('b' * 64)
+    assert second['job_id'] == first['job_id']
+    assert other['job_id'] != first['job_id']
+
+    backend.release()
+    assert pdf_jobs.wait(first['job_id'], timeout=10)['status'] == 'completed'
+    assert pdf_jobs.wait(other['job_id'], timeout=10)['status'] == 'completed'
+    assert len(backend.calls) == 2
+
+    # Once finished, the key renders again
+    assert submit()['job_id'] != first['job_id']
+
+
+def test_backend_error_fails_the_job(backend):
+    backend.response = Response(status_code=500, text='boom')
+
+    job = pdf_jobs.wait(submit()['job_id'], timeout=10)
+
+    assert job['status'] == 'failed'
+    assert '500' in job['error'] and 'boom' in job['error']
+    assert job['pdf_url'] is None
+    assert pdf_cache.lookup(KEY) is None
+
+
+def test_logo_is_sent_when_stored_here(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_cache, 'IMAGE_FOLDER', str(tmp_path))
+    (tmp_path / 'logo.png').write_bytes(b'png')
+
+    pdf_jobs.wait(submit(company={'logo_url': '/image/logo.png'})['job_id'], timeout=10)
+
+    name, _ = backend.calls[0][1]['files']['logo']
+    assert name == 'logo.png'
+
+
+def test_unknown_job_is_none(backend):
+    assert pdf_jobs.get('missing') is None
+    assert pdf_jobs.wait('missing', timeout=0) is None
+
+
+def test_job_of_another_process_is_seen_and_joined(backend, monkeypatch):
+    monkeypatch.setattr(pdf_jobs, 'POLL_SECONDS', 0.01)
+    backend.hold()
+    job = submit()
+    # This process forgets the job, as another process would not know it
+    finished = pdf_jobs._finished.pop(job['job_id'])
+
+    assert pdf_jobs.get(job['job_id'])['status'] in ('queued', 'running')
+    assert submit()['job_id'] == job['job_id']
+    assert pdf_jobs.wait(job['job_id'], timeout=0.05)['status'] in ('queued', 'running')
+
+    backend.release()
+    assert pdf_jobs.wait(job['job_id'], timeout=10)['status'] == 'completed'
+    assert not finished.is_set()
+
+
+def test_abandoned_job_is_failed_and_rendered_again(backend, monkeypatch):
+    with pdf_jobs._db() as db:
+        db.execute("INSERT INTO pdf_jobs (id, key, status, pdf_url, created_at) VALUES ('dead', ?, 'running', '/x', ?)",
+                   (KEY, time.time() - pdf_jobs.STALE_SECONDS - 1))
+
+    dead = pdf_jobs.get('dead')
+    assert dead['status'] == 'failed' and 'Abandoned' in dead['error']
+
+    job = submit()
+    assert job['job_id'] != 'dead'
+    assert pdf_jobs.wait(job['job_id'], timeout=10)['status'] == 'completed'
+
+
+def test_expired_jobs_are_purged(backend, monkeypatch):
+    old = pdf_jobs.wait(submit()['job_id'], timeout=10)
+    monkeypatch.setattr(pdf_jobs, 'RETENTION_SECONDS', -1)
+
+    submit('b' * 64)
+
+    assert pdf_jobs.get(old['job_id']) is None
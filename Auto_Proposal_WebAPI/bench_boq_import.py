@@ -0,0 +1,158 @@
+"""
+Benchmark: BOQ Excel import, whole-sheet pandas + per-row ORM vs the streaming importer.
+
+A synthetic .xlsx is written with openpyxl (write-only) and imported into a
+temporary SQLite file twice:
+
+- legacy: pd.read_excel of the whole sheet, iterrows(), one ORM object per
+  row, commit, then one refresh (SELECT) per row to learn its SNo
+- streaming: services.boq_import.import_items (openpyxl read-only, chunked
+  column-wise cleaning, one multi-row INSERT ... RETURNING per chunk)
+
+Timings come from an untraced run. With --memory each import is repeated
+under tracemalloc to report the peak Python heap (tracing is several times
+slower, so expect the memory pass to take much longer).
+
+    python bench_boq_import.py --rows 10000 100000
+    python bench_boq_import.py --rows 100000 --skip-legacy --memory
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+# The database module validates these at import time; it is not used here
+os.environ.setdefault("DB_USER", "bench")
+os.environ.setdefault("DB_PASSWORD", "bench")
+os.environ.setdefault("DB_NAME", "bench")
+
+import openpyxl
+import pandas as pd
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from auto_proposal.core import models
+from auto_proposal.services import boq_import
+
+HEADER = ["ProjectType", "Title", "Description", "Unit", "BasicRate", "PremiumRate"]
+PROJECT_TYPES = ["Office", "Residential", "Commercial", "Saloon", "Other"]
+
+
+def build_workbook(rows: int) -> bytes:
+    rng = random.Random(42)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(HEADER)
+    for i in range(rows):
+        # About 5% of the rows have no rate and are rejected
+        rate = None if i % 20 == 0 else rng.randint(50, 5000)
+        sheet.append([rng.choice(PROJECT_TYPES), f"Item {i}", f"Supply and fix item {i} with frame",
+                      "sqft", rate, rate and rate * 1.2])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+async def legacy_import(db: AsyncSession, contents: bytes, company_id: int) -> int:
+    df = pd.read_excel(io.BytesIO(contents))
+    df = df[df['Description'].notna() & (df['BasicRate'].notna() | df['PremiumRate'].notna())]
+    df = df.where(pd.notna(df), None)
+
+    saved_items = []
+    for _, row in df.iterrows():
+        db_item = models.PseApBoqItems(
+            company_id=company_id,
+            project_type=row.get('ProjectType'),
+            title=row.get('Title'),
+            description=row.get('Description'),
+            unit=row.get('Unit'),
+            basic_rate=float(row['BasicRate']) if pd.notna(row.get('BasicRate')) else None,
+            premium_rate=float(row['PremiumRate']) if pd.notna(row.get('PremiumRate')) else None
+        )
+        db.add(db_item)
+        saved_items.append(db_item)
+    await db.commit()
+    for item in saved_items:
+        await db.refresh(item)
+    return len(saved_items)
+
+
+async def streaming_import(db: AsyncSession, contents: bytes, company_id: int) -> int:
+    result = await boq_import.import_items(db, io.BytesIO(contents), "bench.xlsx", company_id)
+    await db.commit()
+    return result["total_imported"]
+
+
+def run(importer, contents: bytes, trace_memory: bool = False):
+    """Import into a fresh database; return (seconds, peak MiB or None, imported, rows in table)."""
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        company = models.CompanyDetails(company_name="Bench Co")
+        db.add(company)
+        db.commit()
+        company_id = company.id
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    sessions = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def go():
+        async with sessions() as db:
+            return await importer(db, contents, company_id)
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    imported = asyncio.run(go())
+    elapsed = time.perf_counter() - start
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    asyncio.run(async_engine.dispose())
+
+    with Session(engine) as db:
+        stored = db.execute(select(func.count()).select_from(models.PseApBoqItems)).scalar()
+    engine.dispose()
+    return elapsed, peak, imported, stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the streaming importer")
+    parser.add_argument("--memory", action="store_true", help="Also measure the peak heap with tracemalloc")
+    args = parser.parse_args()
+
+    print("=" * 78)
+    print(f"BOQ Excel import (SQLite, chunk size {boq_import.CHUNK_SIZE})")
+    print("=" * 78)
+    print(f"{'rows':>10}{'path':>12}{'seconds':>10}{'peak MiB':>11}{'imported':>11}{'stored':>10}")
+
+    for rows in args.rows:
+        contents = build_workbook(rows)
+        paths = [("streaming", streaming_import)]
+        if not args.skip_legacy:
+            paths.insert(0, ("legacy", legacy_import))
+        for name, importer in paths:
+            elapsed, _, imported, stored = run(importer, contents)
+            peak = f"{run(importer, contents, trace_memory=True)[1]:.1f}" if args.memory else "-"
+            print(f"{rows:>10,}{name:>12}{elapsed:>10.2f}{peak:>11}{imported:>11,}{stored:>10,}")
+
+    if args.memory:
+        print("\nPeak is the Python heap (tracemalloc) and excludes the uploaded file itself.")
+
+
+if __name__ == "__main__":
+    main()
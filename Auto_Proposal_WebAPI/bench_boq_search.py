@@ -0,0 +1,138 @@
+"""
+Benchmark: BOQ catalog search, double LIKE '%q%' vs the in-process search index.
+
+For each catalog size a synthetic catalog is seeded into one company of a
+temporary SQLite file. The script then times:
+
+- the old query: title LIKE '%q%' OR description LIKE '%q%' (no limit)
+- building the in-process inverted/trigram index for the company
+- ranked searches on the index (page of 50)
+
+MySQL FULLTEXT is not exercised here; run the API against MySQL for that.
+
+    python bench_boq_search.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+# The database module validates these at import time; it is not used here
+os.environ.setdefault("DB_USER", "bench")
+os.environ.setdefault("DB_PASSWORD", "bench")
+os.environ.setdefault("DB_NAME", "bench")
+
+from sqlalchemy import create_engine, insert, or_, select
+from sqlalchemy.orm import Session
+
+from auto_proposal.core import models
+from auto_proposal.services.boq_search import BoqSearchIndex
+
+MATERIALS = ["gypsum", "plywood", "laminate", "granite", "marble", "vitrified", "ceramic", "teak",
+             "aluminium", "glass", "acrylic", "veneer", "quartz", "cement", "steel", "mdf"]
+WORKS = ["ceiling", "partition", "flooring", "cladding", "skirting", "paneling", "wardrobe",
+         "cabinet", "counter", "door", "window", "railing", "painting", "waterproofing", "tiling"]
+PROJECT_TYPES = ["Office", "Residential", "Commercial", "Saloon", "Other"]
+QUERIES = ["gypsum ceiling", "granite", "lamin", "teak door frame", "glass partition 12mm", "zzz"]
+CHUNK = 50_000
+
+
+def synthetic_rows(count: int, company_id: int, rng: random.Random):
+    # Filler words make a realistic vocabulary of a few thousand tokens
+    filler = [f"spec{i}" for i in range(3000)]
+    for i in range(count):
+        material, work = rng.choice(MATERIALS), rng.choice(WORKS)
+        yield {
+            "company_id": company_id,
+            "project_type": rng.choice(PROJECT_TYPES),
+            "title": f"{material.title()} {work} {rng.randint(6, 25)}mm",
+            "description": " ".join([
+                f"Supply and fix {material} {work} with frame",
+                *rng.sample(filler, 5),
+                rng.choice(MATERIALS), rng.choice(WORKS),
+            ]),
+            "unit": "sqft",
+            "basic_rate": rng.randint(50, 5000),
+        }
+
+
+def seed(engine, count: int) -> int:
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    with Session(engine) as db:
+        company = models.CompanyDetails(company_name="Bench Co")
+        db.add(company)
+        db.flush()
+        batch = []
+        for row in synthetic_rows(count, company.id, rng):
+            batch.append(row)
+            if len(batch) == CHUNK:
+                db.execute(insert(models.PseApBoqItems), batch)
+                batch = []
+        if batch:
+            db.execute(insert(models.PseApBoqItems), batch)
+        db.commit()
+        return company.id
+
+
+def median_ms(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print("=" * 78)
+    print("BOQ search: LIKE scan vs in-process index (SQLite, one company)")
+    print("=" * 78)
+    print(f"{'items':>10}{'LIKE ms':>12}{'rows':>10}{'build s':>10}{'search ms':>12}{'p max ms':>11}")
+
+    for size in args.sizes:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        engine = create_engine(f"sqlite:///{path}")
+        company_id = seed(engine, size)
+        table = models.PseApBoqItems
+
+        with Session(engine) as db:
+            def like_scan(q="gypsum ceiling"):
+                pattern = f"%{q}%"
+                return db.execute(select(table).where(
+                    or_(table.title.like(pattern), table.description.like(pattern))
+                )).scalars().all()
+
+            like_rows = len(like_scan())
+            like_ms = median_ms(like_scan, args.repeat)
+
+            start = time.perf_counter()
+            rows = db.execute(
+                select(table.sno, table.project_type, table.title, table.description)
+                .where(table.company_id == company_id).order_by(table.sno)
+            ).all()
+            index = BoqSearchIndex(rows)
+            build_s = time.perf_counter() - start
+
+        per_query = [median_ms(lambda q=q: index.search(q, limit=50), args.repeat) for q in QUERIES]
+        print(f"{size:>10,}{like_ms:>12.1f}{like_rows:>10,}{build_s:>10.2f}"
+              f"{statistics.median(per_query):>12.2f}{max(per_query):>11.2f}")
+        engine.dispose()
+
+    print("\nLIKE returns every match unranked; the index returns a ranked page of 50.")
+
+
+if __name__ == "__main__":
+    main()
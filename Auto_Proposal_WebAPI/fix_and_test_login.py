@@ -3,17 +3,24 @@ import sys
 sys.path.insert(0, 'src')
 
 from fastapi.testclient import TestClient
+from auto_proposal.api import security
 from auto_proposal.api.main import app
+from auto_proposal.core import models
+from auto_proposal.db.database import SessionLocal
 
 client = TestClient(app)
 
+# set-password needs a token of the user's company; this script has database access, so it signs one
+with SessionLocal() as db:
+    headers = {"Authorization": f"Bearer {security.issue_tokens(db.get(models.UserDetails, 1))['access_token']}"}
+
 print("=" * 60)
 print("Fixing Password Hash and Testing Login")
 print("=" * 60)
 
 # Step 1: Set the password using the API (this will hash it)
 print("\n1. Setting password 'karthi1212' for user 1...")
-response = client.post("/api/auth/set-password/1?password=karthi1212")
+response = client.post("/api/auth/set-password/1?password=karthi1212", headers=headers)
 print(f"   Status: {response.status_code}")
 if response.status_code == 200:
     print(f"   ✓ {response.json()['message']}")
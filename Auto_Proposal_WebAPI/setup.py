@@ -16,6 +16,7 @@ setup(
         "httpx==0.25.1",
         "python-multipart==0.0.6",
         "pymysql==1.1.0",
+        "aiomysql==0.2.0",
         "psycopg2-binary==2.9.9",
         "python-jose==3.3.0",
         "pandas==2.1.2"
@@ -0,0 +1,85 @@
+"""
+Conditional GET support (ETag / Last-Modified / 304) for read endpoints.
+
+The ETag is a strong validator computed from the rows a route loaded: a hash
+of their column values (plus any extra values the response embeds). It is
+computed before the response is serialized, so a matching If-None-Match is
+answered with 304 without running the response model at all. ModifyDate /
+ModifiedDate columns only have one-second resolution in MySQL, so they feed
+Last-Modified but not the ETag.
+
+Every response carries Cache-Control (HTTP_CACHE_CONTROL, default
+"private, no-cache": clients may keep a copy but must revalidate it).
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional
+
+from fastapi import Request, Response, status
+from sqlalchemy import inspect
+
+CACHE_CONTROL = os.getenv("HTTP_CACHE_CONTROL", "private, no-cache")
+
+# Headers that describe the representation and are repeated on a 304
+_PRESERVED_HEADERS = ("x-next-cursor",)
+
+
+def _state(value: Any):
+    """A hashable, deterministic snapshot of ORM rows, lists and dicts."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_state(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _state(item)) for key, item in value.items()))
+    mapper = getattr(inspect(value, raiseerr=False), "mapper", None)
+    if mapper is not None:
+        return (mapper.class_.__name__,) + tuple(getattr(value, attr.key) for attr in mapper.column_attrs)
+    return value
+
+
+def etag_for(*parts: Any) -> str:
+    """Strong ETag of ORM rows (their column values) and plain values."""
+    return '"' + hashlib.sha1(repr(_state(parts)).encode()).hexdigest() + '"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+def _as_utc(moment: datetime) -> datetime:
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+
+
+def not_modified(request: Request, response: Response, etag: str,
+                 last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """
+    Set the validators on response; return a 304 response if the client's copy is current.
+
+    If-None-Match takes precedence; If-Modified-Since is only used without it.
+    """
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_as_utc(last_modified).replace(microsecond=0), usegmt=True)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, etag)
+    else:
+        fresh = False
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and last_modified is not None:
+            try:
+                fresh = _as_utc(last_modified).replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                fresh = False
+
+    if not fresh:
+        return None
+    for name in _PRESERVED_HEADERS:
+        if name in response.headers:
+            headers[name] = response.headers[name]
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
@@ -1,10 +1,11 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 import uvicorn
 
-from .routes import clients, proposals, users, companies, auth, boq_items, proposal_items
+from .routes import clients, proposals, users, companies, auth, boq_items, proposal_items, metrics
+from .security import get_principal
 
 app = FastAPI(
     title="Auto Proposal API",
@@ -19,20 +20,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Mount static files for PDF access
 os.makedirs("pdf_files", exist_ok=True)
 app.mount("/files/proposals", StaticFiles(directory="pdf_files"), name="proposals")
 
-# Include routers
+# Include routers; all but login/refresh take a bearer token (see security.py), metrics its own (METRICS_TOKEN)
+authenticated = [Depends(get_principal)]
 app.include_router(auth.router, prefix="/api")
-app.include_router(clients.router, prefix="/api/clients", tags=["clients"])
-app.include_router(proposals.router, prefix="/api/proposals", tags=["proposals"])
-app.include_router(proposal_items.router)
-app.include_router(users.router)
-app.include_router(companies.router)
-app.include_router(boq_items.router)
+app.include_router(clients.router, prefix="/api/clients", tags=["clients"], dependencies=authenticated)
+app.include_router(proposals.router, prefix="/api/proposals", tags=["proposals"], dependencies=authenticated)
+app.include_router(proposal_items.router, dependencies=authenticated)
+app.include_router(users.router, dependencies=authenticated)
+app.include_router(companies.router, dependencies=authenticated)
+app.include_router(boq_items.router, dependencies=authenticated)
+app.include_router(metrics.router)
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,104 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+A page is requested with an opaque cursor instead of an offset. The cursor
+encodes the sort key of the last row of the previous page, so the next page
+is a range seek on an index rather than an OFFSET scan, and deep pages cost
+the same as the first one. The sort key always ends with the primary key so
+rows sharing a timestamp are neither skipped nor repeated. Nullable sort
+columns are compared with NULL sorting first, as MySQL and SQLite order them;
+a cursor holding NULL for a NOT NULL column is rejected.
+
+The cursor for the next page is returned in the X-Next-Cursor response header;
+it is absent on the last page. Response bodies stay plain lists.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, false, or_, true
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of a row as an opaque URL-safe token."""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> List[Any]:
+    """Decode a cursor back into sort key values typed like the given columns."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor does not match the sort key")
+        if any(value is None and not _nullable(column) for column, value in zip(columns, values)):
+            raise ValueError("cursor has NULL for a NOT NULL column")
+        return [
+            datetime.fromisoformat(value)
+            if value is not None and column.type.python_type is datetime else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def _nullable(column) -> bool:
+    return getattr(column.expression, "nullable", True)
+
+
+def _equal(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def _past(column, value, descending: bool):
+    # NULL is the lowest value: nothing follows it descending, every value follows it ascending
+    if value is None:
+        return false() if descending else column.isnot(None)
+    bound = column < value if descending else column > value
+    return or_(bound, column.is_(None)) if descending and _nullable(column) else bound
+
+
+def _from(column, value, descending: bool):
+    if value is None:
+        return column.is_(None) if descending else true()
+    bound = column <= value if descending else column >= value
+    return or_(bound, column.is_(None)) if descending and _nullable(column) else bound
+
+
+def _after(columns: Sequence, values: Sequence, descending: bool):
+    # (a, b) after (x, y)  ==  a > x OR (a = x AND b > y), flipped for descending
+    clauses = []
+    for i, column in enumerate(columns):
+        clauses.append(and_(*(_equal(columns[j], values[j]) for j in range(i)), _past(column, values[i], descending)))
+    # The redundant bound on the leading column gives the planner an index range to seek
+    return and_(_from(columns[0], values[0], descending), or_(*clauses))
+
+
+def keyset(query, columns: Sequence, cursor: Optional[str], limit: int, descending: bool = False):
+    """
+    Order a select()/Query by the sort key and seek past the cursor.
+
+    Fetches one extra row so finish_page can tell whether another page exists.
+    """
+    if cursor:
+        query = query.where(_after(columns, decode_cursor(cursor, columns), descending))
+    order = [column.desc() if descending else column.asc() for column in columns]
+    return query.order_by(*order).limit(limit + 1)
+
+
+def finish_page(rows: Sequence, limit: int, response: Response, key: Callable[[Any], Sequence[Any]]) -> list:
+    """Trim the look-ahead row and set X-Next-Cursor if there is a next page."""
+    rows = list(rows)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(key(rows[-1]))
+    return rows
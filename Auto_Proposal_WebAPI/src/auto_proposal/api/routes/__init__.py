@@ -1,3 +1,3 @@
-from . import clients, proposals, users, companies, auth, boq_items, proposal_items
+from . import clients, proposals, users, companies, auth, boq_items, proposal_items, metrics
 
-__all__ = ["clients", "proposals", "users", "companies", "auth", "boq_items", "proposal_items"]
+__all__ = ["clients", "proposals", "users", "companies", "auth", "boq_items", "proposal_items", "metrics"]
@@ -1,16 +1,33 @@
 """
 Authentication routes for login and user verification
 """
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
 import bcrypt
 
-from ...db.database import get_db
+from ...db.database import get_db, get_async_db
 from ...core import models, schemas
+from .. import security
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+# bcrypt is deliberately slow (~250 ms of CPU per check). By default checks run
+# on the threadpool (0). A positive value runs them on that many processes, so
+# they can use other cores; on a single core that is slower (bench_login.py:
+# 2.6 logins/s with 2 processes vs 3.0 on the threadpool), so it is opt-in.
+PASSWORD_WORKERS = int(os.getenv("AUTH_PASSWORD_WORKERS", "0"))
+
+_password_pool: Optional[ProcessPoolExecutor] = None
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash."""
@@ -32,10 +49,22 @@ def hash_password(password: str) -> str:
     return bcrypt.hashpw(password_bytes, salt).decode('utf-8')
 
 
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    """verify_password() on the password pool."""
+    global _password_pool
+    if PASSWORD_WORKERS <= 0:
+        return await run_in_threadpool(verify_password, plain_password, hashed_password)
+    if _password_pool is None:
+        _password_pool = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS)
+    return await asyncio.get_running_loop().run_in_executor(
+        _password_pool, verify_password, plain_password, hashed_password
+    )
+
+
 @router.post("/login", response_model=schemas.LoginResponse, status_code=status.HTTP_200_OK)
-def login(
+async def login(
     login_data: schemas.LoginRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Login endpoint with comprehensive validation.
@@ -53,12 +82,17 @@ def login(
     - Error response with specific validation failure message
     """
     
-    # Step 1: Validate company exists
-    company = db.query(models.CompanyDetails).filter(
-        models.CompanyDetails.company_name == login_data.company_name
-    ).first()
+    # Companies with this name, each with the user with this email (if any),
+    # in one query; the user's own company comes first
+    rows = (await db.execute(
+        select(models.CompanyDetails, models.UserDetails)
+        .outerjoin(models.UserDetails, models.UserDetails.email == login_data.email)
+        .where(models.CompanyDetails.company_name == login_data.company_name)
+    )).all()
+    rows.sort(key=lambda row: row[1] is None or row[1].company_id != row[0].id)
     
-    if not company:
+    # Step 1: Validate company exists
+    if not rows:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail={
@@ -67,12 +101,9 @@ def login(
                 "error_code": "INVALID_COMPANY"
             }
         )
+    company, user = rows[0]
     
     # Step 2: Validate user exists with the provided email
-    user = db.query(models.UserDetails).filter(
-        models.UserDetails.email == login_data.email
-    ).first()
-    
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -105,7 +136,7 @@ def login(
             }
         )
     
-    if not verify_password(login_data.password, user.password_hash):
+    if not await check_password(login_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={
@@ -152,29 +183,72 @@ def login(
         if days_remaining <= 7:
             access_message = f"Login successful. Access expires in {days_remaining} days."
     
-    # Load user with company details
-    user_with_company = db.query(models.UserDetails).filter(
-        models.UserDetails.id == user.id
-    ).first()
+    # The user's company is the one loaded above
+    user_with_company = schemas.UserDetailsWithCompany.model_validate(user)
+    user_with_company.company = schemas.CompanyDetailsResponse.model_validate(company)
     
     return schemas.LoginResponse(
         success=True,
         message=access_message,
         user=user_with_company,
         access_granted=access_granted,
-        access_end_date=user.auto_proposal_access_end_date
+        access_end_date=user.auto_proposal_access_end_date,
+        **security.issue_tokens(user)
     )
 
 
+@router.post("/refresh", response_model=schemas.TokenResponse, status_code=status.HTTP_200_OK)
+async def refresh(
+    refresh_data: schemas.RefreshRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Exchange a refresh token for a new access and refresh token.
+    
+    The user is checked again (still exists, active, access not expired), so
+    role, company and access changes take effect here.
+    """
+    principal = security.decode_token(refresh_data.refresh_token, "refresh")
+    
+    user = await db.get(models.UserDetails, principal.user_id)
+    if not user or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={
+                "success": False,
+                "message": "User not found or deactivated",
+                "error_code": "INVALID_USER"
+            },
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    
+    access_end_date = user.auto_proposal_access_end_date
+    if isinstance(access_end_date, datetime):
+        access_end_date = access_end_date.date()
+    if access_end_date and datetime.now().date() > access_end_date:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={
+                "success": False,
+                "message": f"Access expired on {access_end_date}. Please renew subscription.",
+                "error_code": "ACCESS_EXPIRED"
+            }
+        )
+    
+    return security.issue_tokens(user)
+
+
 @router.post("/set-password/{user_id}", status_code=status.HTTP_200_OK)
 def set_password(
     user_id: int,
     password: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    principal: security.Principal = Depends(security.require_principal)
 ):
     """
     Set or update password for a user.
-    This is a utility endpoint for testing/admin purposes.
+    This is a utility endpoint for testing/admin purposes; the caller must be
+    signed in to the user's company.
     """
     user = db.query(models.UserDetails).filter(models.UserDetails.id == user_id).first()
     
@@ -183,6 +257,7 @@ def set_password(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
+    security.authorize_company(principal, user.company_id)
     
     user.password_hash = hash_password(password)
     db.commit()
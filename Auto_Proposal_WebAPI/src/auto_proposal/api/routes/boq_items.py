@@ -1,27 +1,59 @@
 """
 BOQ Items API routes - Add, Edit, Delete operations for PseApBoqItems
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response, UploadFile, File
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
-import pandas as pd
-import io
 
-from ...db.database import get_db
+from ...db.database import get_async_db
 from ...core import models, schemas
+from ...services import boq_catalog, boq_import, boq_search, import_jobs
+from ..pagination import keyset, finish_page, decode_cursor
+from ..http_cache import etag_for, not_modified
+from ..security import Principal, get_principal, require_company, authorize_company
 
 router = APIRouter(prefix="/api/boq-items", tags=["BOQ Items"])
 
 
+async def commit_catalog_change(db: AsyncSession, *company_ids: Optional[int]):
+    """Commit a created/updated item; its RowHash is unique per company."""
+    try:
+        for company_id in set(company_ids):
+            await boq_import.forget_imported_files(db, company_id)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="An identical BOQ item already exists for this company"
+        )
+
+
+async def _get_item(db: AsyncSession, sno: int, principal: Optional[Principal]) -> models.PseApBoqItems:
+    """The item, 404 if missing and 403 if it belongs to another company."""
+    item = await db.get(models.PseApBoqItems, sno)
+    if not item:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"BOQ item with SNo {sno} not found"
+        )
+    authorize_company(principal, item.company_id)
+    return item
+
+
 @router.post("/", response_model=schemas.BoqItemResponse, status_code=status.HTTP_201_CREATED)
-def create_boq_item(
+async def create_boq_item(
     item: schemas.BoqItemCreate,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new BOQ (Bill of Quantities) item.
     
-    - **company_id**: Company ID (optional)
+    - **company_id**: Company ID (optional, defaults to the caller's company)
     - **project_type**: Type of project (e.g., "Residential", "Commercial")
     - **title**: Item title/name
     - **description**: Detailed description of the item
@@ -29,8 +61,13 @@ def create_boq_item(
     - **basic_rate**: Basic rate per unit
     - **premium_rate**: Premium rate per unit
     """
+    authorize_company(principal, item.company_id)
+    company_id = item.company_id
+    if company_id is None and principal is not None:
+        company_id = principal.company_id
+    
     db_item = models.PseApBoqItems(
-        company_id=item.company_id,
+        company_id=company_id,
         project_type=item.project_type,
         title=item.title,
         description=item.description,
@@ -38,46 +75,73 @@ def create_boq_item(
         basic_rate=item.basic_rate,
         premium_rate=item.premium_rate
     )
+    db_item.row_hash = boq_import.item_hash(db_item)
     
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    await commit_catalog_change(db, db_item.company_id)
+    await db.refresh(db_item)
+    boq_search.invalidate(db_item.company_id)
+    await boq_catalog.invalidate(db_item.company_id)
     
     return db_item
 
 
 @router.get("/", response_model=List[schemas.BoqItemResponse])
-def get_boq_items(
-    skip: int = Query(0, ge=0),
+async def get_boq_items(
+    request: Request,
+    skip: int = Query(0, ge=0, deprecated=True),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     limit: int = Query(100, ge=1, le=500),
     company_id: Optional[int] = None,
     project_type: Optional[str] = None,
-    db: Session = Depends(get_db)
+    response: Response = None,
+    principal: Optional[Principal] = Depends(require_company),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all BOQ items with optional filtering.
     
-    - **skip**: Number of records to skip (pagination)
+    - **cursor**: Opaque cursor from the X-Next-Cursor header of the previous page
+    - **skip**: Number of records to skip (deprecated, use cursor)
     - **limit**: Maximum number of records to return
-    - **company_id**: Filter by company ID
+    - **company_id**: Filter by company ID (defaults to the caller's company)
     - **project_type**: Filter by project type
+    
+    With company_id the rows come from the BOQ catalog cache.
     """
-    query = db.query(models.PseApBoqItems)
+    if company_id is None and principal is not None:
+        company_id = principal.company_id
+    
+    if company_id:
+        cached = await boq_catalog.items(db, company_id, project_type or None)
+        if cached is not None:
+            after = decode_cursor(cursor, (models.PseApBoqItems.sno,))[0] if cursor else None
+            rows = finish_page(boq_catalog.page(cached, after, skip, limit), limit, response,
+                               lambda item: (item["sno"],))
+            unchanged = not_modified(request, response, etag_for(rows))
+            return rows if unchanged is None else unchanged
+    
+    query = select(models.PseApBoqItems)
     
     if company_id:
-        query = query.filter(models.PseApBoqItems.company_id == company_id)
+        query = query.where(models.PseApBoqItems.company_id == company_id)
     
     if project_type:
-        query = query.filter(models.PseApBoqItems.project_type == project_type)
+        query = query.where(models.PseApBoqItems.project_type == project_type)
     
-    items = query.offset(skip).limit(limit).all()
-    return items
+    query = keyset(query, (models.PseApBoqItems.sno,), cursor, limit)
+    result = await db.execute(query.offset(skip))
+    rows = finish_page(result.scalars().all(), limit, response, lambda item: (item.sno,))
+    unchanged = not_modified(request, response, etag_for(rows))
+    return rows if unchanged is None else unchanged
 
 
-@router.get("/project-types/{company_id}", response_model=List[str])
-def get_project_types_by_company(
+@router.get("/project-types/{company_id}", response_model=List[str], dependencies=[Depends(require_company)])
+async def get_project_types_by_company(
     company_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get distinct project types for a specific company.
@@ -86,86 +150,79 @@ def get_project_types_by_company(
     
     Returns a list of unique project types available for the company.
     """
-    # Query to get distinct project types
-    project_types = db.query(models.PseApBoqItems.project_type)\
-        .filter(models.PseApBoqItems.company_id == company_id)\
-        .filter(models.PseApBoqItems.project_type.isnot(None))\
-        .distinct()\
-        .all()
-    
-    # Extract the project type values from tuples
-    result = [pt[0] for pt in project_types if pt[0]]
-    
-    return result
+    types = await boq_catalog.project_types(db, company_id)
+    unchanged = not_modified(request, response, etag_for(types))
+    return types if unchanged is None else unchanged
 
 
 @router.get("/{sno}", response_model=schemas.BoqItemResponse)
-def get_boq_item(
+async def get_boq_item(
     sno: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a specific BOQ item by SNo (Serial Number).
     """
-    item = db.query(models.PseApBoqItems).filter(models.PseApBoqItems.sno == sno).first()
+    item = await _get_item(db, sno, principal)
     
-    if not item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"BOQ item with SNo {sno} not found"
-        )
+    unchanged = not_modified(request, response, etag_for(item))
+    if unchanged is not None:
+        return unchanged
     
     return item
 
 
 @router.put("/{sno}", response_model=schemas.BoqItemResponse)
-def update_boq_item(
+async def update_boq_item(
     sno: int,
     item_update: schemas.BoqItemUpdate,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update a BOQ item.
     
     Only provided fields will be updated. Fields set to None will be ignored.
     """
-    db_item = db.query(models.PseApBoqItems).filter(models.PseApBoqItems.sno == sno).first()
+    db_item = await _get_item(db, sno, principal)
     
-    if not db_item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"BOQ item with SNo {sno} not found"
-        )
+    previous_company_id = db_item.company_id
     
     # Update only provided fields
     update_data = item_update.model_dump(exclude_unset=True)
+    if "company_id" in update_data:
+        authorize_company(principal, update_data["company_id"])
     for field, value in update_data.items():
         setattr(db_item, field, value)
+    db_item.row_hash = boq_import.item_hash(db_item)
     
-    db.commit()
-    db.refresh(db_item)
+    await commit_catalog_change(db, previous_company_id, db_item.company_id)
+    await db.refresh(db_item)
+    boq_search.invalidate(previous_company_id, db_item.company_id)
+    await boq_catalog.invalidate(previous_company_id, db_item.company_id)
     
     return db_item
 
 
 @router.delete("/{sno}", status_code=status.HTTP_200_OK)
-def delete_boq_item(
+async def delete_boq_item(
     sno: int,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Delete a BOQ item by SNo.
     """
-    db_item = db.query(models.PseApBoqItems).filter(models.PseApBoqItems.sno == sno).first()
+    db_item = await _get_item(db, sno, principal)
     
-    if not db_item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"BOQ item with SNo {sno} not found"
-        )
-    
-    db.delete(db_item)
-    db.commit()
+    await db.delete(db_item)
+    await boq_import.forget_imported_files(db, db_item.company_id)
+    await db.commit()
+    boq_search.invalidate(db_item.company_id)
+    await boq_catalog.invalidate(db_item.company_id)
     
     return {
         "success": True,
@@ -173,25 +230,34 @@ def delete_boq_item(
     }
 
 
-@router.get("/search/", response_model=List[schemas.BoqItemResponse])
-def search_boq_items(
+@router.get("/search/", response_model=List[schemas.BoqItemResponse], dependencies=[Depends(require_company)])
+async def search_boq_items(
     query: str = Query(..., min_length=1),
-    db: Session = Depends(get_db)
+    company_id: int = Query(..., description="Company whose catalog is searched"),
+    project_type: Optional[str] = Query(None, description="Restrict to one project type"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    request: Request = None,
+    response: Response = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Search BOQ items by title or description.
-    """
-    search_pattern = f"%{query}%"
+    Search a company's BOQ items by title and description.
     
-    items = db.query(models.PseApBoqItems).filter(
-        (models.PseApBoqItems.title.like(search_pattern)) |
-        (models.PseApBoqItems.description.like(search_pattern))
-    ).all()
+    - **query**: Words to search for; every word must match (partial words allowed)
+    - **company_id**: Company ID (required)
+    - **project_type**: Filter by project type
+    - **skip**: Number of results to skip (pagination)
+    - **limit**: Maximum number of results to return
     
-    return items
+    Results are ranked by relevance, title matches first.
+    """
+    results = await boq_search.search(db, company_id, query, project_type, skip, limit)
+    unchanged = not_modified(request, response, etag_for(results))
+    return results if unchanged is None else unchanged
 
 
-@router.post("/import-excel/preview")
+@router.post("/import-excel/preview", dependencies=[Depends(require_company)])
 async def preview_excel_import(
     file: UploadFile = File(...),
     company_id: Optional[int] = Query(None)
@@ -208,155 +274,118 @@ async def preview_excel_import(
     - BasicRate (at least one of BasicRate or PremiumRate required)
     - PremiumRate (at least one of BasicRate or PremiumRate required)
     """
-    if not file.filename.endswith(('.xlsx', '.xls')):
+    try:
+        result = await boq_import.preview(file.file, file.filename, company_id)
+    except boq_import.BoqImportError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File must be an Excel file (.xlsx or .xls)"
+            detail=str(e)
         )
-    
-    try:
-        # Read Excel file
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        # Expected columns mapping
-        column_mapping = {
-            'ProjectType': 'project_type',
-            'Title': 'title',
-            'Description': 'description',
-            'Unit': 'unit',
-            'BasicRate': 'basic_rate',
-            'PremiumRate': 'premium_rate'
-        }
-        
-        # Check if required columns exist
-        missing_columns = [col for col in column_mapping.keys() if col not in df.columns]
-        if missing_columns:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Missing required columns: {', '.join(missing_columns)}"
-            )
-        
-        # Filter rows: Description must have value AND (BasicRate OR PremiumRate must have value)
-        df = df[
-            df['Description'].notna() & 
-            (df['BasicRate'].notna() | df['PremiumRate'].notna())
-        ]
-        
-        # Replace NaN with None for optional fields
-        df = df.where(pd.notna(df), None)
-        
-        # Prepare preview data
-        preview_items = []
-        for _, row in df.iterrows():
-            item = {
-                'company_id': company_id,
-                'project_type': row.get('ProjectType'),
-                'title': row.get('Title'),
-                'description': row.get('Description'),
-                'unit': row.get('Unit'),
-                'basic_rate': float(row['BasicRate']) if pd.notna(row.get('BasicRate')) else None,
-                'premium_rate': float(row['PremiumRate']) if pd.notna(row.get('PremiumRate')) else None
-            }
-            preview_items.append(item)
-        
-        return {
-            "success": True,
-            "total_rows": len(preview_items),
-            "message": f"Found {len(preview_items)} valid rows to import",
-            "items": preview_items
-        }
-        
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing Excel file: {str(e)}"
+            detail=f"Error reading Excel file: {str(e)}"
         )
+    
+    preview_items = result["items"]
+    return {
+        "success": True,
+        "total_rows": len(preview_items),
+        "rejected_rows": result["rejected"],
+        "message": f"Found {len(preview_items)} valid rows to import",
+        "items": preview_items
+    }
 
 
-@router.post("/import-excel/save")
+@router.post("/import-excel/save", dependencies=[Depends(require_company)])
 async def save_excel_import(
     file: UploadFile = File(...),
     company_id: int = Query(..., description="Company ID for the BOQ items"),
-    db: Session = Depends(get_db)
+    include_items: bool = Query(True, description="Return the imported items; pass false for large sheets"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Import and save BOQ items from Excel file to database.
     Only imports rows where Description AND (BasicRate OR PremiumRate) have values.
+    
+    Rows already in the catalog (same project type, title, description and
+    unit) get their rates updated instead of being duplicated. Re-uploading
+    an identical file is a no-op (already_imported=true).
+    
+    The sheet is streamed and inserted in chunks within a single transaction,
+    so large files import with bounded memory.
     """
-    if not file.filename.endswith(('.xlsx', '.xls')):
+    try:
+        result = await boq_import.import_items(db, file.file, file.filename, company_id, include_items)
+        await db.commit()
+    except boq_import.BoqImportError as e:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File must be an Excel file (.xlsx or .xls)"
+            detail=str(e)
         )
-    
-    try:
-        # Read Excel file
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        # Expected columns
-        required_columns = ['ProjectType', 'Title', 'Description', 'Unit', 'BasicRate', 'PremiumRate']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Missing required columns: {', '.join(missing_columns)}"
-            )
-        
-        # Filter valid rows
-        df = df[
-            df['Description'].notna() & 
-            (df['BasicRate'].notna() | df['PremiumRate'].notna())
-        ]
-        
-        # Replace NaN with None
-        df = df.where(pd.notna(df), None)
-        
-        # Save items to database
-        saved_items = []
-        for _, row in df.iterrows():
-            db_item = models.PseApBoqItems(
-                company_id=company_id,
-                project_type=row.get('ProjectType'),
-                title=row.get('Title'),
-                description=row.get('Description'),
-                unit=row.get('Unit'),
-                basic_rate=float(row['BasicRate']) if pd.notna(row.get('BasicRate')) else None,
-                premium_rate=float(row['PremiumRate']) if pd.notna(row.get('PremiumRate')) else None
-            )
-            db.add(db_item)
-            saved_items.append(db_item)
-        
-        db.commit()
-        
-        # Refresh all items to get their IDs
-        for item in saved_items:
-            db.refresh(item)
-        
-        return {
-            "success": True,
-            "message": f"Successfully imported {len(saved_items)} BOQ items",
-            "total_imported": len(saved_items),
-            "items": [
-                {
-                    "sno": item.sno,
-                    "company_id": item.company_id,
-                    "project_type": item.project_type,
-                    "title": item.title,
-                    "description": item.description,
-                    "unit": item.unit,
-                    "basic_rate": item.basic_rate,
-                    "premium_rate": item.premium_rate
-                }
-                for item in saved_items
-            ]
-        }
-        
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error importing Excel file: {str(e)}"
         )
+    
+    boq_search.invalidate(company_id)
+    await boq_catalog.invalidate(company_id)
+    
+    if result["already_imported"]:
+        message = "This file was already imported; nothing changed"
+    else:
+        message = (f"Successfully imported {result['total_imported']} BOQ items: "
+                   f"{result['total_inserted']} new, {result['total_updated']} updated, "
+                   f"{result['total_unchanged']} unchanged")
+    return {
+        "success": True,
+        "message": message,
+        **result
+    }
 
+
+@router.post("/import-jobs", response_model=schemas.ImportJobResponse, status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_company)])
+async def submit_import_job(
+    file: UploadFile = File(...),
+    company_id: int = Query(..., description="Company ID for the BOQ items")
+):
+    """
+    Queue an Excel import and return immediately with its job.
+    
+    Same rules as import-excel/save. Poll GET /api/boq-items/import-jobs/{job_id}
+    for progress; the request takes the same time whatever the sheet size.
+    """
+    try:
+        return await run_in_threadpool(import_jobs.submit, file.file, file.filename, company_id)
+    except boq_import.BoqImportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+@router.get("/import-jobs/{job_id}", response_model=schemas.ImportJobResponse)
+async def get_import_job(
+    job_id: str,
+    principal: Optional[Principal] = Depends(get_principal)
+):
+    """
+    Status and progress of an import job, for the company that submitted it.
+    
+    - **status**: queued, running, completed or failed
+    - **rows_parsed / rows_inserted / rows_rejected**: running totals, updated per chunk
+    - **error**: why the job failed; nothing is imported in that case
+    """
+    job = await run_in_threadpool(import_jobs.get, job_id)
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Import job {job_id} not found"
+        )
+    authorize_company(principal, job["company_id"])
+    
+    return job
@@ -1,20 +1,25 @@
 """
 ClientDetails API routes - CRUD operations for ClientDetails table
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 
 from ...core import schemas, models
-from ...db.database import get_db
+from ...db.database import get_async_db
+from ..pagination import keyset, finish_page
+from ..http_cache import etag_for, not_modified
+from ..security import Principal, get_principal, require_company, authorize_company
 
 router = APIRouter()
 
 
 @router.post("/", response_model=schemas.ClientDetailsResponse, status_code=status.HTTP_201_CREATED)
-def create_client(
+async def create_client(
     client: schemas.ClientDetailsCreate,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new client.
@@ -26,6 +31,8 @@ def create_client(
     - **contact_address**: Contact address
     - **is_active**: Active status (default: true)
     """
+    authorize_company(principal, client.company_id)
+    
     db_client = models.ClientDetails(
         company_id=client.company_id,
         client_name=client.client_name,
@@ -36,105 +43,126 @@ def create_client(
     )
     
     db.add(db_client)
-    db.commit()
-    db.refresh(db_client)
+    await db.commit()
+    await db.refresh(db_client)
     
     return db_client
 
 
 @router.get("/{client_id}", response_model=schemas.ClientDetailsResponse)
-def get_client_by_id(
+async def get_client_by_id(
     client_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a specific client by Client ID.
+    
+    Supports If-None-Match / If-Modified-Since (304 Not Modified).
     """
-    client = db.query(models.ClientDetails).filter(models.ClientDetails.id == client_id).first()
+    client = await db.get(models.ClientDetails, client_id)
     
     if not client:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Client with ID {client_id} not found"
         )
+    authorize_company(principal, client.company_id)
+    
+    unchanged = not_modified(request, response, etag_for(client), client.modified_date)
+    if unchanged is not None:
+        return unchanged
     
     return client
 
 
-@router.get("/company/{company_id}", response_model=List[schemas.ClientDetailsResponse])
-def get_clients_by_company(
+@router.get("/company/{company_id}", response_model=List[schemas.ClientDetailsResponse], dependencies=[Depends(require_company)])
+async def get_clients_by_company(
     company_id: int,
-    skip: int = Query(0, ge=0),
+    request: Request,
+    skip: int = Query(0, ge=0, deprecated=True),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     limit: int = Query(100, ge=1, le=500),
     is_active: Optional[bool] = Query(None, description="Filter by active status"),
-    db: Session = Depends(get_db)
+    response: Response = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all clients for a specific company.
     
     - **company_id**: Company ID to filter clients
-    - **skip**: Number of records to skip (pagination)
+    - **cursor**: Opaque cursor from the X-Next-Cursor header of the previous page
+    - **skip**: Number of records to skip (deprecated, use cursor)
     - **limit**: Maximum number of records to return
     - **is_active**: Filter by active status (true/false)
     """
-    query = db.query(models.ClientDetails).filter(models.ClientDetails.company_id == company_id)
+    query = select(models.ClientDetails).where(models.ClientDetails.company_id == company_id)
     
     if is_active is not None:
-        query = query.filter(models.ClientDetails.is_active == is_active)
+        query = query.where(models.ClientDetails.is_active == is_active)
     
-    clients = query.offset(skip).limit(limit).all()
+    query = keyset(query, (models.ClientDetails.id,), cursor, limit)
+    result = await db.execute(query.offset(skip))
     
-    return clients
+    rows = finish_page(result.scalars().all(), limit, response, lambda c: (c.id,))
+    unchanged = not_modified(request, response, etag_for(rows))
+    return rows if unchanged is None else unchanged
 
 
 @router.put("/{client_id}", response_model=schemas.ClientDetailsResponse)
-def update_client(
+async def update_client(
     client_id: int,
     client_update: schemas.ClientDetailsUpdate,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update a client's information.
     
     Only provided fields will be updated. Fields set to None will be ignored.
     """
-    db_client = db.query(models.ClientDetails).filter(models.ClientDetails.id == client_id).first()
+    db_client = await db.get(models.ClientDetails, client_id)
     
     if not db_client:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Client with ID {client_id} not found"
         )
+    authorize_company(principal, db_client.company_id)
     
     # Update only provided fields
     update_data = client_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_client, field, value)
     
-    db.commit()
-    db.refresh(db_client)
+    await db.commit()
+    await db.refresh(db_client)
     
     return db_client
 
 
 @router.delete("/{client_id}", status_code=status.HTTP_200_OK)
-def delete_client(
+async def delete_client(
     client_id: int,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Delete a client by Client ID.
     """
-    db_client = db.query(models.ClientDetails).filter(models.ClientDetails.id == client_id).first()
+    db_client = await db.get(models.ClientDetails, client_id)
     
     if not db_client:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Client with ID {client_id} not found"
         )
+    authorize_company(principal, db_client.company_id)
     
-    db.delete(db_client)
-    db.commit()
+    await db.delete(db_client)
+    await db.commit()
     
     return {
         "success": True,
@@ -143,70 +171,84 @@ def delete_client(
 
 
 @router.get("/", response_model=List[schemas.ClientDetailsResponse])
-def get_all_clients(
-    skip: int = Query(0, ge=0),
+async def get_all_clients(
+    request: Request,
+    skip: int = Query(0, ge=0, deprecated=True),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     limit: int = Query(100, ge=1, le=500),
     is_active: Optional[bool] = Query(None, description="Filter by active status"),
-    db: Session = Depends(get_db)
+    response: Response = None,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get all clients across all companies.
+    Get all clients across all companies (only the caller's company with a token).
     
-    - **skip**: Number of records to skip (pagination)
+    - **cursor**: Opaque cursor from the X-Next-Cursor header of the previous page
+    - **skip**: Number of records to skip (deprecated, use cursor)
     - **limit**: Maximum number of records to return
     - **is_active**: Filter by active status
     """
-    query = db.query(models.ClientDetails)
+    query = select(models.ClientDetails)
+    if principal is not None:
+        query = query.where(models.ClientDetails.company_id == principal.company_id)
     
     if is_active is not None:
-        query = query.filter(models.ClientDetails.is_active == is_active)
+        query = query.where(models.ClientDetails.is_active == is_active)
     
-    clients = query.offset(skip).limit(limit).all()
+    query = keyset(query, (models.ClientDetails.id,), cursor, limit)
+    result = await db.execute(query.offset(skip))
     
-    return clients
+    rows = finish_page(result.scalars().all(), limit, response, lambda c: (c.id,))
+    unchanged = not_modified(request, response, etag_for(rows))
+    return rows if unchanged is None else unchanged
 
 
 @router.patch("/{client_id}/activate", response_model=schemas.ClientDetailsResponse)
-def activate_client(
+async def activate_client(
     client_id: int,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Activate a client.
     """
-    db_client = db.query(models.ClientDetails).filter(models.ClientDetails.id == client_id).first()
+    db_client = await db.get(models.ClientDetails, client_id)
     
     if not db_client:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Client with ID {client_id} not found"
         )
+    authorize_company(principal, db_client.company_id)
     
     db_client.is_active = True
-    db.commit()
-    db.refresh(db_client)
+    await db.commit()
+    await db.refresh(db_client)
     
     return db_client
 
 
 @router.patch("/{client_id}/deactivate", response_model=schemas.ClientDetailsResponse)
-def deactivate_client(
+async def deactivate_client(
     client_id: int,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Deactivate a client.
     """
-    db_client = db.query(models.ClientDetails).filter(models.ClientDetails.id == client_id).first()
+    db_client = await db.get(models.ClientDetails, client_id)
     
     if not db_client:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Client with ID {client_id} not found"
         )
+    authorize_company(principal, db_client.company_id)
     
     db_client.is_active = False
-    db.commit()
-    db.refresh(db_client)
+    await db.commit()
+    await db.refresh(db_client)
     
     return db_client
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from ...db.database import get_db
 from ...core import schemas, models
+from ..pagination import keyset, finish_page
+from ..http_cache import etag_for, not_modified
+from ..security import Principal, get_principal, require_company
 
 router = APIRouter(
     prefix="/api/companies",
@@ -37,18 +40,28 @@ def create_company(company: schemas.CompanyDetailsCreate, db: Session = Depends(
 
 @router.get("/", response_model=List[schemas.CompanyDetailsResponse])
 def get_companies(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
+    cursor: str = None,
     is_active: bool = None,
     industry: str = None,
     city: str = None,
+    response: Response = None,
+    principal: Optional[Principal] = Depends(get_principal),
     db: Session = Depends(get_db)
 ):
     """
-    Get all companies with optional filtering
+    Get all companies with optional filtering.
+    
+    Pass the X-Next-Cursor header of a response as **cursor** to get the next page.
+    A signed-in caller only sees their own company.
     """
     query = db.query(models.CompanyDetails)
     
+    if principal is not None:
+        query = query.filter(models.CompanyDetails.id == principal.company_id)
+    
     if is_active is not None:
         query = query.filter(models.CompanyDetails.is_active == is_active)
     
@@ -58,13 +71,17 @@ def get_companies(
     if city:
         query = query.filter(models.CompanyDetails.city == city)
     
-    companies = query.offset(skip).limit(limit).all()
-    return companies
+    query = keyset(query, (models.CompanyDetails.id,), cursor, limit)
+    companies = finish_page(query.offset(skip).all(), limit, response, lambda row: (row.id,))
+    unchanged = not_modified(request, response, etag_for(companies))
+    return companies if unchanged is None else unchanged
 
-@router.get("/{company_id}", response_model=schemas.CompanyDetailsWithUsers)
-def get_company(company_id: int, db: Session = Depends(get_db)):
+@router.get("/{company_id}", response_model=schemas.CompanyDetailsWithUsers, dependencies=[Depends(require_company)])
+def get_company(company_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     """
     Get a specific company by ID with associated users
+    
+    Supports If-None-Match (304 Not Modified).
     """
     company = db.query(models.CompanyDetails).filter(
         models.CompanyDetails.id == company_id
@@ -76,9 +93,15 @@ def get_company(company_id: int, db: Session = Depends(get_db)):
             detail=f"Company with id {company_id} not found"
         )
     
+    # The users are part of the response, so they are part of the ETag (and
+    # the company's UpdatedAt alone is not a valid Last-Modified)
+    unchanged = not_modified(request, response, etag_for(company, company.users))
+    if unchanged is not None:
+        return unchanged
+    
     return company
 
-@router.put("/{company_id}", response_model=schemas.CompanyDetailsResponse)
+@router.put("/{company_id}", response_model=schemas.CompanyDetailsResponse, dependencies=[Depends(require_company)])
 def update_company(
     company_id: int,
     company_update: schemas.CompanyDetailsUpdate,
@@ -120,7 +143,7 @@ def update_company(
     
     return db_company
 
-@router.delete("/{company_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/{company_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(require_company)])
 def delete_company(company_id: int, db: Session = Depends(get_db)):
     """
     Delete a company
@@ -151,7 +174,7 @@ def delete_company(company_id: int, db: Session = Depends(get_db)):
     
     return None
 
-@router.patch("/{company_id}/deactivate", response_model=schemas.CompanyDetailsResponse)
+@router.patch("/{company_id}/deactivate", response_model=schemas.CompanyDetailsResponse, dependencies=[Depends(require_company)])
 def deactivate_company(company_id: int, db: Session = Depends(get_db)):
     """
     Deactivate a company
@@ -172,7 +195,7 @@ def deactivate_company(company_id: int, db: Session = Depends(get_db)):
     
     return db_company
 
-@router.patch("/{company_id}/activate", response_model=schemas.CompanyDetailsResponse)
+@router.patch("/{company_id}/activate", response_model=schemas.CompanyDetailsResponse, dependencies=[Depends(require_company)])
 def activate_company(company_id: int, db: Session = Depends(get_db)):
     """
     Activate a company
@@ -193,8 +216,8 @@ def activate_company(company_id: int, db: Session = Depends(get_db)):
     
     return db_company
 
-@router.get("/{company_id}/users", response_model=List[schemas.UserDetailsResponse])
-def get_company_users(company_id: int, db: Session = Depends(get_db)):
+@router.get("/{company_id}/users", response_model=List[schemas.UserDetailsResponse], dependencies=[Depends(require_company)])
+def get_company_users(company_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     """
     Get all users belonging to a specific company
     """
@@ -213,15 +236,26 @@ def get_company_users(company_id: int, db: Session = Depends(get_db)):
         models.UserDetails.company_id == company_id
     ).all()
     
-    return users
+    unchanged = not_modified(request, response, etag_for(users))
+    return users if unchanged is None else unchanged
 
 @router.get("/search/name/{name}", response_model=List[schemas.CompanyDetailsResponse])
-def search_companies_by_name(name: str, db: Session = Depends(get_db)):
+def search_companies_by_name(
+    name: str,
+    request: Request,
+    response: Response,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: Session = Depends(get_db)
+):
     """
-    Search companies by name (partial match)
+    Search companies by name (partial match); a signed-in caller only finds their own company
     """
-    companies = db.query(models.CompanyDetails).filter(
+    query = db.query(models.CompanyDetails).filter(
         models.CompanyDetails.company_name.ilike(f"%{name}%")
-    ).all()
+    )
+    if principal is not None:
+        query = query.filter(models.CompanyDetails.id == principal.company_id)
+    companies = query.all()
     
-    return companies
+    unchanged = not_modified(request, response, etag_for(companies))
+    return companies if unchanged is None else unchanged
@@ -0,0 +1,53 @@
+"""
+Metrics routes - connection pool and cache statistics in Prometheus text format
+
+A scraper cannot log in, so /metrics takes its own static key: the
+METRICS_TOKEN sent as Authorization: Bearer <METRICS_TOKEN>. Without
+METRICS_TOKEN the route is only open with AUTH_REQUIRED=false (development).
+"""
+import os
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from ...db.pool_metrics import render_prometheus
+from ...services import boq_catalog
+from .. import security
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+router = APIRouter(tags=["Metrics"])
+
+
+def authorize_scrape(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))
+):
+    """401 unless the request carries METRICS_TOKEN (or anonymous access is on and no token is configured)."""
+    if METRICS_TOKEN:
+        if credentials is not None and secrets.compare_digest(credentials.credentials, METRICS_TOKEN):
+            return
+    elif not security.AUTH_REQUIRED:
+        return
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail={"success": False, "message": "Metrics need the METRICS_TOKEN", "error_code": "NOT_AUTHENTICATED"},
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(authorize_scrape)])
+def get_metrics():
+    """
+    Connection pool metrics for the sync and async engines.
+    
+    - **db_pool_checked_out / db_pool_overflow**: current pool occupancy
+    - **db_pool_wait_seconds**: time spent waiting for a connection on checkout
+    - **db_pool_hold_seconds**: time a connection stays checked out
+    - **db_pool_checked_out_at_checkout / db_pool_overflow_at_checkout**: occupancy sampled at each checkout
+    - **boq_catalog_cache_hits_total / boq_catalog_cache_misses_total**: BOQ catalog cache lookups per kind
+    """
+    body = render_prometheus() + boq_catalog.render_prometheus()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
@@ -1,20 +1,49 @@
 """
 ProposalItem API routes - CRUD operations for ProposalItem table
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
 from ...core import schemas, models
-from ...db.database import get_db
+from ...db.database import get_async_db
+from ..http_cache import etag_for, not_modified
+from ..security import Principal, get_principal, authorize_company
 
 router = APIRouter(prefix="/api/proposal-items", tags=["Proposal Items"])
 
 
+async def _get_proposal(db: AsyncSession, proposal_id: int, principal: Optional[Principal]) -> models.Proposal:
+    """The proposal, 404 if missing and 403 if it belongs to another company."""
+    proposal = await db.get(models.Proposal, proposal_id)
+    if not proposal:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Proposal with ID {proposal_id} not found"
+        )
+    authorize_company(principal, proposal.company_id)
+    return proposal
+
+
+async def _get_item(db: AsyncSession, item_id: int, principal: Optional[Principal]) -> models.ProposalItem:
+    """The item, 404 if missing and 403 if its proposal belongs to another company."""
+    item = await db.get(models.ProposalItem, item_id)
+    if not item:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Proposal item with ID {item_id} not found"
+        )
+    proposal = await db.get(models.Proposal, item.proposal_id)
+    authorize_company(principal, proposal.company_id if proposal else None)
+    return item
+
+
 @router.post("/", response_model=schemas.ProposalItemResponse, status_code=status.HTTP_201_CREATED)
-def create_proposal_item(
+async def create_proposal_item(
     item: schemas.ProposalItemCreate,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Add a new item to a proposal.
@@ -28,12 +57,7 @@ def create_proposal_item(
     Note: Total is auto-calculated in the database (Qty * UnitPrice)
     """
     # Verify proposal exists
-    proposal = db.query(models.Proposal).filter(models.Proposal.id == item.proposal_id).first()
-    if not proposal:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Proposal with ID {item.proposal_id} not found"
-        )
+    await _get_proposal(db, item.proposal_id, principal)
     
     db_item = models.ProposalItem(
         proposal_id=item.proposal_id,
@@ -44,16 +68,19 @@ def create_proposal_item(
     )
     
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    await db.refresh(db_item)
     
     return db_item
 
 
 @router.get("/proposal/{proposal_id}", response_model=List[schemas.ProposalItemResponse])
-def get_proposal_items(
+async def get_proposal_items(
     proposal_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all items for a specific proposal.
@@ -61,87 +88,151 @@ def get_proposal_items(
     - **proposal_id**: Proposal ID to get items for
     """
     # Verify proposal exists
-    proposal = db.query(models.Proposal).filter(models.Proposal.id == proposal_id).first()
-    if not proposal:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Proposal with ID {proposal_id} not found"
+    await _get_proposal(db, proposal_id, principal)
+    
+    result = await db.execute(
+        select(models.ProposalItem).where(
+            models.ProposalItem.proposal_id == proposal_id
         )
+    )
+    items = result.scalars().all()
     
-    items = db.query(models.ProposalItem).filter(
-        models.ProposalItem.proposal_id == proposal_id
-    ).all()
+    unchanged = not_modified(request, response, etag_for(items))
+    if unchanged is not None:
+        return unchanged
     
     return items
 
 
+@router.put("/proposal/{proposal_id}/bulk", response_model=schemas.ProposalItemBulkResponse)
+async def bulk_replace_proposal_items(
+    proposal_id: int,
+    payload: schemas.ProposalItemBulkUpdate,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Replace the full item list of a proposal in a single transaction.
+    
+    - **proposal_id**: Proposal ID whose items are replaced
+    - **items**: The complete desired item list. Entries with an **id** update
+      that item of this proposal, entries without an id are inserted, and
+      existing items missing from the list are deleted. An id that is not an
+      item of this proposal, or appears twice, is rejected with 400 and
+      nothing is changed.
+    
+    Inserts and updates are sent as executemany batches and committed once.
+    """
+    await _get_proposal(db, proposal_id, principal)
+    
+    result = await db.execute(
+        select(models.ProposalItem.id).where(models.ProposalItem.proposal_id == proposal_id)
+    )
+    existing_ids = set(result.scalars().all())
+    
+    # Diff the desired list against what is stored
+    kept_ids = set()
+    to_update = []
+    to_insert = []
+    for entry in payload.items:
+        values = entry.model_dump(exclude={'id'})
+        if entry.id is None:
+            to_insert.append({'proposal_id': proposal_id, **values})
+            continue
+        if entry.id not in existing_ids or entry.id in kept_ids:
+            # Never move another proposal's item here or write one item twice
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Item {entry.id} is not an item of proposal {proposal_id} or is listed twice"
+            )
+        kept_ids.add(entry.id)
+        to_update.append({'id': entry.id, **values})
+    to_delete = existing_ids - kept_ids
+    
+    if to_delete:
+        await db.execute(
+            delete(models.ProposalItem).where(models.ProposalItem.id.in_(to_delete))
+        )
+    if to_update:
+        await db.execute(update(models.ProposalItem), to_update)
+    if to_insert:
+        await db.execute(insert(models.ProposalItem), to_insert)
+    
+    await db.commit()
+    
+    result = await db.execute(
+        select(models.ProposalItem)
+        .where(models.ProposalItem.proposal_id == proposal_id)
+        .order_by(models.ProposalItem.id)
+        .execution_options(populate_existing=True)
+    )
+    
+    return {
+        "inserted": len(to_insert),
+        "updated": len(to_update),
+        "deleted": len(to_delete),
+        "items": result.scalars().all()
+    }
+
+
 @router.get("/{item_id}", response_model=schemas.ProposalItemResponse)
-def get_proposal_item_by_id(
+async def get_proposal_item_by_id(
     item_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a specific proposal item by ID.
     """
-    item = db.query(models.ProposalItem).filter(models.ProposalItem.id == item_id).first()
+    item = await _get_item(db, item_id, principal)
     
-    if not item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Proposal item with ID {item_id} not found"
-        )
+    unchanged = not_modified(request, response, etag_for(item))
+    if unchanged is not None:
+        return unchanged
     
     return item
 
 
 @router.put("/{item_id}", response_model=schemas.ProposalItemResponse)
-def update_proposal_item(
+async def update_proposal_item(
     item_id: int,
     item_update: schemas.ProposalItemUpdate,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update a proposal item.
     
     Only provided fields will be updated. Total will be recalculated automatically.
     """
-    db_item = db.query(models.ProposalItem).filter(models.ProposalItem.id == item_id).first()
-    
-    if not db_item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Proposal item with ID {item_id} not found"
-        )
+    db_item = await _get_item(db, item_id, principal)
     
     # Update only provided fields
     update_data = item_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_item, field, value)
     
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    await db.refresh(db_item)
     
     return db_item
 
 
 @router.delete("/{item_id}", status_code=status.HTTP_200_OK)
-def delete_proposal_item(
+async def delete_proposal_item(
     item_id: int,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Delete a proposal item.
     """
-    db_item = db.query(models.ProposalItem).filter(models.ProposalItem.id == item_id).first()
-    
-    if not db_item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Proposal item with ID {item_id} not found"
-        )
+    db_item = await _get_item(db, item_id, principal)
     
-    db.delete(db_item)
-    db.commit()
+    await db.delete(db_item)
+    await db.commit()
     
     return {
         "success": True,
@@ -1,20 +1,31 @@
 """
 Proposal API routes - CRUD operations for Proposal table
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response, UploadFile, File
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 
 from ...core import schemas, models
-from ...db.database import get_db
+from ...db.database import get_async_db
+from ...db.repository import ProposalRepository
+from ...services import boq_catalog, pdf_service
+from ..pagination import keyset, finish_page
+from ..http_cache import etag_for, not_modified
+from ..security import Principal, get_principal, require_company, authorize_company
 
 router = APIRouter()
 
+# Newest first; Id breaks ties between proposals created in the same second
+PROPOSAL_SORT_KEY = (models.Proposal.created_date, models.Proposal.id)
 
-@router.post("/", response_model=schemas.ProposalResponse, status_code=status.HTTP_201_CREATED)
-def create_proposal(
+
+@router.post("/", response_model=schemas.ProposalWithItems, status_code=status.HTTP_201_CREATED)
+async def create_proposal(
     proposal: schemas.ProposalCreate,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new proposal.
@@ -29,36 +40,30 @@ def create_proposal(
     - **area**: Area details
     - **material_preferences**: Material preferences
     - **special_requirement**: Special requirements
-    """
-    db_proposal = models.Proposal(
-        company_id=proposal.company_id,
-        client_id=proposal.client_id,
-        title=proposal.title,
-        description=proposal.description,
-        amount=proposal.amount,
-        status=proposal.status or 'Draft',
-        project_type=proposal.project_type,
-        area=proposal.area,
-        material_preferences=proposal.material_preferences,
-        special_requirement=proposal.special_requirement
-    )
+    - **items**: Line items (item_name, description, qty, unit_price) to create with the proposal
     
-    db.add(db_proposal)
-    db.commit()
-    db.refresh(db_proposal)
+    Returns the proposal with its items.
+    """
+    authorize_company(principal, proposal.company_id)
     
-    return db_proposal
+    # Proposal and items are written in one transaction with a single commit
+    return await db.run_sync(ProposalRepository.create, proposal)
 
 
 @router.get("/{proposal_id}", response_model=schemas.ProposalResponse)
-def get_proposal_by_id(
+async def get_proposal_by_id(
     proposal_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a specific proposal by Proposal ID.
+    
+    Supports If-None-Match / If-Modified-Since (304 Not Modified).
     """
-    proposal = db.query(models.Proposal).filter(models.Proposal.id == proposal_id).first()
+    proposal = await db.get(models.Proposal, proposal_id)
     
     if not proposal:
         raise HTTPException(
@@ -66,104 +71,215 @@ def get_proposal_by_id(
             detail=f"Proposal with ID {proposal_id} not found"
         )
     
+    authorize_company(principal, proposal.company_id)
+    
+    unchanged = not_modified(request, response, etag_for(proposal), proposal.modify_date)
+    if unchanged is not None:
+        return unchanged
+    
     return proposal
 
 
-@router.get("/company/{company_id}", response_model=List[schemas.ProposalResponse])
-def get_proposals_by_company(
+@router.get("/{proposal_id}/full", response_model=schemas.ProposalFullResponse)
+async def get_proposal_full(
+    proposal_id: int,
+    request: Request,
+    response: Response,
+    include_clients: bool = Query(False, description="Also return all clients of the proposal's company"),
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get a proposal together with everything the proposal pages need.
+    
+    - **proposal_id**: Proposal ID
+    - **include_clients**: Also return the company's clients (for client pickers)
+    
+    Returns the proposal, its client, its items and the company's project types.
+    Loaded in a fixed number of queries regardless of the number of items.
+    Supports If-None-Match (304 Not Modified).
+    """
+    result = await db.execute(
+        select(models.Proposal)
+        .options(
+            joinedload(models.Proposal.client),
+            selectinload(models.Proposal.items)
+        )
+        .where(models.Proposal.id == proposal_id)
+    )
+    proposal = result.unique().scalar_one_or_none()
+    
+    if not proposal:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Proposal with ID {proposal_id} not found"
+        )
+    
+    authorize_company(principal, proposal.company_id)
+    
+    project_types, clients = [], None
+    if proposal.company_id:
+        project_types = await boq_catalog.project_types(db, proposal.company_id)
+        
+        if include_clients:
+            clients = (await db.execute(
+                select(models.ClientDetails)
+                .where(models.ClientDetails.company_id == proposal.company_id)
+            )).scalars().all()
+    
+    etag = etag_for(proposal, proposal.client, proposal.items, project_types, clients)
+    unchanged = not_modified(request, response, etag)
+    if unchanged is not None:
+        return unchanged
+    
+    full = schemas.ProposalFullResponse.model_validate(proposal)
+    full.project_types = project_types
+    if clients is not None:
+        full.clients = [schemas.ClientDetailsResponse.model_validate(client) for client in clients]
+    
+    return full
+
+
+@router.get("/company/{company_id}", response_model=List[schemas.ProposalListItem], dependencies=[Depends(require_company)],
+            response_model_exclude_unset=True)
+async def get_proposals_by_company(
     company_id: int,
-    skip: int = Query(0, ge=0),
+    request: Request,
+    skip: int = Query(0, ge=0, deprecated=True),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     limit: int = Query(100, ge=1, le=500),
     status: Optional[str] = Query(None, description="Filter by status (Draft, Sent, Approved, Rejected)"),
-    db: Session = Depends(get_db)
+    include_client_name: bool = Query(False, description="Embed each proposal's client name"),
+    response: Response = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all proposals for a specific company.
     
     - **company_id**: Company ID to filter proposals
-    - **skip**: Number of records to skip (pagination)
+    - **cursor**: Opaque cursor from the X-Next-Cursor header of the previous page
+    - **skip**: Number of records to skip (deprecated, use cursor)
     - **limit**: Maximum number of records to return
     - **status**: Filter by status
+    - **include_client_name**: Join ClientDetails and return **client_name** with each proposal
     """
-    query = db.query(models.Proposal).filter(models.Proposal.company_id == company_id)
+    if include_client_name:
+        query = (
+            select(models.Proposal, models.ClientDetails.client_name)
+            .outerjoin(models.ClientDetails, models.ClientDetails.id == models.Proposal.client_id)
+        )
+    else:
+        query = select(models.Proposal)
+    
+    query = query.where(models.Proposal.company_id == company_id)
     
     if status:
-        query = query.filter(models.Proposal.status == status)
+        query = query.where(models.Proposal.status == status)
+    
+    query = keyset(query, PROPOSAL_SORT_KEY, cursor, limit, descending=True)
+    result = await db.execute(query.offset(skip))
+    
+    if not include_client_name:
+        rows = finish_page(result.scalars().all(), limit, response, lambda p: (p.created_date, p.id))
+        unchanged = not_modified(request, response, etag_for(rows))
+        return rows if unchanged is None else unchanged
     
-    proposals = query.order_by(models.Proposal.created_date.desc()).offset(skip).limit(limit).all()
+    rows = finish_page(result.all(), limit, response, lambda row: (row[0].created_date, row[0].id))
+    unchanged = not_modified(request, response, etag_for([tuple(row) for row in rows]))
+    if unchanged is not None:
+        return unchanged
+    
+    proposals = []
+    for proposal, client_name in rows:
+        item = schemas.ProposalListItem.model_validate(proposal)
+        item.client_name = client_name
+        proposals.append(item)
     
     return proposals
 
 
 @router.get("/client/{client_id}", response_model=List[schemas.ProposalResponse])
-def get_proposals_by_client(
+async def get_proposals_by_client(
     client_id: int,
-    skip: int = Query(0, ge=0),
+    request: Request,
+    skip: int = Query(0, ge=0, deprecated=True),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     limit: int = Query(100, ge=1, le=500),
-    db: Session = Depends(get_db)
+    response: Response = None,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all proposals for a specific client.
     
     - **client_id**: Client ID to filter proposals
-    - **skip**: Number of records to skip (pagination)
+    - **cursor**: Opaque cursor from the X-Next-Cursor header of the previous page
+    - **skip**: Number of records to skip (deprecated, use cursor)
     - **limit**: Maximum number of records to return
     """
-    proposals = db.query(models.Proposal).filter(
-        models.Proposal.client_id == client_id
-    ).order_by(models.Proposal.created_date.desc()).offset(skip).limit(limit).all()
+    query = select(models.Proposal).where(models.Proposal.client_id == client_id)
+    if principal is not None:
+        query = query.where(models.Proposal.company_id == principal.company_id)
+    query = keyset(query, PROPOSAL_SORT_KEY, cursor, limit, descending=True)
+    result = await db.execute(query.offset(skip))
     
-    return proposals
+    rows = finish_page(result.scalars().all(), limit, response, lambda p: (p.created_date, p.id))
+    unchanged = not_modified(request, response, etag_for(rows))
+    return rows if unchanged is None else unchanged
 
 
 @router.put("/{proposal_id}", response_model=schemas.ProposalResponse)
-def update_proposal(
+async def update_proposal(
     proposal_id: int,
     proposal_update: schemas.ProposalUpdate,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update a proposal's information.
     
     Only provided fields will be updated. Fields set to None will be ignored.
     """
-    db_proposal = db.query(models.Proposal).filter(models.Proposal.id == proposal_id).first()
+    db_proposal = await db.get(models.Proposal, proposal_id)
     
     if not db_proposal:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Proposal with ID {proposal_id} not found"
         )
+    authorize_company(principal, db_proposal.company_id)
     
     # Update only provided fields
     update_data = proposal_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_proposal, field, value)
     
-    db.commit()
-    db.refresh(db_proposal)
+    await db.commit()
+    await db.refresh(db_proposal)
     
     return db_proposal
 
 
 @router.delete("/{proposal_id}", status_code=status.HTTP_200_OK)
-def delete_proposal(
+async def delete_proposal(
     proposal_id: int,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Delete a proposal by Proposal ID.
     """
-    db_proposal = db.query(models.Proposal).filter(models.Proposal.id == proposal_id).first()
+    db_proposal = await db.get(models.Proposal, proposal_id)
     
     if not db_proposal:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Proposal with ID {proposal_id} not found"
         )
+    authorize_company(principal, db_proposal.company_id)
     
-    db.delete(db_proposal)
-    db.commit()
+    await db.delete(db_proposal)
+    await db.commit()
     
     return {
         "success": True,
@@ -172,34 +288,45 @@ def delete_proposal(
 
 
 @router.get("/", response_model=List[schemas.ProposalResponse])
-def get_all_proposals(
-    skip: int = Query(0, ge=0),
+async def get_all_proposals(
+    request: Request,
+    skip: int = Query(0, ge=0, deprecated=True),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     limit: int = Query(100, ge=1, le=500),
     status: Optional[str] = Query(None, description="Filter by status"),
-    db: Session = Depends(get_db)
+    response: Response = None,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get all proposals across all companies.
+    Get all proposals across all companies (only the caller's company with a token).
     
-    - **skip**: Number of records to skip (pagination)
+    - **cursor**: Opaque cursor from the X-Next-Cursor header of the previous page
+    - **skip**: Number of records to skip (deprecated, use cursor)
     - **limit**: Maximum number of records to return
     - **status**: Filter by status
     """
-    query = db.query(models.Proposal)
+    query = select(models.Proposal)
+    if principal is not None:
+        query = query.where(models.Proposal.company_id == principal.company_id)
     
     if status:
-        query = query.filter(models.Proposal.status == status)
+        query = query.where(models.Proposal.status == status)
     
-    proposals = query.order_by(models.Proposal.created_date.desc()).offset(skip).limit(limit).all()
+    query = keyset(query, PROPOSAL_SORT_KEY, cursor, limit, descending=True)
+    result = await db.execute(query.offset(skip))
     
-    return proposals
+    rows = finish_page(result.scalars().all(), limit, response, lambda p: (p.created_date, p.id))
+    unchanged = not_modified(request, response, etag_for(rows))
+    return rows if unchanged is None else unchanged
 
 
 @router.patch("/{proposal_id}/status/{new_status}", response_model=schemas.ProposalResponse)
-def update_proposal_status(
+async def update_proposal_status(
     proposal_id: int,
     new_status: str,
-    db: Session = Depends(get_db)
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update proposal status.
@@ -214,41 +341,105 @@ def update_proposal_status(
             detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}"
         )
     
-    db_proposal = db.query(models.Proposal).filter(models.Proposal.id == proposal_id).first()
+    db_proposal = await db.get(models.Proposal, proposal_id)
     
     if not db_proposal:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Proposal with ID {proposal_id} not found"
         )
+    authorize_company(principal, db_proposal.company_id)
     
     db_proposal.status = new_status
-    db.commit()
-    db.refresh(db_proposal)
+    await db.commit()
+    await db.refresh(db_proposal)
     
     return db_proposal
 
-    if db_proposal is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Proposal not found"
+
+async def _pdf_inputs(db: AsyncSession, proposal_id: int, principal: Optional[Principal]):
+    """The proposal (with client and items), its company, and the ETag of both."""
+    result = await db.execute(
+        select(models.Proposal)
+        .options(
+            joinedload(models.Proposal.client),
+            joinedload(models.Proposal.company),
+            selectinload(models.Proposal.items)
         )
+        .where(models.Proposal.id == proposal_id)
+    )
+    proposal = result.unique().scalar_one_or_none()
     
-    if not db_proposal.pdf_url:
+    if not proposal:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="PDF not generated for this proposal"
+            detail=f"Proposal with ID {proposal_id} not found"
         )
+    
+    authorize_company(principal, proposal.company_id)
+    
+    etag = etag_for(proposal, proposal.client, proposal.items, proposal.company)
+    return proposal, etag
 
-    pdf_path = os.path.join(pdf_service.output_dir, os.path.basename(db_proposal.pdf_url))
-    if not os.path.exists(pdf_path):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="PDF file not found"
-        )
 
-    return FileResponse(
-        pdf_path,
+async def _render_pdf(proposal: models.Proposal, logo_path: Optional[str]) -> Response:
+    full = schemas.ProposalFullResponse.model_validate(proposal).model_dump()
+    company = {}
+    if proposal.company is not None:
+        company = schemas.CompanyDetailsResponse.model_validate(proposal.company).model_dump()
+        if logo_path is None:
+            logo_path = await pdf_service.fetch_logo(company.get("logo_url"))
+    
+    content = await pdf_service.render(full, company, logo_path)
+    filename = pdf_service.pdf_filename(full)
+    return Response(
+        content=content,
         media_type="application/pdf",
-        filename=f"proposal_{proposal_id}.pdf"
-    )
\ No newline at end of file
+        headers={"Content-Disposition": pdf_service.content_disposition(filename)}
+    )
+
+
+@router.get("/{proposal_id}/pdf")
+async def get_proposal_pdf(
+    proposal_id: int,
+    request: Request,
+    response: Response,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Render the quotation PDF of a proposal.
+    
+    The company logo is taken from the company's logo_url when it is an
+    http(s) URL. Supports If-None-Match (304 Not Modified, without rendering).
+    """
+    proposal, etag = await _pdf_inputs(db, proposal_id, principal)
+    unchanged = not_modified(request, response, etag)
+    if unchanged is not None:
+        return unchanged
+    
+    pdf = await _render_pdf(proposal, None)
+    pdf.headers.update(response.headers)
+    return pdf
+
+
+@router.post("/{proposal_id}/pdf")
+async def render_proposal_pdf(
+    proposal_id: int,
+    logo: Optional[UploadFile] = File(None),
+    principal: Optional[Principal] = Depends(get_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Render the quotation PDF of a proposal with the given logo.
+    
+    - **logo**: Logo image to put in the header (multipart). Without it, the
+      company's logo_url is used as for GET.
+    """
+    proposal, _ = await _pdf_inputs(db, proposal_id, principal)
+    
+    logo_path = None
+    if logo is not None and logo.filename:
+        logo_path = pdf_service.store_logo(await logo.read(), logo.filename)
+    
+    return await _render_pdf(proposal, logo_path)
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import hashlib
 
 from ...db.database import get_db
 from ...core import schemas, models
+from ..pagination import keyset, finish_page
+from ..security import Principal, get_principal, authorize_company
 
 router = APIRouter(
     prefix="/api/users",
@@ -15,11 +17,30 @@ def hash_password(password: str) -> str:
     """Simple password hashing - in production use bcrypt or passlib"""
     return hashlib.sha256(password.encode()).hexdigest()
 
+def _get_user(db: Session, user_id: int, principal: Optional[Principal]) -> models.UserDetails:
+    """The user, 404 if missing and 403 if they belong to another company"""
+    user = db.query(models.UserDetails).filter(models.UserDetails.id == user_id).first()
+    
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with id {user_id} not found"
+        )
+    
+    authorize_company(principal, user.company_id)
+    return user
+
 @router.post("/", response_model=schemas.UserDetailsResponse, status_code=status.HTTP_201_CREATED)
-def create_user(user: schemas.UserDetailsCreate, db: Session = Depends(get_db)):
+def create_user(
+    user: schemas.UserDetailsCreate,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: Session = Depends(get_db)
+):
     """
     Create a new user
     """
+    authorize_company(principal, user.company_id)
+    
     # Check if username already exists
     existing_user = db.query(models.UserDetails).filter(
         models.UserDetails.username == user.username
@@ -65,54 +86,63 @@ def create_user(user: schemas.UserDetailsCreate, db: Session = Depends(get_db)):
 def get_users(
     skip: int = 0,
     limit: int = 100,
+    cursor: str = None,
     is_active: bool = None,
     role: str = None,
+    response: Response = None,
+    principal: Optional[Principal] = Depends(get_principal),
     db: Session = Depends(get_db)
 ):
     """
-    Get all users with optional filtering
+    Get all users with optional filtering.
+    
+    Pass the X-Next-Cursor header of a response as **cursor** to get the next page.
+    A signed-in caller only sees the users of their company.
     """
     query = db.query(models.UserDetails)
     
+    if principal is not None:
+        query = query.filter(models.UserDetails.company_id == principal.company_id)
+    
     if is_active is not None:
         query = query.filter(models.UserDetails.is_active == is_active)
     
     if role:
         query = query.filter(models.UserDetails.role == role)
     
-    users = query.offset(skip).limit(limit).all()
-    return users
+    query = keyset(query, (models.UserDetails.id,), cursor, limit)
+    users = query.offset(skip).all()
+    return finish_page(users, limit, response, lambda row: (row.id,))
 
 @router.get("/{user_id}", response_model=schemas.UserDetailsWithCompany)
-def get_user(user_id: int, db: Session = Depends(get_db)):
+def get_user(
+    user_id: int,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: Session = Depends(get_db)
+):
     """
     Get a specific user by ID with company details
     """
-    user = db.query(models.UserDetails).filter(models.UserDetails.id == user_id).first()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"User with id {user_id} not found"
-        )
+    user = _get_user(db, user_id, principal)
     
     return user
 
 @router.put("/{user_id}", response_model=schemas.UserDetailsResponse)
-def update_user(user_id: int, user_update: schemas.UserDetailsUpdate, db: Session = Depends(get_db)):
+def update_user(
+    user_id: int,
+    user_update: schemas.UserDetailsUpdate,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: Session = Depends(get_db)
+):
     """
     Update a user
     """
-    db_user = db.query(models.UserDetails).filter(models.UserDetails.id == user_id).first()
-    
-    if not db_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"User with id {user_id} not found"
-        )
+    db_user = _get_user(db, user_id, principal)
     
     # Update fields
     update_data = user_update.model_dump(exclude_unset=True)
+    if "company_id" in update_data:
+        authorize_company(principal, update_data["company_id"])
     
     # If password is being updated, hash it
     if "password" in update_data:
@@ -139,17 +169,15 @@ def update_user(user_id: int, user_update: schemas.UserDetailsUpdate, db: Sessio
     return db_user
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user_id: int, db: Session = Depends(get_db)):
+def delete_user(
+    user_id: int,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: Session = Depends(get_db)
+):
     """
     Delete a user
     """
-    db_user = db.query(models.UserDetails).filter(models.UserDetails.id == user_id).first()
-    
-    if not db_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"User with id {user_id} not found"
-        )
+    db_user = _get_user(db, user_id, principal)
     
     db.delete(db_user)
     db.commit()
@@ -157,7 +185,11 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
     return None
 
 @router.get("/username/{username}", response_model=schemas.UserDetailsWithCompany)
-def get_user_by_username(username: str, db: Session = Depends(get_db)):
+def get_user_by_username(
+    username: str,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: Session = Depends(get_db)
+):
     """
     Get a user by username
     """
@@ -169,20 +201,19 @@ def get_user_by_username(username: str, db: Session = Depends(get_db)):
             detail=f"User with username '{username}' not found"
         )
     
+    authorize_company(principal, user.company_id)
     return user
 
 @router.patch("/{user_id}/deactivate", response_model=schemas.UserDetailsResponse)
-def deactivate_user(user_id: int, db: Session = Depends(get_db)):
+def deactivate_user(
+    user_id: int,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: Session = Depends(get_db)
+):
     """
     Deactivate a user account
     """
-    db_user = db.query(models.UserDetails).filter(models.UserDetails.id == user_id).first()
-    
-    if not db_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"User with id {user_id} not found"
-        )
+    db_user = _get_user(db, user_id, principal)
     
     db_user.is_active = False
     db.commit()
@@ -191,17 +222,15 @@ def deactivate_user(user_id: int, db: Session = Depends(get_db)):
     return db_user
 
 @router.patch("/{user_id}/activate", response_model=schemas.UserDetailsResponse)
-def activate_user(user_id: int, db: Session = Depends(get_db)):
+def activate_user(
+    user_id: int,
+    principal: Optional[Principal] = Depends(get_principal),
+    db: Session = Depends(get_db)
+):
     """
     Activate a user account
     """
-    db_user = db.query(models.UserDetails).filter(models.UserDetails.id == user_id).first()
-    
-    if not db_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"User with id {user_id} not found"
-        )
+    db_user = _get_user(db, user_id, principal)
     
     db_user.is_active = True
     db.commit()
@@ -0,0 +1,162 @@
+"""
+Stateless bearer-token authentication.
+
+/auth/login issues a signed access token (JWT, AUTH_TOKEN_ALGORITHM, default
+HS256) carrying the user id, company_id, role and access end date, plus a
+longer-lived refresh token. Routes verify the access token in-process with the
+signing key loaded once at startup, so authorizing a request costs no database
+query. /auth/refresh checks the user again and issues a new pair.
+
+Access tokens last AUTH_ACCESS_TOKEN_MINUTES (default 15), refresh tokens
+AUTH_REFRESH_TOKEN_DAYS (default 7). The key is AUTH_TOKEN_SECRET, the same
+for every worker; the app does not start without it.
+
+Every request needs a token. For development only, AUTH_REQUIRED=false lets
+requests without one through (their company is then not checked) and, if
+AUTH_TOKEN_SECRET is unset, signs with a random key valid only for this
+process. A token that is sent is always verified.
+"""
+import os
+import secrets
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from dotenv import load_dotenv
+from jose import JWTError, jwt
+from pydantic import BaseModel
+
+load_dotenv()
+
+ALGORITHM = os.getenv("AUTH_TOKEN_ALGORITHM", "HS256")
+ACCESS_TOKEN_MINUTES = int(os.getenv("AUTH_ACCESS_TOKEN_MINUTES", "15"))
+REFRESH_TOKEN_DAYS = int(os.getenv("AUTH_REFRESH_TOKEN_DAYS", "7"))
+# Anonymous access is an explicit opt-in for development
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "true").lower() != "false"
+
+SECRET = os.getenv("AUTH_TOKEN_SECRET")
+if not SECRET:
+    if AUTH_REQUIRED:
+        raise RuntimeError(
+            "AUTH_TOKEN_SECRET is not set. Set it to the same key for every worker "
+            "(or AUTH_REQUIRED=false for development)"
+        )
+    print("WARNING: AUTH_TOKEN_SECRET not set; tokens are signed with a random key and do not survive a restart")
+    SECRET = secrets.token_urlsafe(32)
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+class Principal(BaseModel):
+    """The caller, as stated by a verified access token."""
+    user_id: int
+    company_id: int
+    role: Optional[str] = None
+    access_end_date: Optional[date] = None
+
+
+def _unauthorized(message: str, error_code: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail={"success": False, "message": message, "error_code": error_code},
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _encode(user, token_type: str, lifetime: timedelta) -> str:
+    now = datetime.now(timezone.utc)
+    access_end = user.auto_proposal_access_end_date
+    if isinstance(access_end, datetime):
+        access_end = access_end.date()
+    claims = {
+        "sub": str(user.id),
+        "cid": user.company_id,
+        "role": user.role,
+        "aed": access_end.isoformat() if access_end else None,
+        "typ": token_type,
+        "iat": now,
+        "exp": now + lifetime,
+    }
+    return jwt.encode(claims, SECRET, algorithm=ALGORITHM)
+
+
+def issue_tokens(user) -> dict:
+    """Access and refresh token for a UserDetails row (fields of LoginResponse / TokenResponse)."""
+    return {
+        "access_token": _encode(user, "access", timedelta(minutes=ACCESS_TOKEN_MINUTES)),
+        "refresh_token": _encode(user, "refresh", timedelta(days=REFRESH_TOKEN_DAYS)),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_MINUTES * 60,
+    }
+
+
+def decode_token(token: str, token_type: str) -> Principal:
+    """Verify a token's signature, expiry and type; raises 401 otherwise."""
+    try:
+        claims = jwt.decode(token, SECRET, algorithms=[ALGORITHM])
+    except JWTError as e:
+        raise _unauthorized(f"Invalid or expired token: {e}", "INVALID_TOKEN")
+    if claims.get("typ") != token_type:
+        raise _unauthorized(f"Not an {token_type} token", "INVALID_TOKEN")
+    return Principal(
+        user_id=int(claims["sub"]),
+        company_id=claims["cid"],
+        role=claims.get("role"),
+        access_end_date=claims.get("aed"),
+    )
+
+
+def get_principal(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)
+) -> Optional[Principal]:
+    """
+    The caller from the Authorization: Bearer header (no database access).
+
+    None when no token is sent and AUTH_REQUIRED=false.
+    """
+    if credentials is None:
+        if AUTH_REQUIRED:
+            raise _unauthorized("Not authenticated", "NOT_AUTHENTICATED")
+        return None
+
+    principal = decode_token(credentials.credentials, "access")
+    if principal.access_end_date and datetime.now().date() > principal.access_end_date:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={
+                "success": False,
+                "message": f"Access expired on {principal.access_end_date}. Please renew subscription.",
+                "error_code": "ACCESS_EXPIRED"
+            }
+        )
+    return principal
+
+
+def require_principal(principal: Optional[Principal] = Depends(get_principal)) -> Principal:
+    """Route dependency: the caller, 401 without a token even when AUTH_REQUIRED is off."""
+    if principal is None:
+        raise _unauthorized("Not authenticated", "NOT_AUTHENTICATED")
+    return principal
+
+
+def authorize_company(principal: Optional[Principal], company_id: Optional[int]) -> None:
+    """403 unless the caller belongs to company_id (anonymous callers only exist with AUTH_REQUIRED=false)."""
+    if principal is not None and company_id is not None and principal.company_id != company_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={
+                "success": False,
+                "message": "Not allowed to access another company's data",
+                "error_code": "COMPANY_MISMATCH"
+            }
+        )
+
+
+def require_company(
+    company_id: Optional[int] = None,
+    principal: Optional[Principal] = Depends(get_principal)
+) -> Optional[Principal]:
+    """Route dependency: authorize the route's company_id path or query parameter."""
+    authorize_company(principal, company_id)
+    return principal
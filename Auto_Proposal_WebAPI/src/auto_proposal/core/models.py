@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import List, Optional
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, JSON, Enum, Text, Computed
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, JSON, Enum, Text, Computed, Index, text
 from sqlalchemy.orm import relationship, Mapped
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -24,6 +24,13 @@ class Client(Base):
 
 class Proposal(Base):
     __tablename__ = "Proposal"
+    __table_args__ = (
+        # List routes filter by company/client (and status) and page newest first by (CreatedDate, Id)
+        Index('IX_Proposal_CompanyID_Status_CreatedDate', 'CompanyID', 'Status', 'CreatedDate', 'Id'),
+        Index('IX_Proposal_CompanyID_CreatedDate', 'CompanyID', 'CreatedDate', 'Id'),
+        Index('IX_Proposal_ClientId_CreatedDate', 'ClientId', 'CreatedDate', 'Id'),
+        Index('IX_Proposal_CreatedDate', 'CreatedDate', 'Id'),
+    )
 
     id: Mapped[int] = Column('Id', Integer, primary_key=True, index=True, autoincrement=True)
     company_id: Mapped[Optional[int]] = Column('CompanyID', Integer, ForeignKey('CompanyDetails.CompanyID'))
@@ -33,8 +40,8 @@ class Proposal(Base):
     amount: Mapped[float] = Column('Amount', Float, nullable=False, default=0.00)
     status: Mapped[Optional[str]] = Column('Status', String(50), default='Draft')
     pdf_url: Mapped[Optional[str]] = Column('PdfUrl', String(255))
-    created_date: Mapped[datetime] = Column('CreatedDate', DateTime, server_default="CURRENT_TIMESTAMP")
-    modify_date: Mapped[datetime] = Column('ModifyDate', DateTime, server_default="CURRENT_TIMESTAMP", onupdate=datetime.utcnow)
+    created_date: Mapped[datetime] = Column('CreatedDate', DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+    modify_date: Mapped[datetime] = Column('ModifyDate', DateTime, server_default=text("CURRENT_TIMESTAMP"), onupdate=datetime.utcnow)
     project_type: Mapped[Optional[str]] = Column('ProjectType', String(100))
     area: Mapped[Optional[str]] = Column('Area', String(50))
     material_preferences: Mapped[Optional[str]] = Column('MaterialPreferences', Text)
@@ -42,9 +49,13 @@ class Proposal(Base):
 
     company: Mapped[Optional['CompanyDetails']] = relationship('CompanyDetails')
     client: Mapped['ClientDetails'] = relationship('ClientDetails')
+    items: Mapped[List['ProposalItem']] = relationship('ProposalItem', viewonly=True, order_by='ProposalItem.id')
 
 class ProposalItem(Base):
     __tablename__ = "ProposalItem"
+    __table_args__ = (
+        Index('IX_ProposalItem_ProposalId', 'ProposalId', 'Id'),
+    )
 
     id: Mapped[int] = Column('Id', Integer, primary_key=True, index=True, autoincrement=True)
     proposal_id: Mapped[int] = Column('ProposalId', Integer, ForeignKey('Proposal.Id'), nullable=False)
@@ -59,6 +70,10 @@ class ProposalItem(Base):
 
 class UserDetails(Base):
     __tablename__ = "UserDetails"
+    __table_args__ = (
+        # Email lookups use the unique index on Email
+        Index('IX_UserDetails_CompanyID', 'CompanyID'),
+    )
 
     id: Mapped[int] = Column("UserID", Integer, primary_key=True, index=True, autoincrement=True)
     company_id: Mapped[int] = Column("CompanyID", Integer, ForeignKey("CompanyDetails.CompanyID"), nullable=False)
@@ -70,13 +85,16 @@ class UserDetails(Base):
     role: Mapped[str] = Column("Role", String(50), default="User")
     is_active: Mapped[bool] = Column("IsActive", Integer, default=1)
     auto_proposal_access_end_date: Mapped[Optional[datetime]] = Column("AutoProposalAccessEndDate", DateTime)
-    created_at: Mapped[datetime] = Column("CreatedAt", DateTime, server_default="CURRENT_TIMESTAMP")
-    updated_at: Mapped[datetime] = Column("UpdatedAt", DateTime, server_default="CURRENT_TIMESTAMP", onupdate=datetime.utcnow)
+    created_at: Mapped[datetime] = Column("CreatedAt", DateTime, server_default=text("CURRENT_TIMESTAMP"))
+    updated_at: Mapped[datetime] = Column("UpdatedAt", DateTime, server_default=text("CURRENT_TIMESTAMP"), onupdate=datetime.utcnow)
 
     company: Mapped["CompanyDetails"] = relationship("CompanyDetails", back_populates="users")
 
 class CompanyDetails(Base):
     __tablename__ = "CompanyDetails"
+    __table_args__ = (
+        Index('IX_CompanyDetails_CompanyName', 'CompanyName'),
+    )
 
     id: Mapped[int] = Column("CompanyID", Integer, primary_key=True, index=True, autoincrement=True)
     company_name: Mapped[str] = Column("CompanyName", String(150), nullable=False)
@@ -98,13 +116,20 @@ class CompanyDetails(Base):
     subscription_type: Mapped[Optional[str]] = Column("SubscriptionType", String(50))
     subscription_start_date: Mapped[Optional[datetime]] = Column("SubscriptionStartDate", DateTime)
     subscription_end_date: Mapped[Optional[datetime]] = Column("SubscriptionEndDate", DateTime)
-    created_at: Mapped[datetime] = Column("CreatedAt", DateTime, server_default="CURRENT_TIMESTAMP")
-    updated_at: Mapped[datetime] = Column("UpdatedAt", DateTime, server_default="CURRENT_TIMESTAMP", onupdate=datetime.utcnow)
+    created_at: Mapped[datetime] = Column("CreatedAt", DateTime, server_default=text("CURRENT_TIMESTAMP"))
+    updated_at: Mapped[datetime] = Column("UpdatedAt", DateTime, server_default=text("CURRENT_TIMESTAMP"), onupdate=datetime.utcnow)
 
     users: Mapped[List["UserDetails"]] = relationship("UserDetails", back_populates="company")
 
 class PseApBoqItems(Base):
     __tablename__ = 'PseApBoqItems'
+    __table_args__ = (
+        Index('IX_PseApBoqItems_CompanyID_ProjectType', 'CompanyID', 'ProjectType', 'SNo'),
+        # Used by BOQ search on MySQL; other databases use the in-process index
+        Index('IX_PseApBoqItems_FullText', 'Title', 'Description', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+        # Upsert key for Excel imports, see services/boq_import.row_hash
+        Index('IX_PseApBoqItems_CompanyID_RowHash', 'CompanyID', 'RowHash', unique=True),
+    )
 
     sno: Mapped[int] = Column('SNo', Integer, primary_key=True, index=True, autoincrement=True)
     company_id: Mapped[Optional[int]] = Column('CompanyID', Integer, ForeignKey('CompanyDetails.CompanyID'))
@@ -114,12 +139,34 @@ class PseApBoqItems(Base):
     unit: Mapped[Optional[str]] = Column('Unit', String(50))
     basic_rate: Mapped[Optional[float]] = Column('BasicRate', Float)
     premium_rate: Mapped[Optional[float]] = Column('PremiumRate', Float)
+    row_hash: Mapped[Optional[str]] = Column('RowHash', String(40))
 
     company: Mapped[Optional['CompanyDetails']] = relationship('CompanyDetails')
 
 
+class BoqImportFile(Base):
+    """An Excel file imported into a company's BOQ catalog, so a re-upload can be skipped."""
+    __tablename__ = 'PseApBoqImportFiles'
+    __table_args__ = (
+        Index('IX_PseApBoqImportFiles_CompanyID_FileHash', 'CompanyID', 'FileHash', unique=True),
+    )
+
+    id: Mapped[int] = Column('Id', Integer, primary_key=True, index=True, autoincrement=True)
+    company_id: Mapped[int] = Column('CompanyID', Integer, ForeignKey('CompanyDetails.CompanyID'), nullable=False)
+    file_hash: Mapped[str] = Column('FileHash', String(64), nullable=False)
+    file_name: Mapped[Optional[str]] = Column('FileName', String(255))
+    inserted: Mapped[int] = Column('Inserted', Integer, nullable=False, default=0)
+    updated: Mapped[int] = Column('Updated', Integer, nullable=False, default=0)
+    unchanged: Mapped[int] = Column('Unchanged', Integer, nullable=False, default=0)
+    rejected: Mapped[int] = Column('Rejected', Integer, nullable=False, default=0)
+    imported_date: Mapped[datetime] = Column('ImportedDate', DateTime, server_default=text("CURRENT_TIMESTAMP"))
+
+
 class ClientDetails(Base):
     __tablename__ = 'ClientDetails'
+    __table_args__ = (
+        Index('IX_ClientDetails_CompanyID', 'CompanyID', 'ClientID'),
+    )
 
     id: Mapped[int] = Column('ClientID', Integer, primary_key=True, index=True, autoincrement=True)
     company_id: Mapped[Optional[int]] = Column('CompanyID', Integer, ForeignKey('CompanyDetails.CompanyID'))
@@ -127,8 +174,8 @@ class ClientDetails(Base):
     email_address: Mapped[Optional[str]] = Column('EmailAddress', String(150))
     mobile_number: Mapped[Optional[str]] = Column('MobileNumber', String(15))
     contact_address: Mapped[Optional[str]] = Column('ContactAddress', Text)
-    create_date: Mapped[datetime] = Column('CreateDate', DateTime, server_default="CURRENT_TIMESTAMP")
-    modified_date: Mapped[datetime] = Column('ModifiedDate', DateTime, server_default="CURRENT_TIMESTAMP", onupdate=datetime.utcnow)
+    create_date: Mapped[datetime] = Column('CreateDate', DateTime, server_default=text("CURRENT_TIMESTAMP"))
+    modified_date: Mapped[datetime] = Column('ModifiedDate', DateTime, server_default=text("CURRENT_TIMESTAMP"), onupdate=datetime.utcnow)
     is_active: Mapped[Optional[bool]] = Column('IsActive', Integer, default=1)
 
     company: Mapped[Optional['CompanyDetails']] = relationship('CompanyDetails')
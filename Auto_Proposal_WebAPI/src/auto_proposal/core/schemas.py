@@ -29,6 +29,18 @@ class ProposalItemResponse(ProposalItemBase):
     class Config:
         from_attributes = True
 
+class ProposalItemBulkEntry(ProposalItemBase):
+    id: Optional[int] = None  # Existing item to update; omit to insert
+
+class ProposalItemBulkUpdate(BaseModel):
+    items: List[ProposalItemBulkEntry] = []
+
+class ProposalItemBulkResponse(BaseModel):
+    inserted: int
+    updated: int
+    deleted: int
+    items: List[ProposalItemResponse]
+
 # ==================== Client Schemas (Old - for backward compatibility) ====================
 class ClientBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=255)
@@ -165,6 +177,20 @@ class LoginResponse(BaseModel):
     user: Optional[UserDetailsWithCompany] = None
     access_granted: bool = False
     access_end_date: Optional[datetime] = None
+    # Bearer tokens for the API (see api/security.py)
+    access_token: Optional[str] = None
+    refresh_token: Optional[str] = None
+    token_type: Optional[str] = None
+    expires_in: Optional[int] = None  # Seconds until the access token expires
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class TokenResponse(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = 'bearer'
+    expires_in: int
 
 # PseApBoqItems Schemas
 class BoqItemBase(BaseModel):
@@ -194,6 +220,22 @@ class BoqItemResponse(BoqItemBase):
     class Config:
         from_attributes = True
 
+class ImportJobResponse(BaseModel):
+    job_id: str
+    company_id: int
+    filename: str
+    status: str  # queued, running, completed or failed
+    rows_parsed: int = 0
+    rows_inserted: int = 0
+    rows_updated: int = 0
+    rows_unchanged: int = 0
+    rows_rejected: int = 0
+    already_imported: bool = False  # identical file imported before; nothing was done
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 
 # ClientDetails Schemas
 class ClientDetailsBase(BaseModel):
@@ -237,7 +279,7 @@ class ProposalBase(BaseModel):
     special_requirement: Optional[str] = None
 
 class ProposalCreate(ProposalBase):
-    pass
+    items: List[ProposalItemBase] = []  # Line items created together with the proposal
 
 class ProposalUpdate(BaseModel):
     title: Optional[str] = Field(None, max_length=200)
@@ -258,3 +300,14 @@ class ProposalResponse(ProposalBase):
 
     class Config:
         from_attributes = True
+
+class ProposalListItem(ProposalResponse):
+    client_name: Optional[str] = None  # Only with include_client_name=true
+
+class ProposalWithItems(ProposalResponse):
+    items: List[ProposalItemResponse] = []
+
+class ProposalFullResponse(ProposalWithItems):
+    client: Optional[ClientDetailsResponse] = None
+    project_types: List[str] = []
+    clients: Optional[List[ClientDetailsResponse]] = None  # Only with include_clients=true
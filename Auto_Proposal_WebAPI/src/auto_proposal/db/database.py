@@ -1,9 +1,20 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import NullPool
+from urllib.parse import quote_plus
 import os
+import ssl
 from dotenv import load_dotenv
 
+from .pool_metrics import (
+    InstrumentedQueuePool,
+    InstrumentedAsyncAdaptedQueuePool,
+    register_pool,
+    instrument_engine,
+)
+
 load_dotenv()
 
 # Get database configuration from environment variables
@@ -19,6 +30,37 @@ if not all([db_user, db_password, db_name]):
         "Database credentials missing! Required: DB_USER, DB_PASSWORD, DB_NAME"
     )
 
+# Connection pool configuration (per engine, per worker process)
+pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+pool_timeout = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+pool_recycle = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+# always: ping on every checkout, idle: ping only connections idle longer than
+# DB_POOL_PING_IDLE_SECONDS, never: rely on pool_recycle and error invalidation
+pool_pre_ping = os.getenv("DB_POOL_PRE_PING", "always").lower()
+pool_ping_idle_seconds = int(os.getenv("DB_POOL_PING_IDLE_SECONDS", "300"))
+
+if pool_pre_ping in ("true", "1", "yes"):
+    pool_pre_ping = "always"
+elif pool_pre_ping in ("false", "0", "no"):
+    pool_pre_ping = "never"
+if pool_pre_ping not in ("always", "idle", "never"):
+    raise ValueError("DB_POOL_PRE_PING must be one of: always, idle, never")
+
+
+def pool_options(name: str, poolclass) -> dict:
+    """Keyword arguments for create_engine/create_async_engine pool setup."""
+    register_pool(name)
+    return {
+        "poolclass": poolclass,
+        "pool_logging_name": name,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": pool_pre_ping == "always",
+    }
+
 # Try to use Cloud SQL Connector if enabled and credentials available
 if use_cloud_connector:
     try:
@@ -50,11 +92,8 @@ if use_cloud_connector:
         engine = create_engine(
             "mysql+pymysql://",
             creator=getconn,
-            pool_size=5,
-            max_overflow=10,
-            pool_pre_ping=True,
-            pool_recycle=3600,
-            echo=False
+            echo=False,
+            **pool_options("sync", InstrumentedQueuePool)
         )
         
     except Exception as e:
@@ -62,13 +101,16 @@ if use_cloud_connector:
         print("Falling back to direct IP connection...")
         use_cloud_connector = False
 
+db_host = os.getenv("DB_HOST", "34.100.231.86")
+db_port = os.getenv("DB_PORT", "3306")
+
+# Get SSL certificate paths (optional for direct connection)
+ssl_ca = os.getenv("SSL_CA")
+ssl_cert = os.getenv("SSL_CERT")
+ssl_key = os.getenv("SSL_KEY")
+
 # Direct IP connection (fallback or default)
 if not use_cloud_connector:
-    from urllib.parse import quote_plus
-    
-    db_host = os.getenv("DB_HOST", "34.100.231.86")
-    db_port = os.getenv("DB_PORT", "3306")
-    
     # URL encode the password
     encoded_password = quote_plus(db_password)
     
@@ -79,11 +121,6 @@ if not use_cloud_connector:
     print("WARNING: Using direct IP connection - requires IP whitelisting in Google Cloud Console")
     print(f"Current connection will work only if your IP is authorized")
     
-    # Get SSL certificate paths (optional for direct connection)
-    ssl_ca = os.getenv("SSL_CA")
-    ssl_cert = os.getenv("SSL_CERT")
-    ssl_key = os.getenv("SSL_KEY")
-    
     connect_args = {}
     if ssl_ca and ssl_cert and ssl_key:
         connect_args = {
@@ -102,16 +139,65 @@ if not use_cloud_connector:
     engine = create_engine(
         DATABASE_URL,
         connect_args=connect_args,
-        pool_size=5,
-        max_overflow=10,
-        pool_pre_ping=True,
-        pool_recycle=3600,
-        echo=False
+        echo=False,
+        **pool_options("sync", InstrumentedQueuePool)
     )
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the async route handlers.
+# The Cloud SQL Python Connector has no async MySQL driver, so the async engine
+# always connects directly (aiomysql) unless ASYNC_DATABASE_URL overrides it.
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    f"mysql+aiomysql://{db_user}:{quote_plus(db_password)}@{db_host}:{db_port}/{db_name}"
+)
+
+async_connect_args = {}
+if ASYNC_DATABASE_URL.startswith("mysql+aiomysql") and ssl_ca and ssl_cert and ssl_key:
+    ssl_context = ssl.create_default_context(cafile=ssl_ca)
+    ssl_context.load_cert_chain(certfile=ssl_cert, keyfile=ssl_key)
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    async_connect_args = {'ssl': ssl_context}
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=async_connect_args,
+    echo=False,
+    **pool_options("async", InstrumentedAsyncAdaptedQueuePool)
+)
+
+instrument_engine(engine, pool_pre_ping, pool_ping_idle_seconds)
+instrument_engine(async_engine.sync_engine, pool_pre_ping, pool_ping_idle_seconds)
+
+# expire_on_commit=False: attributes of committed objects must stay loaded,
+# an AsyncSession cannot lazy-load them later during response serialization.
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# Background jobs run on their own event loop in a worker thread. Pooled
+# aiomysql connections are tied to the loop that opened them, so the job
+# engine opens one connection per session instead of pooling.
+job_async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=async_connect_args,
+    echo=False,
+    poolclass=NullPool
+)
+
+JobSessionLocal = async_sessionmaker(
+    bind=job_async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Create base class for declarative models
 Base = declarative_base()
 
@@ -123,6 +209,11 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Get async database session."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
     """Initialize database with tables."""
     from ..core.models import Base
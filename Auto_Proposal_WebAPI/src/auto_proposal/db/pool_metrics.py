@@ -0,0 +1,187 @@
+"""
+Connection pool instrumentation.
+
+Collects checkout wait times, connection hold times and pool occupancy from
+SQLAlchemy pool events so the pool can be sized from real data. Exposed in
+Prometheus text format by the /metrics route.
+"""
+import threading
+import time
+from typing import Dict, List, Sequence
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+HOLD_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 10, 15, 20, 30, 50, 100)
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds (Prometheus style)."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        with self._lock:
+            lines = [
+                f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+                for bound, count in zip(self.buckets, self.counts)
+            ]
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+            lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+            lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class PoolMetrics:
+    """Counters and histograms for one engine's pool."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.pings = 0
+        self.wait_seconds = Histogram(WAIT_BUCKETS)
+        self.hold_seconds = Histogram(HOLD_BUCKETS)
+        self.checked_out_at_checkout = Histogram(COUNT_BUCKETS)
+        self.overflow_at_checkout = Histogram(COUNT_BUCKETS)
+
+    def render(self) -> List[str]:
+        labels = f'pool="{self.name}"'
+        lines = []
+        pool = self.pool
+        if isinstance(pool, QueuePool):
+            lines += [
+                f'db_pool_size{{{labels}}} {pool.size()}',
+                f'db_pool_checked_out{{{labels}}} {pool.checkedout()}',
+                f'db_pool_checked_in{{{labels}}} {pool.checkedin()}',
+                f'db_pool_overflow{{{labels}}} {max(pool.overflow(), 0)}',
+            ]
+        lines += [
+            f'db_pool_connects_total{{{labels}}} {self.connects}',
+            f'db_pool_checkouts_total{{{labels}}} {self.checkouts}',
+            f'db_pool_invalidations_total{{{labels}}} {self.invalidations}',
+            f'db_pool_timeouts_total{{{labels}}} {self.timeouts}',
+            f'db_pool_pings_total{{{labels}}} {self.pings}',
+        ]
+        lines += self.wait_seconds.render("db_pool_wait_seconds", labels)
+        lines += self.hold_seconds.render("db_pool_hold_seconds", labels)
+        lines += self.checked_out_at_checkout.render("db_pool_checked_out_at_checkout", labels)
+        lines += self.overflow_at_checkout.render("db_pool_overflow_at_checkout", labels)
+        return lines
+
+
+# Keyed by the pool's logging name, which survives pool.recreate() on dispose
+_registry: Dict[str, PoolMetrics] = {}
+
+
+def _metrics_for(pool) -> PoolMetrics:
+    name = pool._orig_logging_name
+    metrics = _registry[name]
+    metrics.pool = pool
+    return metrics
+
+
+class _TimedCheckoutMixin:
+    """Measures how long a checkout waited for a free connection."""
+
+    def _do_get(self):
+        metrics = _metrics_for(self)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.timeouts += 1
+            raise
+        finally:
+            metrics.wait_seconds.observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def register_pool(name: str) -> PoolMetrics:
+    """Create the metrics holder for a pool before its engine is built."""
+    return _registry.setdefault(name, PoolMetrics(name))
+
+
+def instrument_engine(engine, ping_strategy: str = "always", ping_idle_seconds: int = 300):
+    """
+    Attach pool event listeners to an engine.
+
+    ping_strategy "idle" pings a connection on checkout only when it has sat in
+    the pool longer than ping_idle_seconds; a failed ping raises
+    DisconnectionError so the pool transparently replaces the connection.
+    """
+    pool = engine.pool
+    metrics = _metrics_for(pool)
+
+    @event.listens_for(pool, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.connects += 1
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        now = time.monotonic()
+        metrics.checkouts += 1
+        current_pool = metrics.pool
+        if isinstance(current_pool, QueuePool):
+            metrics.checked_out_at_checkout.observe(current_pool.checkedout())
+            metrics.overflow_at_checkout.observe(max(current_pool.overflow(), 0))
+
+        last_checkin = connection_record.info.get("checkin_time")
+        if ping_strategy == "idle" and last_checkin and now - last_checkin > ping_idle_seconds:
+            metrics.pings += 1
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            except Exception:
+                raise exc.DisconnectionError()
+            finally:
+                cursor.close()
+        connection_record.info["checkout_time"] = now
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        now = time.monotonic()
+        checkout_time = connection_record.info.pop("checkout_time", None)
+        if checkout_time is not None:
+            metrics.hold_seconds.observe(now - checkout_time)
+        connection_record.info["checkin_time"] = now
+
+    @event.listens_for(pool, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.invalidations += 1
+
+    return metrics
+
+
+def render_prometheus() -> str:
+    """All registered pools in Prometheus text exposition format."""
+    lines = []
+    for metrics in _registry.values():
+        if metrics.pool is not None:
+            lines += metrics.render()
+    return "\n".join(lines) + "\n"
@@ -1,5 +1,6 @@
 from typing import List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, selectinload
 from ..core import models, schemas
 
 class ClientRepository:
@@ -38,21 +39,28 @@ class ProposalRepository:
     @staticmethod
     def create(db: Session, proposal: schemas.ProposalCreate) -> models.Proposal:
         # Create proposal
-        proposal_data = proposal.model_dump(exclude={'proposal_items'})
+        proposal_data = proposal.model_dump(exclude={'items'})
+        proposal_data['status'] = proposal_data.get('status') or 'Draft'
         db_proposal = models.Proposal(**proposal_data)
         db.add(db_proposal)
         db.flush()  # Get proposal ID without committing
 
-        # Create proposal items
-        for item in proposal.proposal_items:
-            item_data = item.model_dump()
-            item_data['total'] = item.quantity * item.unit_price
-            db_item = models.ProposalItem(**item_data, proposal_id=db_proposal.id)
-            db.add(db_item)
+        # Create proposal items in one executemany batch; Total is computed by the database
+        if proposal.items:
+            db.execute(
+                insert(models.ProposalItem),
+                [{**item.model_dump(), 'proposal_id': db_proposal.id} for item in proposal.items]
+            )
 
         db.commit()
-        db.refresh(db_proposal)
-        return db_proposal
+
+        # Reloaded with its items, whose Total the database computed
+        return db.execute(
+            select(models.Proposal)
+            .options(selectinload(models.Proposal.items))
+            .where(models.Proposal.id == db_proposal.id)
+            .execution_options(populate_existing=True)
+        ).scalar_one()
 
     @staticmethod
     def update(db: Session, proposal_id: int, proposal: schemas.ProposalUpdate) -> Optional[models.Proposal]:
@@ -0,0 +1,270 @@
+"""
+Read-through cache of the BOQ catalog (PseApBoqItems) per company.
+
+Two kinds of entries, both per company:
+
+- the company's distinct project types
+- the items of one project type (or of all types), ordered by SNo; list
+  pages are cut from the cached rows with the same cursor as the database
+  query
+
+The catalog only changes through the BOQ routes and imports, which call
+invalidate(); entries also expire after BOQ_CACHE_TTL seconds (default 300,
+0 disables the cache). Slices larger than BOQ_CACHE_MAX_ITEMS rows (default
+5000) are not cached and are paged from the database as before.
+
+Backends:
+
+- memory (default): an LRU of at most BOQ_CACHE_MAX_ENTRIES entries per
+  worker process. Other processes only see an invalidation after the TTL.
+- Redis: set BOQ_CACHE_REDIS_URL (e.g. redis://localhost:6379/0) to share
+  the cache, and its invalidations, between worker processes. Each company is
+  one Redis hash, so invalidating it is a single DEL plus an INCR of the
+  company's version key, which set() WATCHes. Needs the redis package;
+  without it the memory backend is used.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from ..core import models, schemas
+
+CACHE_TTL = int(os.getenv("BOQ_CACHE_TTL", "300"))
+MAX_ENTRIES = int(os.getenv("BOQ_CACHE_MAX_ENTRIES", "1024"))
+MAX_ITEMS = int(os.getenv("BOQ_CACHE_MAX_ITEMS", "5000"))
+REDIS_URL = os.getenv("BOQ_CACHE_REDIS_URL")
+
+# Hash field of the project type list; item slices use "items:<project type>"
+_TYPES_FIELD = "types"
+_TOO_LARGE = "too-large"
+
+
+class MemoryBackend:
+    """LRU with TTL. Values are shared between requests and must not be mutated."""
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, Any]]" = OrderedDict()
+        # Bumped by invalidate(), so a fill that raced with it is discarded
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def generation(self, company_id: int) -> int:
+        return self._generations.get(company_id, 0)
+
+    def get(self, company_id: int, field: str):
+        with self._lock:
+            entry = self._entries.get((company_id, field))
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[(company_id, field)]
+                return None
+            self._entries.move_to_end((company_id, field))
+            return entry[1]
+
+    def set(self, company_id: int, field: str, value, generation: int):
+        with self._lock:
+            if self._generations.get(company_id, 0) != generation:
+                return
+            self._entries[(company_id, field)] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end((company_id, field))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, company_id: int):
+        with self._lock:
+            self._generations[company_id] = self._generations.get(company_id, 0) + 1
+            for key in [key for key in self._entries if key[0] == company_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
+class RedisBackend:
+    """
+    One Redis hash per company; the blocking client is called from the threadpool.
+
+    A version key per company plays the part of MemoryBackend's generations:
+    invalidate() increments it, and set() WATCHes it so a fill that raced with
+    an invalidation in any process is discarded.
+    """
+
+    def __init__(self, client, ttl: int):
+        from redis.exceptions import WatchError
+
+        self.client = client
+        self.ttl = ttl
+        self._watch_error = WatchError
+
+    @staticmethod
+    def _key(company_id: int) -> str:
+        return f"boq:catalog:{company_id}"
+
+    @staticmethod
+    def _version_key(company_id: int) -> str:
+        # No TTL: a version that expired back to 0 could accept a stale fill
+        return f"boq:catalog:{company_id}:version"
+
+    def generation(self, company_id: int) -> int:
+        return int(self.client.get(self._version_key(company_id)) or 0)
+
+    def get(self, company_id: int, field: str):
+        raw = self.client.hget(self._key(company_id), field)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, company_id: int, field: str, value, generation: int):
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self._version_key(company_id))
+                if int(pipe.get(self._version_key(company_id)) or 0) != generation:
+                    return
+                pipe.multi()
+                pipe.hset(self._key(company_id), field, json.dumps(value))
+                pipe.expire(self._key(company_id), self.ttl)
+                pipe.execute()
+            except self._watch_error:
+                # Invalidated between the check and EXEC
+                pass
+
+    def invalidate(self, company_id: int):
+        pipe = self.client.pipeline()
+        pipe.incr(self._version_key(company_id))
+        pipe.delete(self._key(company_id))
+        pipe.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter("boq:catalog:*"):
+            self.client.delete(key)
+
+
+def _create_backend():
+    if REDIS_URL:
+        try:
+            import redis
+            return RedisBackend(redis.Redis.from_url(REDIS_URL), CACHE_TTL)
+        except ImportError:
+            print("⚠️  BOQ_CACHE_REDIS_URL is set but the redis package is not installed; "
+                  "using the in-process BOQ catalog cache")
+    return MemoryBackend(MAX_ENTRIES, CACHE_TTL)
+
+
+backend = _create_backend()
+
+
+class CacheStats:
+    """Hit/miss counters per entry kind, rendered by /metrics."""
+
+    KINDS = ("items", "project_types")
+
+    def __init__(self):
+        self.hits = dict.fromkeys(self.KINDS, 0)
+        self.misses = dict.fromkeys(self.KINDS, 0)
+        self.bypasses = 0
+        self.invalidations = 0
+
+    def render(self) -> List[str]:
+        lines = []
+        for kind in self.KINDS:
+            lines.append(f'boq_catalog_cache_hits_total{{kind="{kind}"}} {self.hits[kind]}')
+            lines.append(f'boq_catalog_cache_misses_total{{kind="{kind}"}} {self.misses[kind]}')
+        lines.append(f'boq_catalog_cache_bypasses_total {self.bypasses}')
+        lines.append(f'boq_catalog_cache_invalidations_total {self.invalidations}')
+        return lines
+
+
+stats = CacheStats()
+
+
+def render_prometheus() -> str:
+    return "\n".join(stats.render()) + "\n"
+
+
+async def _call(method, *args):
+    if isinstance(backend, MemoryBackend):
+        return method(*args)
+    return await run_in_threadpool(method, *args)
+
+
+async def invalidate(*company_ids: Optional[int]):
+    """Drop the cached catalog of companies whose BOQ items changed."""
+    for company_id in set(company_ids):
+        if company_id is not None and CACHE_TTL > 0:
+            stats.invalidations += 1
+            await _call(backend.invalidate, company_id)
+
+
+async def project_types(db: AsyncSession, company_id: int) -> List[str]:
+    """Distinct non-empty project types of the company's BOQ items."""
+    if CACHE_TTL > 0:
+        cached = await _call(backend.get, company_id, _TYPES_FIELD)
+        if cached is not None:
+            stats.hits["project_types"] += 1
+            return cached
+        stats.misses["project_types"] += 1
+
+    generation = await _call(backend.generation, company_id)
+    result = await db.execute(
+        select(models.PseApBoqItems.project_type)
+        .where(models.PseApBoqItems.company_id == company_id)
+        .where(models.PseApBoqItems.project_type.isnot(None))
+        .distinct()
+    )
+    types = [project_type for project_type in result.scalars().all() if project_type]
+    if CACHE_TTL > 0:
+        await _call(backend.set, company_id, _TYPES_FIELD, types, generation)
+    return types
+
+
+async def items(db: AsyncSession, company_id: int, project_type: Optional[str]) -> Optional[List[Dict]]:
+    """
+    The company's items of project_type (all types if None) as response dicts
+    ordered by SNo, or None if the slice is too large to cache.
+    """
+    if CACHE_TTL <= 0:
+        return None
+    field = f"items:{project_type}" if project_type is not None else "items:*"
+    cached = await _call(backend.get, company_id, field)
+    if cached is not None:
+        stats.hits["items"] += 1
+        if cached == _TOO_LARGE:
+            stats.bypasses += 1
+            return None
+        return cached
+    stats.misses["items"] += 1
+
+    generation = await _call(backend.generation, company_id)
+    query = select(models.PseApBoqItems).where(models.PseApBoqItems.company_id == company_id)
+    if project_type is not None:
+        query = query.where(models.PseApBoqItems.project_type == project_type)
+    result = await db.execute(query.order_by(models.PseApBoqItems.sno).limit(MAX_ITEMS + 1))
+    rows = result.scalars().all()
+
+    if len(rows) > MAX_ITEMS:
+        await _call(backend.set, company_id, field, _TOO_LARGE, generation)
+        stats.bypasses += 1
+        return None
+    value = [schemas.BoqItemResponse.model_validate(row).model_dump() for row in rows]
+    await _call(backend.set, company_id, field, value, generation)
+    return value
+
+
+def page(cached: List[Dict], after_sno: Optional[int], skip: int, limit: int) -> List[Dict]:
+    """Rows after after_sno, offset by skip, with one look-ahead row (like pagination.keyset)."""
+    start = 0
+    if after_sno is not None:
+        start = bisect.bisect_right([item["sno"] for item in cached], after_sno)
+    start += skip
+    return cached[start:start + limit + 1]
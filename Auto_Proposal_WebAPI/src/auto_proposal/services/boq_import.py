@@ -0,0 +1,301 @@
+"""
+Streaming import of BOQ items from Excel.
+
+The first sheet is read row by row with openpyxl in read-only mode and handed
+on in chunks of BOQ_IMPORT_CHUNK_SIZE rows (default 2000). Each chunk is
+validated and coerced column-wise with pandas and written with one multi-row
+upsert, so memory stays bounded by the chunk size rather than the sheet size.
+
+A row is imported when it has a Description and at least one of BasicRate /
+PremiumRate; other rows are counted as rejected.
+
+Imports are idempotent. A row is identified by row_hash (company and text
+fields) under a unique key, so re-importing it updates its rates instead of
+duplicating it. Each import reports inserted, updated and unchanged rows. The
+SHA-256 of every imported file is recorded in PseApBoqImportFiles, and an
+identical re-upload returns without parsing the sheet. Those records are
+dropped whenever the company's catalog changes, see forget_imported_files.
+"""
+import hashlib
+import os
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple
+
+import openpyxl
+import pandas as pd
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from ..core import models
+
+CHUNK_SIZE = int(os.getenv("BOQ_IMPORT_CHUNK_SIZE", "2000"))
+
+# Excel header -> PseApBoqItems attribute
+COLUMN_MAPPING = {
+    'ProjectType': 'project_type',
+    'Title': 'title',
+    'Description': 'description',
+    'Unit': 'unit',
+    'BasicRate': 'basic_rate',
+    'PremiumRate': 'premium_rate',
+}
+TEXT_FIELDS = ('project_type', 'title', 'description', 'unit')
+RATE_FIELDS = ('basic_rate', 'premium_rate')
+
+# Attribute name -> table column key (e.g. 'basic_rate' -> 'BasicRate') for Core inserts
+_COLUMN_KEYS = {field: column.key for field, column in models.PseApBoqItems.__mapper__.columns.items()}
+
+
+class BoqImportError(ValueError):
+    """The upload cannot be imported (unsupported file, empty sheet, missing columns)."""
+
+
+def _check_header(header) -> List[int]:
+    names = [str(name).strip() if name is not None else '' for name in header]
+    missing = [column for column in COLUMN_MAPPING if column not in names]
+    if missing:
+        raise BoqImportError(f"Missing required columns: {', '.join(missing)}")
+    return [names.index(column) for column in COLUMN_MAPPING]
+
+
+def _xlsx_chunks(source: IO[bytes], chunk_size: int) -> Iterator[pd.DataFrame]:
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise BoqImportError("Excel file is empty")
+        positions = _check_header(header)
+        width = max(positions) + 1
+
+        buffer = []
+        for row in rows:
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            buffer.append([row[i] for i in positions])
+            if len(buffer) == chunk_size:
+                yield pd.DataFrame(buffer, columns=list(COLUMN_MAPPING.values()))
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=list(COLUMN_MAPPING.values()))
+    finally:
+        workbook.close()
+
+
+def _xls_chunks(source: IO[bytes], chunk_size: int) -> Iterator[pd.DataFrame]:
+    # Legacy .xls has no streaming reader; the sheet is loaded once, then chunked
+    df = pd.read_excel(source, dtype=object)
+    _check_header(df.columns)
+    df = df[list(COLUMN_MAPPING)].rename(columns=COLUMN_MAPPING)
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def check_filename(filename: Optional[str]):
+    if not filename or not filename.endswith(('.xlsx', '.xls')):
+        raise BoqImportError("File must be an Excel file (.xlsx or .xls)")
+
+
+def read_chunks(source: IO[bytes], filename: str, chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Raw sheet rows in DataFrames of at most chunk_size rows, columns named like the model."""
+    check_filename(filename)
+    if filename.endswith('.xlsx'):
+        return _xlsx_chunks(source, chunk_size)
+    return _xls_chunks(source, chunk_size)
+
+
+def clean_chunk(df: pd.DataFrame) -> Tuple[List[Dict], int]:
+    """Coerce a raw chunk column-wise; return (valid records, number of rejected rows)."""
+    df = df.copy()
+    for field in TEXT_FIELDS:
+        text = df[field].astype('string').str.strip().replace('', pd.NA)
+        df[field] = text.astype(object).where(text.notna(), None)
+    for field in RATE_FIELDS:
+        raw = df[field]
+        if raw.dtype == object:
+            raw = raw.astype('string').str.replace(',', '', regex=False).str.strip()
+        df[field] = pd.to_numeric(raw, errors='coerce')
+
+    valid = df['description'].notna() & (df['basic_rate'].notna() | df['premium_rate'].notna())
+    df = df[valid]
+    for field in RATE_FIELDS:
+        df[field] = df[field].astype(object).where(df[field].notna(), None)
+    return df.to_dict('records'), int((~valid).sum())
+
+
+def parse(source: IO[bytes], filename: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[List[Dict], int]]:
+    """(valid records, rejected count) per chunk."""
+    for raw in read_chunks(source, filename, chunk_size):
+        yield clean_chunk(raw)
+
+
+async def _next_in_thread(chunks: Iterator):
+    # Parsing is CPU bound; keep it off the event loop
+    return await run_in_threadpool(next, chunks, None)
+
+
+async def preview(source: IO[bytes], filename: str, company_id: Optional[int]) -> Dict:
+    chunks = parse(source, filename)
+    items, rejected = [], 0
+    while (chunk := await _next_in_thread(chunks)) is not None:
+        records, chunk_rejected = chunk
+        items.extend({'company_id': company_id, **record} for record in records)
+        rejected += chunk_rejected
+    return {"items": items, "rejected": rejected}
+
+
+def row_hash(company_id: Optional[int], project_type: Optional[str], title: Optional[str],
+             description: Optional[str], unit: Optional[str]) -> str:
+    """Identity of a catalog row: SHA-1 of its company and trimmed text fields."""
+    key = '\x1f'.join('' if value is None else str(value).strip()
+                       for value in (company_id, project_type, title, description, unit))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def item_hash(item: models.PseApBoqItems) -> str:
+    return row_hash(item.company_id, item.project_type, item.title, item.description, item.unit)
+
+
+def file_hash(source: IO[bytes]) -> str:
+    """SHA-256 of the whole upload; the stream is rewound afterwards."""
+    digest = hashlib.sha256()
+    for block in iter(lambda: source.read(1 << 20), b''):
+        digest.update(block)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+async def forget_imported_files(db: AsyncSession, company_id: Optional[int]):
+    """Drop the company's recorded file hashes; call whenever its catalog changes."""
+    if company_id is not None:
+        await db.execute(delete(models.BoqImportFile).where(models.BoqImportFile.company_id == company_id))
+
+
+def _upsert(dialect_name: str):
+    """
+    INSERT that updates the rates of rows whose (CompanyID, RowHash) exists.
+
+    Executed with a list of rows (executemany). The statement is the same for
+    every chunk, so it compiles once; PyMySQL rewrites the executemany into
+    multi-row INSERT ... ON DUPLICATE KEY UPDATE batches.
+    """
+    table = models.PseApBoqItems.__table__
+    if dialect_name == 'mysql':
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update(
+            BasicRate=statement.inserted.BasicRate,
+            PremiumRate=statement.inserted.PremiumRate
+        )
+    if dialect_name in ('postgresql', 'sqlite'):
+        dialect = postgresql if dialect_name == 'postgresql' else sqlite
+        statement = dialect.insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=['CompanyID', 'RowHash'],
+            set_={'BasicRate': statement.excluded.BasicRate, 'PremiumRate': statement.excluded.PremiumRate}
+        )
+    raise NotImplementedError(f"BOQ import has no upsert for the {dialect_name} dialect")
+
+
+async def _snos(db: AsyncSession, company_id: int, hashes: List[str]) -> Dict[str, Tuple]:
+    """row_hash -> (sno, basic_rate, premium_rate) of the company's rows among hashes."""
+    item = models.PseApBoqItems
+    result = await db.execute(
+        select(item.row_hash, item.sno, item.basic_rate, item.premium_rate)
+        .where(item.company_id == company_id, item.row_hash.in_(hashes))
+    )
+    return {row_hash: (sno, basic_rate, premium_rate) for row_hash, sno, basic_rate, premium_rate in result}
+
+
+async def upsert_records(db: AsyncSession, company_id: int, records: List[Dict],
+                         include_items: bool = False) -> Tuple[Dict[str, int], List[Dict]]:
+    """
+    Upsert one chunk: one SELECT of the existing rows, then one multi-row upsert
+    of the new and changed ones. Returns the counts and, with include_items,
+    the chunk's rows with their SNo and outcome.
+
+    A row repeated within the chunk is written once (the last one wins); the
+    repeats count as unchanged.
+    """
+    unique = {}
+    for record in records:
+        record['company_id'] = company_id
+        record['row_hash'] = row_hash(company_id, *(record[field] for field in TEXT_FIELDS))
+        unique[record['row_hash']] = record
+
+    existing = await _snos(db, company_id, list(unique))
+    outcomes = {}
+    for key, record in unique.items():
+        if key not in existing:
+            outcomes[key] = 'inserted'
+        elif existing[key][1:] != (record['basic_rate'], record['premium_rate']):
+            outcomes[key] = 'updated'
+        else:
+            outcomes[key] = 'unchanged'
+
+    changed = [unique[key] for key, outcome in outcomes.items() if outcome != 'unchanged']
+    if changed:
+        rows = [{_COLUMN_KEYS[field]: value for field, value in record.items()} for record in changed]
+        await db.execute(_upsert(db.bind.dialect.name), rows)
+
+    counts = {outcome: sum(1 for value in outcomes.values() if value == outcome)
+              for outcome in ('inserted', 'updated')}
+    counts['unchanged'] = len(records) - counts['inserted'] - counts['updated']
+
+    items = []
+    if include_items:
+        if counts['inserted']:
+            existing.update(await _snos(db, company_id, [key for key, outcome in outcomes.items()
+                                                         if outcome == 'inserted']))
+        for key, record in unique.items():
+            item = {field: value for field, value in record.items() if field != 'row_hash'}
+            items.append({'sno': existing[key][0], **item, 'outcome': outcomes[key]})
+    return counts, items
+
+
+async def import_items(db: AsyncSession, source: IO[bytes], filename: str, company_id: int,
+                       include_items: bool = True, chunk_size: int = CHUNK_SIZE,
+                       on_progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict:
+    """
+    Stream the sheet into PseApBoqItems in one transaction.
+
+    on_progress(totals) is called after every chunk with the running inserted,
+    updated, unchanged and rejected counts. The caller commits (or rolls back
+    on error).
+    """
+    check_filename(filename)
+    digest = await run_in_threadpool(file_hash, source)
+    already_imported = (await db.execute(
+        select(models.BoqImportFile.id)
+        .where(models.BoqImportFile.company_id == company_id, models.BoqImportFile.file_hash == digest)
+    )).first() is not None
+
+    totals = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+    items = []
+    if not already_imported:
+        chunks = parse(source, filename, chunk_size)
+        while (chunk := await _next_in_thread(chunks)) is not None:
+            records, chunk_rejected = chunk
+            totals['rejected'] += chunk_rejected
+            if records:
+                counts, chunk_items = await upsert_records(db, company_id, records, include_items)
+                for outcome, count in counts.items():
+                    totals[outcome] += count
+                items.extend(chunk_items)
+            if on_progress:
+                on_progress(dict(totals))
+
+        if totals['inserted'] or totals['updated']:
+            # Files imported earlier no longer describe the catalog
+            await forget_imported_files(db, company_id)
+        db.add(models.BoqImportFile(company_id=company_id, file_hash=digest, file_name=filename,
+                                    **totals))
+
+    result = {
+        "total_imported": totals['inserted'] + totals['updated'] + totals['unchanged'],
+        **{f"total_{outcome}": count for outcome, count in totals.items()},
+        "already_imported": already_imported,
+    }
+    if include_items:
+        result["items"] = items
+    return result
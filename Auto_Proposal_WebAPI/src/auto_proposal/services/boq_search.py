@@ -0,0 +1,312 @@
+"""
+Ranked search over the BOQ catalog (PseApBoqItems), scoped to one company.
+
+Two engines:
+
+- MySQL: MATCH(Title, Description) AGAINST(... IN BOOLEAN MODE) backed by the
+  FULLTEXT index declared on the model.
+- In-process: an inverted index per company with a trigram index over its
+  vocabulary, used on databases without FULLTEXT support (SQLite in tests and
+  benchmarks) or when the FULLTEXT index is missing.
+
+Both require every query word to match, rank title hits above description
+hits, and break ties by SNo. What "match" means differs:
+
+- In-process: like the old LIKE '%q%' search, a query word matches any word
+  that contains it ("crete" finds "Concrete").
+- MySQL: FULLTEXT only matches word prefixes ("conc" finds "Concrete") and
+  does not index words shorter than 3 characters. Those short words are
+  required with LIKE '%q%' instead. If no row matches the prefixes, the search
+  falls back to LIKE '%q%' for every word, so an infix fragment still finds
+  its rows, ranked by title hits then SNo; this fallback scans the company's
+  rows. Queries made only of short words use the in-process index.
+
+BOQ_SEARCH_BACKEND selects the engine: "auto" (default, FULLTEXT on MySQL),
+"fulltext" or "memory". In-process indexes are rebuilt after a write through
+invalidate() and, to bound staleness across worker processes, after
+BOQ_SEARCH_INDEX_TTL seconds (default 300).
+"""
+import asyncio
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from ..core import models
+
+SEARCH_BACKEND = os.getenv("BOQ_SEARCH_BACKEND", "auto").lower()
+INDEX_TTL = int(os.getenv("BOQ_SEARCH_INDEX_TTL", "300"))
+
+# InnoDB ignores words shorter than innodb_ft_min_token_size (default 3)
+FULLTEXT_MIN_TOKEN = 3
+TITLE_WEIGHT = 2.0
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+def _trigrams(token: str) -> Iterable[str]:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class BoqSearchIndex:
+    """Immutable inverted index over one company's BOQ items."""
+
+    def __init__(self, rows: Sequence[Tuple[int, Optional[str], Optional[str], Optional[str]]]):
+        """rows: (sno, project_type, title, description)"""
+        self.built_at = time.monotonic()
+        self.snos = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+        project_codes: Dict[Optional[str], int] = {}
+        self.project_types = np.fromiter(
+            (project_codes.setdefault(row[1], len(project_codes)) for row in rows),
+            dtype=np.int32, count=len(rows)
+        )
+        self.project_codes = project_codes
+
+        title_postings = defaultdict(list)
+        description_postings = defaultdict(list)
+        for doc, (_, _, title, description) in enumerate(rows):
+            for token in set(tokenize(title)):
+                title_postings[token].append(doc)
+            for token in set(tokenize(description)):
+                description_postings[token].append(doc)
+
+        # Doc ids are appended in order, so every posting list is already sorted
+        self.title_postings = {t: np.array(d, dtype=np.int32) for t, d in title_postings.items()}
+        self.description_postings = {t: np.array(d, dtype=np.int32) for t, d in description_postings.items()}
+
+        self.vocabulary = set(self.title_postings) | set(self.description_postings)
+        self.trigrams = defaultdict(set)
+        for token in self.vocabulary:
+            for gram in _trigrams(token):
+                self.trigrams[gram].add(token)
+
+    def __len__(self):
+        return len(self.snos)
+
+    def _tokens_containing(self, term: str) -> List[str]:
+        if len(term) < 3:
+            return [token for token in self.vocabulary if term in token]
+        candidates = None
+        for gram in _trigrams(term):
+            tokens = self.trigrams.get(gram)
+            if not tokens:
+                return []
+            candidates = set(tokens) if candidates is None else candidates & tokens
+        return [token for token in candidates if term in token]
+
+    def _mark(self, postings: Dict[str, np.ndarray], tokens: List[str]) -> np.ndarray:
+        mask = np.zeros(len(self), dtype=bool)
+        for token in tokens:
+            docs = postings.get(token)
+            if docs is not None:
+                mask[docs] = True
+        return mask
+
+    def search(self, query: str, project_type: Optional[str] = None,
+               skip: int = 0, limit: int = 50) -> Tuple[List[int], int]:
+        """Return (SNos of the requested page in rank order, total number of matches)."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not len(self):
+            return [], 0
+
+        # Boolean masks over doc ids keep every step linear in the catalog size
+        matches = np.ones(len(self), dtype=bool)
+        if project_type is not None:
+            code = self.project_codes.get(project_type)
+            if code is None:
+                return [], 0
+            matches &= self.project_types == code
+
+        per_term = []
+        for term in terms:
+            tokens = self._tokens_containing(term)
+            in_title = self._mark(self.title_postings, tokens)
+            in_any = in_title | self._mark(self.description_postings, tokens)
+            matches &= in_any
+            per_term.append((int(np.count_nonzero(in_any)), in_title))
+
+        candidates = np.flatnonzero(matches)
+        if not len(candidates):
+            return [], 0
+
+        # BM25-style idf per query word; a title hit counts TITLE_WEIGHT times
+        total_docs = len(self)
+        scores = np.zeros(len(candidates))
+        for doc_freq, in_title in per_term:
+            idf = math.log(1 + (total_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            scores += idf * np.where(in_title[candidates], TITLE_WEIGHT, 1.0)
+
+        # Doc ids follow SNo order, so among equal scores the lower position wins.
+        # Only the top skip + limit are ranked: everything scoring above the
+        # cut-off, then the earliest of the rows tied with it.
+        wanted = min(skip + limit, len(candidates))
+        negated = -scores
+        cutoff = np.partition(negated, wanted - 1)[wanted - 1]
+        better = np.flatnonzero(negated < cutoff)
+        tied = np.flatnonzero(negated == cutoff)[:wanted - len(better)]
+        top = np.concatenate((better, tied))
+        top = top[np.argsort(negated[top], kind="stable")]
+
+        return self.snos[candidates[top[skip:wanted]]].tolist(), len(candidates)
+
+
+_indexes: Dict[int, BoqSearchIndex] = {}
+# company_id -> the build in progress, resolved with its index (None if it failed).
+# A concurrent.futures.Future so requests on any event loop can await it.
+_builds: Dict[int, Future] = {}
+_builds_lock = threading.Lock()
+_fulltext_unavailable = False
+
+
+def invalidate(*company_ids: Optional[int]):
+    """Drop the in-process index of companies whose BOQ items changed."""
+    for company_id in company_ids:
+        if company_id is not None:
+            _indexes.pop(company_id, None)
+
+
+def _fresh(index: Optional[BoqSearchIndex]) -> bool:
+    return index is not None and time.monotonic() - index.built_at < INDEX_TTL
+
+
+async def get_index(db: AsyncSession, company_id: int) -> BoqSearchIndex:
+    """
+    The company's index, building it if it is missing or older than INDEX_TTL.
+
+    One request builds it; concurrent requests for the same company await that
+    build without holding a thread, and retry if it fails or is cancelled.
+    """
+    while True:
+        index = _indexes.get(company_id)
+        if _fresh(index):
+            return index
+
+        with _builds_lock:
+            build = _builds.get(company_id)
+            if build is None:
+                build = _builds[company_id] = Future()
+                break
+        # shield(): a cancelled waiter must not cancel the shared build
+        index = await asyncio.shield(asyncio.wrap_future(build))
+        if index is not None:
+            return index
+
+    index = None
+    try:
+        result = await db.execute(
+            select(
+                models.PseApBoqItems.sno,
+                models.PseApBoqItems.project_type,
+                models.PseApBoqItems.title,
+                models.PseApBoqItems.description,
+            )
+            .where(models.PseApBoqItems.company_id == company_id)
+            .order_by(models.PseApBoqItems.sno)
+        )
+        rows = result.all()
+        index = await run_in_threadpool(BoqSearchIndex, rows)
+        _indexes[company_id] = index
+        return index
+    finally:
+        with _builds_lock:
+            del _builds[company_id]
+        build.set_result(index)
+
+
+def _use_fulltext(db: AsyncSession, query: str) -> bool:
+    if SEARCH_BACKEND == "memory" or _fulltext_unavailable:
+        return False
+    if SEARCH_BACKEND == "auto" and db.bind.dialect.name != "mysql":
+        return False
+    # Queries made only of short words cannot be answered by the FULLTEXT index
+    return any(len(term) >= FULLTEXT_MIN_TOKEN for term in tokenize(query))
+
+
+def _contains(term: str):
+    item = models.PseApBoqItems
+    return or_(item.title.contains(term, autoescape=True), item.description.contains(term, autoescape=True))
+
+
+def _scoped(statement, company_id: int, project_type: Optional[str]):
+    statement = statement.where(models.PseApBoqItems.company_id == company_id)
+    if project_type is not None:
+        statement = statement.where(models.PseApBoqItems.project_type == project_type)
+    return statement
+
+
+def _fulltext_statement(company_id: int, terms: List[str], project_type: Optional[str]):
+    # Every word required (+), prefix match (*); tokenize() strips boolean operators
+    against = " ".join(f"+{term}*" for term in terms if len(term) >= FULLTEXT_MIN_TOKEN)
+    score = match(models.PseApBoqItems.title, models.PseApBoqItems.description,
+                  against=against).in_boolean_mode()
+    short = [_contains(term) for term in terms if len(term) < FULLTEXT_MIN_TOKEN]
+    statement = _scoped(select(models.PseApBoqItems).where(score > 0, *short), company_id, project_type)
+    return statement.order_by(score.desc(), models.PseApBoqItems.sno)
+
+
+def _like_statement(company_id: int, terms: List[str], project_type: Optional[str]):
+    item = models.PseApBoqItems
+    title_hits = sum(case((item.title.contains(term, autoescape=True), 1), else_=0) for term in terms)
+    statement = _scoped(select(item).where(and_(*(_contains(term) for term in terms))), company_id, project_type)
+    return statement.order_by(title_hits.desc(), item.sno)
+
+
+async def _search_fulltext(db: AsyncSession, company_id: int, query: str,
+                           project_type: Optional[str], skip: int, limit: int):
+    terms = list(dict.fromkeys(tokenize(query)))
+    result = await db.execute(_fulltext_statement(company_id, terms, project_type).offset(skip).limit(limit))
+    items = result.scalars().all()
+    if items:
+        return items
+
+    # Nothing starts with the query words: look for them inside words
+    if skip:
+        prefix_matches = await db.execute(
+            _fulltext_statement(company_id, terms, project_type).with_only_columns(func.count()).order_by(None)
+        )
+        if prefix_matches.scalar_one():
+            return items
+    result = await db.execute(_like_statement(company_id, terms, project_type).offset(skip).limit(limit))
+    return result.scalars().all()
+
+
+async def search(db: AsyncSession, company_id: int, query: str,
+                 project_type: Optional[str] = None, skip: int = 0, limit: int = 50):
+    """Ranked page of PseApBoqItems matching every word of query."""
+    global _fulltext_unavailable
+
+    if _use_fulltext(db, query):
+        try:
+            return await _search_fulltext(db, company_id, query, project_type, skip, limit)
+        except DBAPIError as e:
+            # Typically 1191 "Can't find FULLTEXT index": run migrate_add_indexes.py
+            print(f"FULLTEXT search unavailable, using in-process index: {e.orig}")
+            _fulltext_unavailable = True
+            await db.rollback()
+
+    index = await get_index(db, company_id)
+    snos, _ = await run_in_threadpool(index.search, query, project_type, skip, limit)
+    if not snos:
+        return []
+
+    result = await db.execute(
+        select(models.PseApBoqItems).where(models.PseApBoqItems.sno.in_(snos))
+    )
+    by_sno = {item.sno: item for item in result.scalars().all()}
+    return [by_sno[sno] for sno in snos if sno in by_sno]
@@ -0,0 +1,217 @@
+"""
+Background jobs for Excel BOQ imports.
+
+An upload is spooled to IMPORT_JOBS_DIR and imported on a pool of
+IMPORT_JOB_WORKERS threads (default 2), so the HTTP request returns as soon as
+the file is on disk. Each job runs boq_import.import_items on its own event
+loop and database session and records its progress after every chunk in a
+local SQLite table (IMPORT_JOBS_DB). Any worker process on the host can answer
+a poll from that table.
+
+Job status goes queued -> running -> completed | failed. The import is one
+transaction: rows_inserted / rows_updated count rows written so far and drop
+back to 0 if the job fails and is rolled back. Finished jobs are kept for
+IMPORT_JOB_RETENTION_HOURS (default 24).
+
+A job that made no progress for IMPORT_JOB_STALE_SECONDS (default 1800) while
+queued or running was left by a process that stopped or was recycled; it is
+marked failed when it is read and when a new job is submitted, so polls end.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import IO, Dict, Optional
+
+from ..db.database import JobSessionLocal
+from . import boq_catalog, boq_import, boq_search
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = os.getenv("IMPORT_JOBS_DB", os.path.join(tempfile.gettempdir(), "auto_proposal_import_jobs.db"))
+JOBS_DIR = os.getenv("IMPORT_JOBS_DIR", os.path.join(tempfile.gettempdir(), "auto_proposal_imports"))
+WORKERS = int(os.getenv("IMPORT_JOB_WORKERS", "2"))
+RETENTION_HOURS = int(os.getenv("IMPORT_JOB_RETENTION_HOURS", "24"))
+STALE_SECONDS = int(os.getenv("IMPORT_JOB_STALE_SECONDS", "1800"))
+ABANDONED = "Abandoned: the process running the import stopped"
+
+# Session factory for the job's own event loop; tests point it at their database
+session_factory = JobSessionLocal
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS import_jobs (
+    id TEXT PRIMARY KEY,
+    company_id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rows_parsed INTEGER NOT NULL DEFAULT 0,
+    rows_inserted INTEGER NOT NULL DEFAULT 0,
+    rows_updated INTEGER NOT NULL DEFAULT 0,
+    rows_unchanged INTEGER NOT NULL DEFAULT 0,
+    rows_rejected INTEGER NOT NULL DEFAULT 0,
+    already_imported INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    updated_at TEXT,
+    finished_at TEXT
+)
+"""
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_initialized_db: Optional[str] = None
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized_db
+    conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if _initialized_db != JOBS_DB:
+        # WAL lets polls read while a job is writing its progress
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(import_jobs)")}
+        if "updated_at" not in columns:
+            conn.execute("ALTER TABLE import_jobs ADD COLUMN updated_at TEXT")
+        _initialized_db = JOBS_DB
+    return conn
+
+
+def _execute(sql: str, parameters=()):
+    conn = _connect()
+    try:
+        return conn.execute(sql, parameters).fetchall()
+    finally:
+        conn.close()
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="boq-import")
+        return _executor
+
+
+def _spool_path(job_id: str, filename: str) -> str:
+    return os.path.join(JOBS_DIR, job_id + os.path.splitext(filename)[1])
+
+
+def _fail_abandoned(job_id: Optional[str] = None):
+    """Mark queued or running jobs (all, or job_id) failed if they made no progress for STALE_SECONDS."""
+    now = datetime.now()
+    cutoff = (now - timedelta(seconds=STALE_SECONDS)).isoformat()
+    where = "status IN ('queued', 'running') AND COALESCE(updated_at, started_at, created_at) < ?"
+    parameters = (cutoff,)
+    if job_id is not None:
+        where += " AND id = ?"
+        parameters += (job_id,)
+    abandoned = _execute(f"SELECT id, filename FROM import_jobs WHERE {where}", parameters)
+    for row in abandoned:
+        _execute(
+            "UPDATE import_jobs SET status = 'failed', rows_inserted = 0, rows_updated = 0, error = ?,"
+            f" finished_at = ? WHERE {where} AND id = ?",
+            (ABANDONED, now.isoformat(), *parameters, row["id"])
+        )
+        logger.warning("BOQ import job %s abandoned", row["id"])
+        try:
+            os.remove(_spool_path(row["id"], row["filename"]))
+        except OSError:
+            pass
+
+
+def get(job_id: str) -> Optional[Dict]:
+    """The job row as a dict, or None if it does not exist (or has expired)."""
+    _fail_abandoned(job_id)
+    rows = _execute("SELECT * FROM import_jobs WHERE id = ?", (job_id,))
+    if not rows:
+        return None
+    job = dict(rows[0])
+    job["job_id"] = job.pop("id")
+    job["already_imported"] = bool(job["already_imported"])
+    return job
+
+
+def submit(source: IO[bytes], filename: str, company_id: int) -> Dict:
+    """
+    Spool the upload to disk and queue its import; return the new job.
+
+    Blocking (file copy and SQLite write); call it from a threadpool.
+    """
+    boq_import.check_filename(filename)
+    cutoff = (datetime.now() - timedelta(hours=RETENTION_HOURS)).isoformat()
+    _execute("DELETE FROM import_jobs WHERE finished_at < ?", (cutoff,))
+    _fail_abandoned()
+
+    job_id = uuid.uuid4().hex
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = _spool_path(job_id, filename)
+    with open(path, "wb") as spool:
+        shutil.copyfileobj(source, spool)
+
+    _execute(
+        "INSERT INTO import_jobs (id, company_id, filename, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+        (job_id, company_id, filename, _now())
+    )
+    _get_executor().submit(_run, job_id, path, filename, company_id)
+    return get(job_id)
+
+
+def _report_progress(job_id: str, totals: Dict[str, int], **columns):
+    assignments = "".join(f", {column} = ?" for column in columns)
+    _execute(
+        "UPDATE import_jobs SET rows_parsed = ?, rows_inserted = ?, rows_updated = ?, rows_unchanged = ?,"
+        f" rows_rejected = ?, updated_at = ?{assignments} WHERE id = ?",
+        (sum(totals.values()), totals["inserted"], totals["updated"], totals["unchanged"], totals["rejected"],
+         _now(), *columns.values(), job_id)
+    )
+
+
+async def _import(job_id: str, path: str, filename: str, company_id: int) -> Dict:
+    async with session_factory() as db:
+        try:
+            with open(path, "rb") as source:
+                result = await boq_import.import_items(
+                    db, source, filename, company_id, include_items=False,
+                    on_progress=lambda totals: _report_progress(job_id, totals)
+                )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    boq_search.invalidate(company_id)
+    await boq_catalog.invalidate(company_id)
+    return result
+
+
+def _run(job_id: str, path: str, filename: str, company_id: int):
+    _execute("UPDATE import_jobs SET status = 'running', started_at = ? WHERE id = ?", (_now(), job_id))
+    try:
+        result = asyncio.run(_import(job_id, path, filename, company_id))
+    except Exception as e:
+        logger.exception("BOQ import job %s failed", job_id)
+        _execute(
+            "UPDATE import_jobs SET status = 'failed', rows_inserted = 0, rows_updated = 0, error = ?,"
+            " finished_at = ? WHERE id = ?",
+            (str(e), _now(), job_id)
+        )
+    else:
+        totals = {outcome: result[f"total_{outcome}"] for outcome in ("inserted", "updated", "unchanged", "rejected")}
+        _report_progress(job_id, totals, status="completed", already_imported=int(result["already_imported"]),
+                         finished_at=_now())
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,111 +1,472 @@
+"""
+Proposal (quotation) PDF rendering, shared by the API and the UI.
+
+render_proposal_pdf() builds the PDF in memory from the aggregated proposal
+(the /full response: proposal fields, client and items) and the company
+details, and returns its bytes. It is a plain function of its arguments, so
+render() runs it on a pool of PDF_RENDER_WORKERS processes (default: the CPU
+count, at most 4; 0 renders on the threadpool instead).
+
+Paragraph and table styles are built once at import. The ones that use the
+brand color (the logo's dominant color) are built once per color.
+
+Logos are stored content-addressed in PDF_LOGO_DIR: uploaded with the render
+request, or downloaded once from a company logo_url. Only https URLs on a host
+listed in PDF_LOGO_HOSTS (the S3 bucket host, comma-separated; empty disables
+downloads) are fetched, so a logo_url cannot make the server request internal
+addresses. The dominant color of each logo is computed once and kept next to it.
+"""
+import asyncio
+import hashlib
+import json
 import os
-from pathlib import Path
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from reportlab.lib.pagesizes import A4
+from functools import lru_cache
+from io import BytesIO
+from typing import Dict, List, Optional
+from urllib.parse import quote, urlsplit
+from xml.sax.saxutils import escape
+
+import numpy as np
+from PIL import Image as PILImage
 from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from ..core import models
-
-class PDFService:
-    def __init__(self, output_dir: str = "pdf_files"):
-        self.output_dir = output_dir
-        Path(output_dir).mkdir(exist_ok=True)
-
-    def generate_proposal_pdf(
-        self,
-        proposal: models.Proposal,
-        template: str = "default",
-        include_terms: bool = True
-    ) -> str:
-        """Generate PDF for a proposal and return the file path."""
-        
-        # Create filename
-        filename = f"proposal_{proposal.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        filepath = os.path.join(self.output_dir, filename)
-
-        # Create PDF document
-        doc = SimpleDocTemplate(filepath, pagesize=A4)
-        styles = getSampleStyleSheet()
-        story = []
-
-        # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=30,
-            alignment=1
-        )
-        story.append(Paragraph("PROJECT PROPOSAL", title_style))
-        story.append(Spacer(1, 20))
-
-        # Client info
-        client_info = f"""
-        <b>Client:</b> {proposal.client.name}<br/>
-        <b>Business Type:</b> {proposal.client.business_type}<br/>
-        <b>Email:</b> {proposal.client.email}<br/>
-        <b>Phone:</b> {proposal.client.phone}<br/>
-        <b>Date:</b> {datetime.now().strftime('%B %d, %Y')}<br/>
-        """
-        story.append(Paragraph(client_info, styles['Normal']))
-        story.append(Spacer(1, 20))
-
-        # Proposal details
-        proposal_info = f"""
-        <b>Title:</b> {proposal.title}<br/>
-        <b>Description:</b> {proposal.description or 'N/A'}<br/>
-        """
-        story.append(Paragraph(proposal_info, styles['Normal']))
-        story.append(Spacer(1, 20))
-
-        # Items table
-        if proposal.proposal_items:
-            table_data = [['Item', 'Description', 'Quantity', 'Unit Price', 'Total']]
-            for item in proposal.proposal_items:
-                table_data.append([
-                    item.item_name,
-                    item.description or '',
-                    f"{item.quantity:.2f}",
-                    f"${item.unit_price:,.2f}",
-                    f"${item.total:,.2f}"
-                ])
-
-            # Add total
-            table_data.extend([
-                ['', '', '', '', ''],
-                ['TOTAL', '', '', '', f"${proposal.amount:,.2f}"]
-            ])
-
-            # Create and style table
-            table = Table(table_data, colWidths=[2*inch, 2*inch, 1*inch, 1.25*inch, 1.25*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, -1), (-1, -1), colors.lightblue),
-                ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(table)
-
-        # Terms and conditions
-        if include_terms:
-            story.append(Spacer(1, 30))
-            story.append(Paragraph("<b>Terms and Conditions</b>", styles['Heading2']))
-            terms = """
-            1. All prices are valid for 30 days from the proposal date.
-            2. Payment terms: 50% advance, remaining upon completion.
-            3. Timeline will be finalized upon project initiation.
-            4. Changes to the scope may affect pricing and timeline.
-            """
-            story.append(Paragraph(terms, styles['Normal']))
-
-        # Build PDF
-        doc.build(story)
-        
-        return filepath
\ No newline at end of file
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from starlette.concurrency import run_in_threadpool
+
+RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+LOGO_DIR = os.getenv("PDF_LOGO_DIR", os.path.join(tempfile.gettempdir(), "auto_proposal_logos"))
+LOGO_HOSTS = {host.strip().lower() for host in os.getenv("PDF_LOGO_HOSTS", "").split(",") if host.strip()}
+MAX_LOGO_BYTES = int(os.getenv("PDF_MAX_LOGO_BYTES", str(5 * 1024 * 1024)))
+
+DEFAULT_BRAND_COLOR = "#3D2B1F"
+GST_RATE = 18
+
+# Bits kept per channel when grouping similar logo colors (32 levels per channel)
+_COLOR_BITS = 5
+
+PAGE_WIDTH = A4[0] - 1 * inch  # Account for margins
+BOQ_COLUMNS = [0.5 * inch, 3.2 * inch, 0.6 * inch, 1.2 * inch, 1.3 * inch]
+
+TERMS = [
+    "1. The above quotation is valid for 30 days from the date of issue.",
+    "2. Payment terms: 50% advance, 30% on material delivery, 20% on completion.",
+    "3. GST as applicable will be charged extra.",
+    "4. Any changes to the scope of work will be charged separately.",
+]
+
+# ==================== STYLES (built once) ====================
+_sample = getSampleStyleSheet()
+
+GRID_CELL = ParagraphStyle("GridCell", parent=_sample["Normal"], fontSize=9, leading=11, textColor=colors.black)
+TERMS_STYLE = ParagraphStyle("Terms", parent=_sample["Normal"], fontSize=9, leading=12, textColor=colors.black)
+
+HEADER_TABLE = TableStyle([
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ("LEFTPADDING", (0, 0), (-1, -1), 0),
+    ("RIGHTPADDING", (0, 0), (-1, -1), 0),
+])
+TOTAL_WRAPPER = TableStyle([
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ("LEFTPADDING", (0, 0), (-1, -1), 0),
+    ("RIGHTPADDING", (0, 0), (-1, -1), 0),
+    ("TOPPADDING", (0, 0), (-1, -1), 0),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
+])
+
+
+class BrandStyles:
+    """Styles that use the brand color."""
+
+    def __init__(self, brand_color: str):
+        brand = colors.HexColor(brand_color)
+        self.company = ParagraphStyle("CompanyInfo", parent=_sample["Normal"], fontSize=9, leading=12, textColor=brand)
+        self.title = ParagraphStyle("QuotationTitle", parent=_sample["Heading1"], fontSize=20, textColor=brand,
+                                    spaceAfter=15, alignment=TA_CENTER, fontName="Helvetica-Bold")
+        self.boq_heading = ParagraphStyle("BOQHeading", parent=_sample["Heading2"], fontSize=12, textColor=brand,
+                                          spaceAfter=10, fontName="Helvetica-Bold")
+        self.line = TableStyle([
+            ("LINEABOVE", (0, 0), (-1, 0), 2, brand),
+            ("TOPPADDING", (0, 0), (-1, -1), 0),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
+        ])
+        self.grid = TableStyle([
+            ("BACKGROUND", (0, 0), (-1, -1), colors.HexColor("#f8f8f8")),
+            ("BOX", (0, 0), (-1, -1), 1, brand),
+            ("INNERGRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ("LEFTPADDING", (0, 0), (-1, -1), 10),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 10),
+            ("TOPPADDING", (0, 0), (-1, -1), 10),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 10),
+        ])
+        self.boq = TableStyle([
+            # Header row in the brand color
+            ("BACKGROUND", (0, 0), (-1, 0), brand),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("FONTSIZE", (0, 0), (-1, 0), 10),
+            ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+            ("BOTTOMPADDING", (0, 0), (-1, 0), 10),
+            ("TOPPADDING", (0, 0), (-1, 0), 10),
+            # Data rows
+            ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+            ("FONTSIZE", (0, 1), (-1, -1), 9),
+            ("ALIGN", (0, 1), (0, -1), "CENTER"),  # S.No center
+            ("ALIGN", (2, 1), (2, -1), "CENTER"),  # Qty center
+            ("ALIGN", (3, 1), (3, -1), "LEFT"),    # Unit Price left align
+            ("ALIGN", (4, 1), (4, -1), "LEFT"),    # Amount left align
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            # Grid and borders
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ("BOX", (0, 0), (-1, -1), 1.5, brand),
+            ("LEFTPADDING", (0, 0), (-1, -1), 6),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 6),
+            ("TOPPADDING", (0, 1), (-1, -1), 8),
+            ("BOTTOMPADDING", (0, 1), (-1, -1), 8),
+            # Alternate row colors for better readability
+            ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f9f9f9")]),
+        ])
+        self.total = TableStyle([
+            ("ALIGN", (0, 0), (0, -1), "RIGHT"),
+            ("ALIGN", (1, 0), (1, -1), "LEFT"),  # Left align amounts to match BOQ
+            ("FONTNAME", (0, 0), (-1, -2), "Helvetica"),
+            ("FONTSIZE", (0, 0), (-1, -2), 10),
+            ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+            ("FONTSIZE", (0, -1), (-1, -1), 14),
+            ("TEXTCOLOR", (0, -1), (-1, -1), brand),
+            ("LINEABOVE", (0, -1), (-1, -1), 2, brand),
+            ("TOPPADDING", (0, -1), (-1, -1), 8),
+            ("BOTTOMPADDING", (0, 0), (-1, -2), 4),
+            ("LEFTPADDING", (0, 0), (-1, -1), 6),  # Match BOQ padding
+            ("RIGHTPADDING", (0, 0), (-1, -1), 6),
+        ])
+
+
+@lru_cache(maxsize=64)
+def brand_styles(brand_color: str) -> BrandStyles:
+    return BrandStyles(brand_color)
+
+
+brand_styles(DEFAULT_BRAND_COLOR)
+
+
+# ==================== LOGOS ====================
+# Dominant colors computed in this process, by (path, size, mtime)
+_color_memo: Dict[tuple, str] = {}
+
+
+def _dominant_color(logo_path: str) -> str:
+    """Most common color of the logo, ignoring near-white and near-black pixels."""
+    img = PILImage.open(logo_path)
+    # JPEGs can be decoded at a reduced scale directly
+    img.draft("RGB", (300, 300))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img = img.resize((150, 150), reducing_gap=2.0)
+    pixels = np.asarray(img, dtype=np.uint8).reshape(-1, 3)
+
+    # Filter out very light colors (background) and very dark (shadows)
+    pixels = pixels[~((pixels > 240).all(axis=1) | (pixels < 20).all(axis=1))]
+    if not len(pixels):
+        return DEFAULT_BRAND_COLOR
+
+    # Quantize so anti-aliased shades of one color count together, take the
+    # most common bin and use the average of its pixels
+    quantized = pixels.astype(np.int32) >> (8 - _COLOR_BITS)
+    bins = (quantized[:, 0] << (2 * _COLOR_BITS)) | (quantized[:, 1] << _COLOR_BITS) | quantized[:, 2]
+    dominant = pixels[bins == np.bincount(bins).argmax()].mean(axis=0).round().astype(int)
+    return "#{:02x}{:02x}{:02x}".format(*dominant)
+
+
+def logo_color(logo_path: str) -> str:
+    """
+    Dominant color of a logo, memoized per logo version (path, size and mtime)
+    in this process and in a <logo>.color.json file next to the logo.
+    """
+    try:
+        stat = os.stat(logo_path)
+        version = [stat.st_size, stat.st_mtime_ns]
+        memo_key = (logo_path, *version)
+        if memo_key in _color_memo:
+            return _color_memo[memo_key]
+
+        sidecar_path = f"{logo_path}.color.json"
+        try:
+            with open(sidecar_path, "r", encoding="utf-8") as f:
+                sidecar = json.load(f)
+            if sidecar.get("version") == version:
+                _color_memo[memo_key] = sidecar["color"]
+                return sidecar["color"]
+        except (OSError, ValueError, AttributeError):
+            pass
+
+        color = _dominant_color(logo_path)
+        try:
+            tmp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": version, "color": color}, f)
+            os.replace(tmp_path, sidecar_path)
+        except OSError as e:
+            print(f"⚠️  Could not save logo color: {e}")
+
+        _color_memo[memo_key] = color
+        return color
+    except Exception as e:
+        print(f"⚠️  Could not extract logo color: {e}")
+        return DEFAULT_BRAND_COLOR
+
+
+def store_logo(content: bytes, filename: str = "") -> str:
+    """Save logo bytes under their content hash; returns the path."""
+    extension = os.path.splitext(filename)[1].lower() or ".png"
+    os.makedirs(LOGO_DIR, exist_ok=True)
+    path = os.path.join(LOGO_DIR, hashlib.sha256(content).hexdigest() + extension)
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return path
+
+
+def logo_url_allowed(logo_url: Optional[str]) -> bool:
+    """True for an https URL on one of the PDF_LOGO_HOSTS."""
+    try:
+        parts = urlsplit(logo_url or "")
+        port = parts.port
+    except ValueError:
+        return False
+    return (parts.scheme == "https" and port in (None, 443) and not parts.username
+            and (parts.hostname or "") in LOGO_HOSTS)
+
+
+async def fetch_logo(logo_url: Optional[str]) -> Optional[str]:
+    """Local copy of an allowed logo URL (downloaded once), or None."""
+    if not logo_url:
+        return None
+    if not logo_url_allowed(logo_url):
+        print(f"⚠️  Not downloading logo {logo_url}: not an https URL on PDF_LOGO_HOSTS")
+        return None
+    os.makedirs(LOGO_DIR, exist_ok=True)
+    extension = os.path.splitext(logo_url.split("?")[0])[1].lower() or ".png"
+    path = os.path.join(LOGO_DIR, "url-" + hashlib.sha256(logo_url.encode()).hexdigest() + extension)
+    if os.path.exists(path):
+        return path
+
+    import httpx
+    try:
+        # Redirects are not followed: they could lead off the allowed hosts
+        async with httpx.AsyncClient(timeout=10, follow_redirects=False) as client:
+            async with client.stream("GET", logo_url) as response:
+                response.raise_for_status()
+                content = bytearray()
+                async for chunk in response.aiter_bytes():
+                    content += chunk
+                    if len(content) > MAX_LOGO_BYTES:
+                        print(f"⚠️  Logo {logo_url} is larger than {MAX_LOGO_BYTES} bytes")
+                        return None
+    except httpx.HTTPError as e:
+        print(f"⚠️  Could not download logo {logo_url}: {e}")
+        return None
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return path
+
+
+# ==================== RENDERING ====================
+def _text(value) -> str:
+    """A value as Paragraph markup (escaped)."""
+    return escape(str(value))
+
+
+def _company_lines(company: Dict) -> List[str]:
+    lines = []
+    if company.get("company_name"):
+        lines.append(f"<b><font size=14>{_text(company['company_name'])}</font></b>")
+    for field in ("address_line1", "address_line2"):
+        if company.get(field):
+            lines.append(_text(company[field]))
+    if company.get("city") or company.get("state") or company.get("postal_code"):
+        location = f"{company.get('city') or ''}, {company.get('state') or ''} - {company.get('postal_code') or ''}"
+        lines.append(_text(location.strip(", -")))
+    if company.get("email"):
+        lines.append(f"Email: {_text(company['email'])}")
+    if company.get("phone"):
+        lines.append(f"Phone: {_text(company['phone'])}")
+    if company.get("gst_number"):
+        lines.append(f"<b>GSTIN:</b> {_text(company['gst_number'])}")
+    return lines
+
+
+def _details(heading: str, fields, source: Optional[Dict]) -> List[Paragraph]:
+    cells = [Paragraph(f"<b><font size=10>{heading}</font></b>", GRID_CELL)]
+    for label, field, suffix in fields:
+        if source and source.get(field):
+            cells.append(Paragraph(f"<b>{label}:</b> {_text(source[field])}{suffix}", GRID_CELL))
+    return cells
+
+
+CLIENT_FIELDS = [
+    ("Name", "client_name", ""),
+    ("Mobile", "mobile_number", ""),
+    ("Email", "email_address", ""),
+    ("Address", "contact_address", ""),
+]
+PROJECT_FIELDS = [
+    ("Project", "title", ""),
+    ("Type", "project_type", ""),
+    ("Area", "area", " sq.ft"),
+    ("Description", "description", ""),
+    ("Materials", "material_preferences", ""),
+    ("Special Req", "special_requirement", ""),
+]
+
+
+def _boq(items: List[Dict], company: Dict, styles: BrandStyles) -> list:
+    rows = [[
+        Paragraph("<b>S.No</b>", GRID_CELL),
+        Paragraph("<b>Item Description</b>", GRID_CELL),
+        Paragraph("<b>Qty</b>", GRID_CELL),
+        Paragraph("<b>Unit Price (₹)</b>", GRID_CELL),
+        Paragraph("<b>Amount (₹)</b>", GRID_CELL),
+    ]]
+    total_amount = 0
+    for number, item in enumerate(items, 1):
+        qty = item.get("qty") or 0
+        unit_price = item.get("unit_price") or 0
+        amount = qty * unit_price
+        total_amount += amount
+
+        text = f"<b>{_text(item.get('item_name') or 'N/A')}</b>"
+        if item.get("description"):
+            text += f"<br/><font size=8>{_text(item['description'])}</font>"
+        rows.append([
+            Paragraph(str(number), GRID_CELL),
+            Paragraph(text, GRID_CELL),
+            Paragraph(str(qty), GRID_CELL),
+            Paragraph(f"{unit_price:,.2f}", GRID_CELL),
+            Paragraph(f"<b>{amount:,.2f}</b>", GRID_CELL),
+        ])
+
+    boq_table = Table(rows, colWidths=BOQ_COLUMNS)
+    boq_table.setStyle(styles.boq)
+
+    totals = [["Subtotal:", f"₹ {total_amount:,.2f}"]]
+    gst_amount = 0
+    if company.get("gst_number"):
+        gst_amount = total_amount * GST_RATE / 100
+        totals.append([f"GST ({GST_RATE}%):", f"₹ {gst_amount:,.2f}"])
+    totals.append(["", ""])  # Empty row for spacing
+    totals.append(["GRAND TOTAL:", f"₹ {total_amount + gst_amount:,.2f}"])
+
+    # The totals line up with the Unit Price and Amount columns of the BOQ
+    empty_width = sum(BOQ_COLUMNS[:3])
+    total_table = Table(totals, colWidths=BOQ_COLUMNS[3:])
+    total_table.setStyle(styles.total)
+    wrapper = Table([[Spacer(empty_width, 0), total_table]], colWidths=[empty_width, sum(BOQ_COLUMNS[3:])])
+    wrapper.setStyle(TOTAL_WRAPPER)
+
+    return [
+        Paragraph("BILL OF QUANTITIES", styles.boq_heading),
+        boq_table,
+        Spacer(1, 0.1 * inch),
+        wrapper,
+        Spacer(1, 0.3 * inch),
+    ]
+
+
+def render_proposal_pdf(proposal: Dict, company: Dict, logo_path: Optional[str] = None) -> bytes:
+    """
+    Render the quotation PDF of a proposal.
+
+    proposal is the aggregated proposal (ProposalFullResponse as a dict, with
+    client and items); company is CompanyDetailsResponse as a dict. The logo,
+    if given, is drawn in the header and sets the brand color.
+    """
+    logo = None
+    brand_color = DEFAULT_BRAND_COLOR
+    if logo_path and os.path.exists(logo_path):
+        try:
+            logo = Image(logo_path, width=1.2 * inch, height=1.2 * inch, kind="proportional")
+            brand_color = logo_color(logo_path)
+        except Exception as e:
+            print(f"⚠️  Could not load logo {logo_path}: {e}")
+    styles = brand_styles(brand_color)
+
+    story = []
+
+    # ==================== HEADER ====================
+    company_para = Paragraph("<br/>".join(_company_lines(company)), styles.company)
+    if logo:
+        header = Table([[logo, company_para]], colWidths=[1.5 * inch, PAGE_WIDTH - 1.5 * inch])
+    else:
+        header = Table([[company_para]], colWidths=[PAGE_WIDTH])
+    header.setStyle(HEADER_TABLE)
+    line = Table([[""]], colWidths=[PAGE_WIDTH])
+    line.setStyle(styles.line)
+    story += [header, Spacer(1, 0.2 * inch), line, Spacer(1, 0.15 * inch)]
+
+    story += [Paragraph("QUOTATION", styles.title), Spacer(1, 0.15 * inch)]
+
+    # ==================== CLIENT & PROJECT DETAILS ====================
+    project = _details("PROJECT DETAILS", PROJECT_FIELDS, proposal)
+    project.append(Paragraph(f"<b>Date:</b> {datetime.now().strftime('%d-%b-%Y')}", GRID_CELL))
+    grid = Table([[_details("CLIENT DETAILS", CLIENT_FIELDS, proposal.get("client")), project]],
+                 colWidths=[PAGE_WIDTH / 2 - 0.1 * inch, PAGE_WIDTH / 2 - 0.1 * inch])
+    grid.setStyle(styles.grid)
+    story += [grid, Spacer(1, 0.25 * inch)]
+
+    # ==================== BOQ ITEMS ====================
+    if proposal.get("items"):
+        story += _boq(proposal["items"], company, styles)
+
+    # ==================== TERMS & SIGNATURE ====================
+    story.append(Paragraph("<b>Terms & Conditions:</b>", TERMS_STYLE))
+    story += [Paragraph(term, TERMS_STYLE) for term in TERMS]
+    story.append(Spacer(1, 0.3 * inch))
+    story.append(Paragraph(
+        f"<br/><br/><b>For {_text(company.get('company_name') or 'Company Name')}</b><br/>"
+        "<br/><br/><br/>Authorized Signatory",
+        TERMS_STYLE
+    ))
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5 * inch, bottomMargin=0.5 * inch,
+                            leftMargin=0.5 * inch, rightMargin=0.5 * inch)
+    doc.build(story)
+    return buffer.getvalue()
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+async def render(proposal: Dict, company: Dict, logo_path: Optional[str] = None) -> bytes:
+    """render_proposal_pdf() on the worker processes (or the threadpool if PDF_RENDER_WORKERS=0)."""
+    global _executor
+    if RENDER_WORKERS <= 0:
+        return await run_in_threadpool(render_proposal_pdf, proposal, company, logo_path)
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+    return await asyncio.get_running_loop().run_in_executor(_executor, render_proposal_pdf, proposal, company, logo_path)
+
+
+def pdf_filename(proposal: Dict) -> str:
+    """<Title>_<id>.pdf with the title reduced to word characters."""
+    title = re.sub(r"[^\w\s-]", "", proposal.get("title") or "Proposal")
+    title = re.sub(r"[-\s]+", "_", title.strip())
+    return f"{title}_{proposal['id']}.pdf"
+
+
+def content_disposition(filename: str, disposition: str = "inline") -> str:
+    """Content-Disposition with an ASCII filename and the UTF-8 one per RFC 5987."""
+    fallback = re.sub(r'[^\x20-\x7e]|["\\]', "_", filename)
+    return f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
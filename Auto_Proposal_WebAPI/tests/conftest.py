@@ -0,0 +1,74 @@
+"""
+Shared fixtures: a SQLite database built from the models, and the app with
+its database dependencies pointed at it.
+
+A test module seeds the database in its own module fixture and builds its
+TestClient from the api fixture:
+
+    @pytest.fixture(scope="module")
+    def client(database, api):
+        with Session(database.engine) as db:
+            ...
+        return TestClient(api)
+
+The suite runs with AUTH_REQUIRED=false, so modules that do not test tenancy
+can call the API without a token; test_auth.py turns it on where it matters.
+"""
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+# Read when the app is imported
+os.environ.setdefault("AUTH_REQUIRED", "false")
+os.environ.setdefault("AUTH_TOKEN_SECRET", "test-secret")
+
+from auto_proposal.api.main import app
+from auto_proposal.db.database import get_db, get_async_db
+from auto_proposal.core import models
+
+
+class TestDatabase:
+    """A SQLite file with a sync and an async engine on it."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.engine = create_engine(f"sqlite:///{self.path}", connect_args={"check_same_thread": False})
+        self.async_engine = create_async_engine(f"sqlite+aiosqlite:///{self.path}", poolclass=NullPool)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.AsyncSessionLocal = async_sessionmaker(self.async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    def get_db(self):
+        db = self.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_async_db(self):
+        async with self.AsyncSessionLocal() as db:
+            yield db
+
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    """A fresh database with every table, per test module."""
+    db = TestDatabase(tmp_path_factory.mktemp("db") / "test.db")
+    models.Base.metadata.create_all(bind=db.engine)
+    yield db
+    models.Base.metadata.drop_all(bind=db.engine)
+    db.engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def api(database):
+    """The app using database; the previous dependency overrides are restored afterwards."""
+    saved = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = database.get_db
+    app.dependency_overrides[get_async_db] = database.get_async_db
+    yield app
+    app.dependency_overrides.clear()
+    app.dependency_overrides.update(saved)
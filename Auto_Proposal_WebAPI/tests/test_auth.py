@@ -0,0 +1,180 @@
+"""
+Login (one joined query, password checked off the request threads) and the
+bearer tokens it issues.
+"""
+import os
+import subprocess
+import sys
+
+import bcrypt
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from auto_proposal.api import security
+from auto_proposal.api.routes import auth
+from auto_proposal.core import models
+
+selects = []
+
+
+def count_select(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().upper().startswith("SELECT"):
+        selects.append(statement)
+
+
+@pytest.fixture(scope="module")
+def client(database, api):
+    event.listen(database.async_engine.sync_engine, "before_cursor_execute", count_select)
+    password_hash = bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds=4)).decode()
+    with Session(database.engine) as db:
+        company = models.CompanyDetails(company_name="Auth Co", city="Pune")
+        other = models.CompanyDetails(company_name="Other Co")
+        db.add_all([company, other])
+        db.flush()
+        db.add(models.UserDetails(company_id=company.id, full_name="Auth User",
+                                  email="user@example.com", password_hash=password_hash))
+        db.add(models.UserDetails(company_id=other.id, full_name="Other User",
+                                  email="other@example.com", password_hash=password_hash))
+        db.commit()
+
+    return TestClient(api)
+
+
+def login(client, company_name="Auth Co", email="user@example.com", password="secret"):
+    return client.post("/api/auth/login",
+                       json={"company_name": company_name, "email": email, "password": password})
+
+
+def test_login_success_in_one_query(client):
+    selects.clear()
+    response = login(client)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["success"] and body["access_granted"]
+    assert body["user"]["email"] == "user@example.com"
+    assert body["user"]["company"]["company_name"] == "Auth Co"
+    assert body["user"]["company"]["city"] == "Pune"
+    assert len(selects) == 1
+
+
+@pytest.mark.parametrize("kwargs,status_code,error_code", [
+    ({"company_name": "Missing Co"}, 404, "INVALID_COMPANY"),
+    ({"email": "missing@example.com"}, 404, "INVALID_USER"),
+    ({"email": "other@example.com"}, 403, "COMPANY_MISMATCH"),
+    ({"password": "wrong"}, 401, "INVALID_PASSWORD"),
+])
+def test_login_errors(client, kwargs, status_code, error_code):
+    response = login(client, **kwargs)
+    assert response.status_code == status_code
+    assert response.json()["detail"]["error_code"] == error_code
+
+
+def test_login_on_threadpool(client, monkeypatch):
+    monkeypatch.setattr(auth, "PASSWORD_WORKERS", 0)
+    assert login(client).status_code == 200
+    assert login(client, password="wrong").status_code == 401
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_login_issues_tokens(client):
+    body = login(client).json()
+    assert body["token_type"] == "bearer"
+    assert body["expires_in"] == security.ACCESS_TOKEN_MINUTES * 60
+
+    principal = security.decode_token(body["access_token"], "access")
+    assert principal.company_id == body["user"]["company_id"]
+    assert principal.user_id == body["user"]["id"]
+
+
+def test_token_authorizes_own_company_without_queries(client):
+    body = login(client).json()
+    own, other = body["user"]["company_id"], body["user"]["company_id"] + 1
+    headers = bearer(body["access_token"])
+
+    assert client.get(f"/api/clients/company/{own}", headers=headers).status_code == 200
+
+    selects.clear()
+    response = client.get(f"/api/clients/company/{other}", headers=headers)
+    assert response.status_code == 403
+    assert response.json()["detail"]["error_code"] == "COMPANY_MISMATCH"
+    assert selects == []
+
+
+def test_invalid_tokens_are_rejected(client):
+    body = login(client).json()
+    for token in (body["access_token"][:-2] + "xx", body["refresh_token"]):
+        response = client.get("/api/clients/company/1", headers=bearer(token))
+        assert response.status_code == 401
+        assert response.json()["detail"]["error_code"] == "INVALID_TOKEN"
+
+
+def test_auth_required(client, monkeypatch):
+    monkeypatch.setattr(security, "AUTH_REQUIRED", True)
+    assert client.get("/api/clients/company/1").status_code == 401
+    assert login(client).status_code == 200
+    token = login(client).json()["access_token"]
+    assert client.get("/api/clients/company/1", headers=bearer(token)).status_code == 200
+
+
+def test_refresh(client):
+    body = login(client).json()
+    response = client.post("/api/auth/refresh", json={"refresh_token": body["refresh_token"]})
+    assert response.status_code == 200, response.text
+    assert security.decode_token(response.json()["access_token"], "access").user_id == body["user"]["id"]
+
+    response = client.post("/api/auth/refresh", json={"refresh_token": body["access_token"]})
+    assert response.status_code == 401
+
+
+def user_id(database, email):
+    with Session(database.engine) as db:
+        return db.query(models.UserDetails).filter(models.UserDetails.email == email).one().id
+
+
+def test_set_password_needs_a_token_of_the_users_company(client, database):
+    other = user_id(database, "other@example.com")
+    headers = bearer(login(client).json()["access_token"])
+
+    # Rejected without a token even though AUTH_REQUIRED is off here
+    response = client.post(f"/api/auth/set-password/{other}", params={"password": "taken"})
+    assert response.status_code == 401
+    assert response.json()["detail"]["error_code"] == "NOT_AUTHENTICATED"
+
+    response = client.post(f"/api/auth/set-password/{other}", params={"password": "taken"}, headers=headers)
+    assert response.status_code == 403
+    assert response.json()["detail"]["error_code"] == "COMPANY_MISMATCH"
+    assert login(client, company_name="Other Co", email="other@example.com", password="taken").status_code == 401
+
+    own = user_id(database, "user@example.com")
+    response = client.post(f"/api/auth/set-password/{own}", params={"password": "changed"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert login(client, password="changed").status_code == 200
+    client.post(f"/api/auth/set-password/{own}", params={"password": "secret"}, headers=headers)
+
+
+def import_security(**env):
+    """Import security.py in a fresh interpreter with env; returns (exit code, stdout + stderr)."""
+    env = {name: value for name, value in os.environ.items() if not name.startswith("AUTH_")} | env
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    code = "from auto_proposal.api import security; print('required' if security.AUTH_REQUIRED else 'optional')"
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=60)
+    return result.returncode, result.stdout + result.stderr
+
+
+def test_tokens_are_required_by_default():
+    assert import_security(AUTH_TOKEN_SECRET="key") == (0, "required\n")
+
+
+def test_startup_fails_without_a_secret():
+    code, output = import_security()
+    assert code != 0
+    assert "AUTH_TOKEN_SECRET is not set" in output
+
+    # Unless anonymous access was opted into for development
+    code, output = import_security(AUTH_REQUIRED="false")
+    assert code == 0 and output.endswith("optional\n")
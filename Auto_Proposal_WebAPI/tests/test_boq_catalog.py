@@ -0,0 +1,173 @@
+"""
+BOQ catalog cache: read-through, paging from the cache and invalidation.
+"""
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from auto_proposal.core import models
+from auto_proposal.services import boq_catalog
+
+selects = []
+
+
+def count_selects(conn, cursor, statement, parameters, context, executemany):
+    if "PseApBoqItems" in statement and statement.lstrip().upper().startswith("SELECT"):
+        selects.append(statement)
+
+
+@pytest.fixture(scope="module")
+def client(database, api):
+    event.listen(database.async_engine.sync_engine, "before_cursor_execute", count_selects)
+    with Session(database.engine) as db:
+        company = models.CompanyDetails(company_name="Catalog Co")
+        db.add(company)
+        db.flush()
+        for i in range(25):
+            db.add(models.PseApBoqItems(company_id=company.id, project_type="Office" if i % 2 else "Home",
+                                        title=f"Item {i}", description=f"Catalog item {i}", basic_rate=i))
+        db.commit()
+
+    boq_catalog.backend.clear()
+    yield TestClient(api)
+    boq_catalog.backend.clear()
+
+
+def get(client, path):
+    selects.clear()
+    response = client.get(path)
+    assert response.status_code == 200, response.text
+    return response
+
+
+def test_project_types_are_cached(client):
+    misses = boq_catalog.stats.misses["project_types"]
+    hits = boq_catalog.stats.hits["project_types"]
+
+    assert sorted(get(client, "/api/boq-items/project-types/1").json()) == ["Home", "Office"]
+    assert selects
+    assert sorted(get(client, "/api/boq-items/project-types/1").json()) == ["Home", "Office"]
+    assert not selects
+    assert boq_catalog.stats.misses["project_types"] == misses + 1
+    assert boq_catalog.stats.hits["project_types"] == hits + 1
+
+
+def test_cached_pages_match_the_database(client):
+    pages, cursor = [], None
+    while True:
+        path = "/api/boq-items/?company_id=1&project_type=Office&limit=5"
+        response = get(client, path + (f"&cursor={cursor}" if cursor else ""))
+        pages.append([item["sno"] for item in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    # The last page came from the cache
+    assert not selects
+    uncached = client.get("/api/boq-items/?project_type=Office&limit=500").json()
+    assert [sno for page in pages for sno in page] == [item["sno"] for item in uncached]
+    assert [len(page) for page in pages] == [5, 5, 2]
+
+
+def test_writes_invalidate_the_cache(client):
+    get(client, "/api/boq-items/?company_id=1&project_type=Office")
+
+    created = client.post("/api/boq-items/", json={"company_id": 1, "project_type": "Office",
+                                                   "title": "New", "description": "New item"}).json()
+    assert created["sno"] in [item["sno"] for item in get(client, "/api/boq-items/?company_id=1&project_type=Office").json()]
+    assert selects
+
+    client.put(f"/api/boq-items/{created['sno']}", json={"project_type": "Shop"})
+    assert "Shop" in get(client, "/api/boq-items/project-types/1").json()
+
+    client.delete(f"/api/boq-items/{created['sno']}")
+    assert "Shop" not in get(client, "/api/boq-items/project-types/1").json()
+
+
+def test_large_slices_are_read_from_the_database(client, monkeypatch):
+    monkeypatch.setattr(boq_catalog, "MAX_ITEMS", 10)
+    boq_catalog.backend.clear()
+
+    first = get(client, "/api/boq-items/?company_id=1&limit=3")
+    second = get(client, "/api/boq-items/?company_id=1&limit=3")
+    assert selects
+    assert first.json() == second.json()
+
+
+def test_memory_backend_lru_and_ttl():
+    cache = boq_catalog.MemoryBackend(max_entries=2, ttl=60)
+    cache.set(1, "types", ["a"], cache.generation(1))
+    cache.set(2, "types", ["b"], cache.generation(2))
+    cache.get(1, "types")
+    cache.set(3, "types", ["c"], cache.generation(3))
+    assert cache.get(2, "types") is None
+    assert cache.get(1, "types") == ["a"]
+
+    # A fill that started before an invalidation is discarded
+    generation = cache.generation(1)
+    cache.invalidate(1)
+    cache.set(1, "types", ["stale"], generation)
+    assert cache.get(1, "types") is None
+
+    expiring = boq_catalog.MemoryBackend(max_entries=2, ttl=0)
+    expiring.set(1, "types", ["a"], 0)
+    time.sleep(0.01)
+    assert expiring.get(1, "types") is None
+
+
+def test_redis_backend_generations(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    cache = boq_catalog.RedisBackend(fakeredis.FakeRedis(server=server), ttl=60)
+    other_process = boq_catalog.RedisBackend(fakeredis.FakeRedis(server=server), ttl=60)
+
+    cache.set(1, "types", ["a"], cache.generation(1))
+    assert other_process.get(1, "types") == ["a"]
+
+    # A fill that started before an invalidation in another process is discarded
+    generation = cache.generation(1)
+    other_process.invalidate(1)
+    assert cache.generation(1) == generation + 1
+    cache.set(1, "types", ["stale"], generation)
+    assert cache.get(1, "types") is None
+
+    # ...also when the invalidation lands between the version check and EXEC
+    generation = cache.generation(1)
+    pipeline = cache.client.pipeline
+
+    def racing_pipeline():
+        pipe = pipeline()
+        multi = pipe.multi
+
+        def invalidate_then_multi():
+            other_process.invalidate(1)
+            multi()
+
+        pipe.multi = invalidate_then_multi
+        return pipe
+
+    monkeypatch.setattr(cache.client, "pipeline", racing_pipeline)
+    cache.set(1, "types", ["stale"], generation)
+    assert cache.get(1, "types") is None
+
+    # Other companies are unaffected
+    cache.set(2, "types", ["b"], cache.generation(2))
+    assert cache.get(2, "types") == ["b"]
+
+
+def test_routes_with_redis_backend(client, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    monkeypatch.setattr(boq_catalog, "backend", boq_catalog.RedisBackend(fakeredis.FakeRedis(), ttl=60))
+
+    assert sorted(get(client, "/api/boq-items/project-types/1").json()) == ["Home", "Office"]
+    assert sorted(get(client, "/api/boq-items/project-types/1").json()) == ["Home", "Office"]
+    assert not selects
+
+    created = client.post("/api/boq-items/", json={"company_id": 1, "project_type": "Garage",
+                                                   "title": "Door", "description": "Roller door"}).json()
+    assert "Garage" in get(client, "/api/boq-items/project-types/1").json()
+    client.delete(f"/api/boq-items/{created['sno']}")
+    assert "Garage" not in get(client, "/api/boq-items/project-types/1").json()
@@ -0,0 +1,277 @@
+"""
+Excel BOQ import: streaming parse, chunked insert, the import routes and import jobs.
+"""
+import io
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import openpyxl
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from auto_proposal.core import models
+from auto_proposal.services import boq_import, import_jobs
+
+HEADER = ["ProjectType", "Title", "Description", "Unit", "BasicRate", "PremiumRate"]
+ROWS = [
+    ["Office", "Partition", "Gypsum partition", "sqft", 120, 150],
+    ["Office", "Ceiling", "  Grid ceiling  ", "sqft", "1,250", None],
+    ["Office", "No rate", "Skipped, no rate", "sqft", None, None],
+    ["Office", "No description", None, "sqft", 10, 20],
+    [None, None, "Painting", None, None, "45.5"],
+]
+
+
+def workbook_bytes(rows, header=HEADER):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="module")
+def client(database, api):
+    with Session(database.engine) as db:
+        db.add(models.CompanyDetails(company_name="Import Co"))
+        db.commit()
+
+    saved_jobs = (import_jobs.JOBS_DB, import_jobs.JOBS_DIR, import_jobs.session_factory)
+    import_jobs.JOBS_DB = os.path.join(os.path.dirname(database.path), "jobs.db")
+    import_jobs.JOBS_DIR = os.path.join(os.path.dirname(database.path), "spool")
+    import_jobs.session_factory = database.AsyncSessionLocal
+    yield TestClient(api)
+    import_jobs.JOBS_DB, import_jobs.JOBS_DIR, import_jobs.session_factory = saved_jobs
+
+
+def upload(contents, filename="boq.xlsx"):
+    return {"file": (filename, contents, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+
+
+def test_parse_cleans_and_rejects_rows_per_chunk():
+    chunks = list(boq_import.parse(io.BytesIO(workbook_bytes(ROWS)), "boq.xlsx", chunk_size=2))
+
+    assert len(chunks) == 3
+    records = [record for chunk_records, _ in chunks for record in chunk_records]
+    assert sum(rejected for _, rejected in chunks) == 2
+    assert [record["description"] for record in records] == ["Gypsum partition", "Grid ceiling", "Painting"]
+    assert records[1]["basic_rate"] == 1250 and records[1]["premium_rate"] is None
+    assert records[2]["project_type"] is None and records[2]["premium_rate"] == 45.5
+
+
+def test_missing_columns_is_rejected():
+    with pytest.raises(boq_import.BoqImportError, match="PremiumRate"):
+        list(boq_import.parse(io.BytesIO(workbook_bytes([], header=HEADER[:-1])), "boq.xlsx"))
+
+
+def test_preview(client):
+    response = client.post("/api/boq-items/import-excel/preview?company_id=1", files=upload(workbook_bytes(ROWS)))
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["total_rows"] == 3
+    assert body["rejected_rows"] == 2
+    assert all(item["company_id"] == 1 for item in body["items"])
+
+
+def test_save_returns_inserted_snos(client, database):
+    response = client.post("/api/boq-items/import-excel/save?company_id=1", files=upload(workbook_bytes(ROWS)))
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["total_imported"] == 3
+    assert body["total_inserted"] == 3
+    assert body["total_rejected"] == 2
+    with Session(database.engine) as db:
+        for item in body["items"]:
+            stored = db.get(models.PseApBoqItems, item["sno"])
+            assert stored.description == item["description"]
+            assert stored.company_id == 1
+
+
+def test_reimport_upserts_instead_of_duplicating(client, database):
+    rows = [["Dedup", f"Item {i}", f"Dedup item {i}", "sqft", 10, 20] for i in range(5)]
+    first = client.post("/api/boq-items/import-excel/save?company_id=1", files=upload(workbook_bytes(rows)))
+    assert first.json()["total_inserted"] == 5
+
+    rows[0][4] = 11                                  # new rate
+    rows[1][2] = " Dedup item 1 "                    # same row after trimming
+    rows.append(["Dedup", "Item 5", "Dedup item 5", "sqft", 10, 20])
+    rows.append(rows[-1])                            # repeated within the file
+    second = client.post("/api/boq-items/import-excel/save?company_id=1", files=upload(workbook_bytes(rows)))
+
+    body = second.json()
+    assert second.status_code == 200, second.text
+    assert (body["total_inserted"], body["total_updated"], body["total_unchanged"]) == (1, 1, 5)
+    assert [item["outcome"] for item in body["items"]][:2] == ["updated", "unchanged"]
+    with Session(database.engine) as db:
+        stored = db.execute(select(models.PseApBoqItems)
+                            .where(models.PseApBoqItems.project_type == "Dedup")).scalars().all()
+    assert len(stored) == 6
+    assert {item.basic_rate for item in stored if item.title == "Item 0"} == {11}
+
+
+def test_identical_file_is_not_imported_again(client):
+    contents = workbook_bytes([["Same", "Item", "Same file item", "sqft", 10, 20]])
+    first = client.post("/api/boq-items/import-excel/save?company_id=1", files=upload(contents))
+    assert first.json()["already_imported"] is False
+
+    second = client.post("/api/boq-items/import-excel/save?company_id=1", files=upload(contents))
+    assert second.json()["already_imported"] is True
+    assert second.json()["total_imported"] == 0
+
+    # Editing the catalog forgets imported files, so the upload restores the rate
+    sno = first.json()["items"][0]["sno"]
+    client.put(f"/api/boq-items/{sno}", json={"basic_rate": 99})
+    third = client.post("/api/boq-items/import-excel/save?company_id=1", files=upload(contents))
+    assert third.json()["already_imported"] is False
+    assert third.json()["total_updated"] == 1
+
+
+def test_creating_a_duplicate_item_is_rejected(client):
+    item = {"company_id": 1, "project_type": "Manual", "title": "Item", "description": "Manual item", "unit": "sqft"}
+    assert client.post("/api/boq-items/", json=item).status_code == 201
+
+    response = client.post("/api/boq-items/", json={**item, "basic_rate": 5})
+    assert response.status_code == 400
+
+
+def test_save_without_items_for_large_sheets(client, database):
+    rows = [["Office", f"Item {i}", f"Item {i}", "sqft", i + 1, None] for i in range(boq_import.CHUNK_SIZE + 5)]
+    with Session(database.engine) as db:
+        before = db.execute(select(func.count()).select_from(models.PseApBoqItems)).scalar()
+
+    response = client.post("/api/boq-items/import-excel/save?company_id=1&include_items=false",
+                           files=upload(workbook_bytes(rows)))
+
+    assert response.status_code == 200, response.text
+    assert "items" not in response.json()
+    assert response.json()["total_imported"] == len(rows)
+    with Session(database.engine) as db:
+        after = db.execute(select(func.count()).select_from(models.PseApBoqItems)).scalar()
+    assert after - before == len(rows)
+
+
+def test_save_rejects_non_excel_upload(client):
+    response = client.post("/api/boq-items/import-excel/save?company_id=1", files=upload(b"a,b", "boq.csv"))
+
+    assert response.status_code == 400
+
+
+def wait_for_job(client, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(f"/api/boq-items/import-jobs/{job_id}")
+        assert response.status_code == 200, response.text
+        job = response.json()
+        if job["status"] not in ("queued", "running") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+def test_import_job_runs_in_background(client):
+    rows = [["Job", f"Item {i}", f"Job item {i}", "sqft", None if i % 5 == 0 else i, None]
+            for i in range(boq_import.CHUNK_SIZE * 2 + 5)]
+    response = client.post("/api/boq-items/import-jobs?company_id=1", files=upload(workbook_bytes(rows)))
+
+    assert response.status_code == 202, response.text
+    assert response.json()["status"] in ("queued", "running")
+    job = wait_for_job(client, response.json()["job_id"])
+    assert job["status"] == "completed", job
+    assert job["rows_rejected"] == len(rows[::5])
+    assert job["rows_inserted"] == len(rows) - job["rows_rejected"]
+    assert job["rows_parsed"] == len(rows)
+    assert job["finished_at"] is not None
+    assert not os.listdir(import_jobs.JOBS_DIR)
+
+
+def test_failed_import_job_reports_error(client):
+    response = client.post("/api/boq-items/import-jobs?company_id=1",
+                           files=upload(workbook_bytes(ROWS, header=HEADER[:-1])))
+
+    assert response.status_code == 202, response.text
+    job = wait_for_job(client, response.json()["job_id"])
+    assert job["status"] == "failed"
+    assert "PremiumRate" in job["error"]
+    assert job["rows_inserted"] == 0
+
+
+def test_import_job_rejects_non_excel_upload(client):
+    response = client.post("/api/boq-items/import-jobs?company_id=1", files=upload(b"a,b", "boq.csv"))
+
+    assert response.status_code == 400
+
+
+def test_unknown_import_job(client):
+    assert client.get("/api/boq-items/import-jobs/missing").status_code == 404
+
+
+def left_behind(status, minutes_ago, started=True):
+    """A job row as a process that stopped mid-import leaves it, with its spooled upload."""
+    job_id = f"left-{status}-{minutes_ago}"
+    at = (datetime.now() - timedelta(minutes=minutes_ago)).isoformat()
+    import_jobs._execute(
+        "INSERT INTO import_jobs (id, company_id, filename, status, rows_inserted, created_at, started_at)"
+        " VALUES (?, 1, 'boq.xlsx', ?, 7, ?, ?)",
+        (job_id, status, at, at if started else None)
+    )
+    os.makedirs(import_jobs.JOBS_DIR, exist_ok=True)
+    with open(import_jobs._spool_path(job_id, "boq.xlsx"), "wb") as spool:
+        spool.write(b"xlsx")
+    return job_id
+
+
+def test_abandoned_job_is_failed_when_polled(client, monkeypatch):
+    monkeypatch.setattr(import_jobs, "STALE_SECONDS", 600)
+    stale = left_behind("running", minutes_ago=11)
+    recent = left_behind("running", minutes_ago=1)
+
+    job = client.get(f"/api/boq-items/import-jobs/{stale}").json()
+
+    assert job["status"] == "failed"
+    assert job["error"] == import_jobs.ABANDONED
+    assert job["rows_inserted"] == 0 and job["finished_at"] is not None
+    assert not os.path.exists(import_jobs._spool_path(stale, "boq.xlsx"))
+    assert client.get(f"/api/boq-items/import-jobs/{recent}").json()["status"] == "running"
+    os.remove(import_jobs._spool_path(recent, "boq.xlsx"))
+
+
+def test_abandoned_jobs_are_failed_on_submit(client, monkeypatch):
+    monkeypatch.setattr(import_jobs, "STALE_SECONDS", 600)
+    queued = left_behind("queued", minutes_ago=20, started=False)
+
+    response = client.post("/api/boq-items/import-jobs?company_id=1", files=upload(workbook_bytes(ROWS)))
+    assert response.status_code == 202, response.text
+
+    row = import_jobs._execute("SELECT status, error FROM import_jobs WHERE id = ?", (queued,))[0]
+    assert (row["status"], row["error"]) == ("failed", import_jobs.ABANDONED)
+    assert wait_for_job(client, response.json()["job_id"])["status"] == "completed"
+
+
+def test_progress_keeps_a_long_import_alive(client, monkeypatch):
+    monkeypatch.setattr(import_jobs, "STALE_SECONDS", 600)
+    job_id = left_behind("running", minutes_ago=30)
+
+    import_jobs._report_progress(job_id, {"inserted": 1, "updated": 0, "unchanged": 0, "rejected": 0})
+
+    assert import_jobs.get(job_id)["status"] == "running"
+    os.remove(import_jobs._spool_path(job_id, "boq.xlsx"))
+
+
+def test_job_table_from_before_progress_times_is_migrated(client, monkeypatch, tmp_path):
+    old_db = str(tmp_path / "old_jobs.db")
+    with sqlite3.connect(old_db) as conn:
+        conn.execute(import_jobs._SCHEMA.replace("    updated_at TEXT,\n", ""))
+        conn.execute("INSERT INTO import_jobs (id, company_id, filename, status, created_at)"
+                     " VALUES ('old', 1, 'boq.xlsx', 'queued', '2000-01-01T00:00:00')")
+    conn.close()
+    monkeypatch.setattr(import_jobs, "JOBS_DB", old_db)
+
+    assert import_jobs.get("old")["status"] == "failed"
@@ -0,0 +1,165 @@
+"""
+BOQ search: ranking, company and project scoping, the MySQL statements, and
+building the in-process index once under concurrent searches.
+"""
+import asyncio
+import time
+
+import anyio.to_thread
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import Session
+
+from auto_proposal.core import models
+from auto_proposal.services import boq_search
+
+ROWS = [
+    # (company, project type, title, description)
+    (1, "Office", "Concrete slab", "Ready mix concrete for floors"),
+    (1, "Office", "Floor tiles", "Tiles laid on a concrete screed"),
+    (1, "Residential", "Concrete stairs", "Precast steps"),
+    (1, "Office", "PVC pipe 110mm", "Drain pipe"),
+    (1, "Office", "Gypsum ceiling", "Board ceiling with PVC trim"),
+    (1, "Office", "Steel beam", "UB 203x133"),
+    (2, "Office", "Concrete slab", "Other company's slab"),
+]
+
+
+@pytest.fixture(scope="module")
+def client(database, api):
+    with Session(database.engine) as db:
+        db.add_all([models.CompanyDetails(company_name="Search Co"), models.CompanyDetails(company_name="Other Co")])
+        db.flush()
+        for company_id, project_type, title, description in ROWS:
+            db.add(models.PseApBoqItems(company_id=company_id, project_type=project_type,
+                                        title=title, description=description, unit="sqm"))
+        db.commit()
+    # Indexes cached by another module's database would be stale here
+    boq_search.invalidate(1, 2)
+    yield TestClient(api)
+    boq_search.invalidate(1, 2)
+
+
+def titles(client, query, company_id=1, **params):
+    response = client.get("/api/boq-items/search/", params={"query": query, "company_id": company_id, **params})
+    assert response.status_code == 200, response.text
+    return [(item["company_id"], item["title"]) for item in response.json()]
+
+
+def test_title_hits_rank_above_description_hits(client):
+    assert titles(client, "concrete") == [
+        (1, "Concrete slab"), (1, "Concrete stairs"), (1, "Floor tiles"),
+    ]
+
+
+def test_title_hit_ranks_first(client):
+    # "pvc" is in one title and one description; the title hit wins
+    assert titles(client, "pvc") == [(1, "PVC pipe 110mm"), (1, "Gypsum ceiling")]
+
+
+def test_every_word_must_match(client):
+    # Both rows have one title hit; the rarer word "floor" weighs more
+    assert titles(client, "concrete floor") == [(1, "Floor tiles"), (1, "Concrete slab")]
+    assert titles(client, "concrete steel") == []
+
+
+def test_words_match_inside_words(client):
+    assert titles(client, "crete stai") == [(1, "Concrete stairs")]
+    assert titles(client, "ub") == [(1, "Steel beam")]
+
+
+def test_results_stay_in_the_company(client):
+    assert titles(client, "slab", company_id=2) == [(2, "Concrete slab")]
+    assert titles(client, "tiles", company_id=2) == []
+    assert titles(client, "slab", company_id=3) == []
+
+
+def test_project_type_filter(client):
+    assert titles(client, "concrete", project_type="Residential") == [(1, "Concrete stairs")]
+    assert titles(client, "concrete", project_type="Retail") == []
+
+
+def test_paging_keeps_rank_order(client):
+    first = titles(client, "concrete", limit=2)
+    rest = titles(client, "concrete", skip=2, limit=2)
+    assert first + rest == titles(client, "concrete")
+
+
+def test_like_fallback_statement_finds_infix_and_short_words(client, database):
+    def run(terms, company_id=1, project_type=None):
+        with Session(database.engine) as db:
+            statement = boq_search._like_statement(company_id, terms, project_type)
+            return [item.title for item in db.execute(statement).scalars()]
+
+    assert run(["crete"]) == ["Concrete slab", "Concrete stairs", "Floor tiles"]
+    assert run(["crete"], project_type="Office") == ["Concrete slab", "Floor tiles"]
+    assert run(["crete"], company_id=2) == ["Concrete slab"]
+    assert run(["ub", "203"]) == ["Steel beam"]
+    # LIKE wildcards in a word are matched literally
+    assert run(["pipe_110"]) == []
+
+
+def test_fulltext_statement_requires_short_words_with_like():
+    statement = boq_search._fulltext_statement(1, ["concrete", "ab"], "Office")
+    compiled = statement.compile(dialect=mysql.dialect())
+    sql = str(compiled)
+
+    assert "MATCH" in sql and "IN BOOLEAN MODE" in sql
+    assert "+concrete*" in compiled.params.values()
+    assert "LIKE" in sql and "ab" in compiled.params.values()
+    assert "`PseApBoqItems`.`CompanyID` = " in sql and "`PseApBoqItems`.`ProjectType` = " in sql
+
+
+@pytest.fixture
+def slow_builds(monkeypatch):
+    """Count index builds, each taking a moment so concurrent searches pile up."""
+    builds = []
+
+    class SlowIndex(boq_search.BoqSearchIndex):
+        def __init__(self, rows):
+            builds.append(len(rows))
+            time.sleep(0.2)
+            super().__init__(rows)
+
+    monkeypatch.setattr(boq_search, "BoqSearchIndex", SlowIndex)
+    boq_search.invalidate(1)
+    yield builds
+    boq_search.invalidate(1)
+
+
+def test_concurrent_searches_on_a_cold_index_build_it_once(client, database, slow_builds):
+    async def search():
+        async with database.AsyncSessionLocal() as db:
+            return await boq_search.get_index(db, 1)
+
+    async def main():
+        # Far more searches than threads: waiting for the build must not take one
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 2
+        return await asyncio.wait_for(asyncio.gather(*(search() for _ in range(60))), timeout=20)
+
+    indexes = asyncio.run(main())
+
+    assert slow_builds == [6]
+    assert all(index is indexes[0] for index in indexes)
+    assert not boq_search._builds
+
+
+def test_cancelled_build_is_taken_over(client, database, slow_builds):
+    async def main():
+        async with database.AsyncSessionLocal() as first, database.AsyncSessionLocal() as second:
+            owner = asyncio.create_task(boq_search.get_index(first, 1))
+            while not slow_builds:
+                await asyncio.sleep(0.01)
+            waiter = asyncio.create_task(boq_search.get_index(second, 1))
+            await asyncio.sleep(0.01)
+            owner.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await owner
+            return await asyncio.wait_for(waiter, timeout=10)
+
+    index = asyncio.run(main())
+
+    assert len(index) == 6
+    assert len(slow_builds) == 2
+    assert not boq_search._builds
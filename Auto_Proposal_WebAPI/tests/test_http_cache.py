@@ -0,0 +1,87 @@
+"""
+Conditional GETs: ETag / Last-Modified validators and 304 Not Modified.
+"""
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from auto_proposal.core import models
+from auto_proposal.services import boq_catalog
+
+
+@pytest.fixture(scope="module")
+def client(database, api):
+    with Session(database.engine) as db:
+        company = models.CompanyDetails(company_name="Cache Co")
+        db.add(company)
+        db.flush()
+        for i in range(3):
+            db.add(models.ClientDetails(company_id=company.id, client_name=f"Client {i}"))
+            db.add(models.PseApBoqItems(company_id=company.id, project_type="Office",
+                                        title=f"Item {i}", description=f"Cached item {i}", basic_rate=i))
+        db.commit()
+
+    boq_catalog.backend.clear()
+    yield TestClient(api)
+    boq_catalog.backend.clear()
+
+
+@pytest.mark.parametrize("path", [
+    "/api/clients/1",
+    "/api/clients/company/1",
+    "/api/companies/1",
+    "/api/companies/1/users",
+    "/api/boq-items/?company_id=1",
+    "/api/boq-items/1",
+    "/api/boq-items/project-types/1",
+])
+def test_if_none_match_returns_304(client, path):
+    first = client.get(path)
+    assert first.status_code == 200, first.text
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    second = client.get(path, headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["ETag"] == etag
+
+    assert client.get(path, headers={"If-None-Match": '"stale"'}).status_code == 200
+    assert client.get(path, headers={"If-None-Match": f'"stale", W/{etag}'}).status_code == 304
+
+
+def test_etag_changes_after_an_update(client):
+    etag = client.get("/api/clients/1").headers["ETag"]
+    list_etag = client.get("/api/clients/company/1").headers["ETag"]
+
+    assert client.put("/api/clients/1", json={"client_name": "Renamed"}).status_code == 200
+
+    response = client.get("/api/clients/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["client_name"] == "Renamed"
+    assert client.get("/api/clients/company/1", headers={"If-None-Match": list_etag}).status_code == 200
+
+
+def test_304_keeps_the_next_cursor(client):
+    first = client.get("/api/clients/company/1?limit=2")
+    cursor = first.headers["X-Next-Cursor"]
+
+    second = client.get("/api/clients/company/1?limit=2", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert second.headers["X-Next-Cursor"] == cursor
+
+
+def test_if_modified_since(client):
+    response = client.get("/api/clients/2")
+    last_modified = response.headers["Last-Modified"]
+
+    assert client.get("/api/clients/2", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    earlier = format_datetime(datetime.now(timezone.utc) - timedelta(days=1), usegmt=True)
+    assert client.get("/api/clients/2", headers={"If-Modified-Since": earlier}).status_code == 200
+    # If-None-Match wins over If-Modified-Since
+    assert client.get("/api/clients/2", headers={"If-Modified-Since": last_modified,
+                                                  "If-None-Match": '"stale"'}).status_code == 200
@@ -0,0 +1,123 @@
+"""
+Keyset pagination across rows that share a sort value, and across NULLs.
+"""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, Response
+from fastapi.testclient import TestClient
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, select
+from sqlalchemy.orm import Session
+
+from auto_proposal.api.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, finish_page, keyset
+from auto_proposal.core import models
+
+SAME_DAY = datetime(2024, 3, 1, 9, 30)
+
+
+@pytest.fixture(scope="module")
+def client(database, api):
+    with Session(database.engine) as db:
+        company = models.CompanyDetails(company_name="Paging Co")
+        db.add(company)
+        db.flush()
+        client_row = models.ClientDetails(company_id=company.id, client_name="Paging Client")
+        db.add(client_row)
+        db.flush()
+        # Seven proposals share one timestamp; pages of three must split inside the tie
+        dates = [SAME_DAY] * 7 + [datetime(2024, 2, 1), datetime(2024, 4, 1), datetime(2024, 4, 1)]
+        for n, created in enumerate(dates):
+            db.add(models.Proposal(company_id=company.id, client_id=client_row.id,
+                                   title=f"P{n}", created_date=created))
+        db.commit()
+    return TestClient(api)
+
+
+def pages(client, path, limit, **params):
+    ids, cursor = [], None
+    while True:
+        response = client.get(path, params={"limit": limit, **params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        ids.append([proposal["id"] for proposal in response.json()])
+        if params.get("include_client_name"):
+            assert {proposal["client_name"] for proposal in response.json()} == {"Paging Client"}
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return ids
+
+
+def test_pages_split_rows_with_equal_created_date(client, database):
+    with Session(database.engine) as db:
+        expected = db.execute(
+            select(models.Proposal.id).order_by(models.Proposal.created_date.desc(), models.Proposal.id.desc())
+        ).scalars().all()
+
+    for limit in (1, 2, 3, 4):
+        seen = pages(client, "/api/proposals/company/1", limit)
+        assert [i for page in seen for i in page] == expected
+        assert all(len(page) == limit for page in seen[:-1])
+
+
+def test_pages_with_client_names_match_the_plain_pages(client):
+    for limit in (1, 3):
+        assert pages(client, "/api/proposals/company/1", limit, include_client_name=True) == \
+            pages(client, "/api/proposals/company/1", limit)
+
+
+def test_null_cursor_for_not_null_column_is_rejected(client):
+    cursor = encode_cursor([None, 5])
+    response = client.get("/api/proposals/company/1", params={"cursor": cursor})
+    assert response.status_code == 400
+
+
+def test_proposal_created_date_is_not_null():
+    assert not models.Proposal.__table__.c.CreatedDate.nullable
+
+
+events = Table(
+    "PagingEvent", MetaData(),
+    Column("Id", Integer, primary_key=True),
+    Column("At", DateTime, nullable=True),
+)
+
+
+@pytest.fixture(scope="module")
+def nullable_rows(database):
+    events.create(bind=database.engine)
+    dates = [None, datetime(2024, 1, 1), None, datetime(2024, 1, 2), datetime(2024, 1, 1), None,
+             datetime(2024, 1, 2), datetime(2024, 1, 3), None]
+    with database.engine.begin() as conn:
+        conn.execute(events.insert(), [{"Id": n + 1, "At": at} for n, at in enumerate(dates)])
+    yield [(n + 1, at) for n, at in enumerate(dates)]
+    events.drop(bind=database.engine)
+
+
+def page_all(engine, limit, descending):
+    columns = (events.c.At, events.c.Id)
+    ids, cursor = [], None
+    with engine.connect() as conn:
+        while True:
+            response = Response()
+            rows = finish_page(
+                conn.execute(keyset(select(events), columns, cursor, limit, descending)).all(),
+                limit, response, lambda row: (row.At, row.Id),
+            )
+            ids.extend(row.Id for row in rows)
+            cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            if cursor is None:
+                return ids
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("limit", [1, 2, 4])
+def test_nullable_sort_column_pages_every_row_once(database, nullable_rows, limit, descending):
+    # NULL sorts lowest, as in MySQL and SQLite
+    expected = [n for n, _ in sorted(nullable_rows, key=lambda row: (row[1] is not None, row[1] or datetime.min, row[0]),
+                                     reverse=descending)]
+    assert page_all(database.engine, limit, descending) == expected
+
+
+def test_null_cursor_for_nullable_column_is_accepted():
+    assert decode_cursor(encode_cursor([None, 3]), (events.c.At, events.c.Id)) == [None, 3]
+    with pytest.raises(HTTPException):
+        decode_cursor(encode_cursor([None, None]), (events.c.At, events.c.Id))
@@ -0,0 +1,183 @@
+"""
+Proposal PDF rendering: the shared engine and the /api/proposals/{id}/pdf routes.
+"""
+import asyncio
+import io
+import os
+from urllib.parse import unquote
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy.orm import Session
+
+from auto_proposal.core import models
+from auto_proposal.services import pdf_service
+
+PROPOSAL = {
+    "id": 7,
+    "title": "Office <Fit-out> & Interiors",
+    "project_type": "Office",
+    "area": "1200",
+    "client": {"client_name": "Acme & Sons", "mobile_number": "9999999999"},
+    "items": [
+        {"item_name": "Flooring", "description": "Vitrified tiles", "qty": 3, "unit_price": 1500.0},
+        {"item_name": "Paint", "description": None, "qty": 1, "unit_price": 800.0},
+    ],
+}
+COMPANY = {"company_name": "Build Co", "address_line1": "1 Main Road", "city": "Pune",
+           "postal_code": "411001", "email": "hello@build.co", "gst_number": "27ABCDE1234F1Z5"}
+
+
+def png(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 40), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="module")
+def client(database, api):
+    with Session(database.engine) as db:
+        company = models.CompanyDetails(company_name="Build Co", gst_number="27ABCDE1234F1Z5")
+        db.add(company)
+        db.flush()
+        client_row = models.ClientDetails(company_id=company.id, client_name="Acme")
+        db.add(client_row)
+        db.flush()
+        proposal = models.Proposal(company_id=company.id, client_id=client_row.id, title="Kitchen Remodel")
+        db.add(proposal)
+        db.flush()
+        db.add(models.ProposalItem(proposal_id=proposal.id, item_name="Cabinets", qty=2, unit_price=2500.0))
+        db.commit()
+
+    workers = pdf_service.RENDER_WORKERS
+    pdf_service.RENDER_WORKERS = 0
+    yield TestClient(api)
+    pdf_service.RENDER_WORKERS = workers
+
+
+def test_render_returns_pdf_bytes():
+    content = pdf_service.render_proposal_pdf(PROPOSAL, COMPANY)
+    assert content.startswith(b"%PDF")
+
+
+def test_render_with_logo(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_service, "LOGO_DIR", str(tmp_path))
+    logo_path = pdf_service.store_logo(png((200, 30, 30)), "logo.png")
+    assert pdf_service.store_logo(png((200, 30, 30)), "logo.png") == logo_path
+
+    assert pdf_service.render_proposal_pdf(PROPOSAL, COMPANY, logo_path).startswith(b"%PDF")
+    assert pdf_service.logo_color(logo_path) == "#c81e1e"
+    assert os.path.exists(f"{logo_path}.color.json")
+
+
+def test_brand_styles_are_built_once():
+    assert pdf_service.brand_styles("#123456") is pdf_service.brand_styles("#123456")
+
+
+def test_pdf_filename():
+    assert pdf_service.pdf_filename(PROPOSAL) == "Office_Fit_out_Interiors_7.pdf"
+
+
+def test_get_pdf(client):
+    response = client.get("/api/proposals/1/pdf")
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.headers["content-disposition"] == (
+        'inline; filename="Kitchen_Remodel_1.pdf"; filename*=UTF-8\'\'Kitchen_Remodel_1.pdf'
+    )
+    assert response.content.startswith(b"%PDF")
+
+    unchanged = client.get("/api/proposals/1/pdf", headers={"If-None-Match": response.headers["ETag"]})
+    assert unchanged.status_code == 304
+
+
+def test_post_pdf_with_logo(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_service, "LOGO_DIR", str(tmp_path))
+    response = client.post("/api/proposals/1/pdf", files={"logo": ("logo.png", png((20, 90, 200)), "image/png")})
+    assert response.status_code == 200, response.text
+    assert response.content.startswith(b"%PDF")
+    assert any(name.endswith(".png") for name in os.listdir(tmp_path))
+
+
+def test_pdf_with_non_latin_title(client, database):
+    with Session(database.engine) as db:
+        proposal = models.Proposal(company_id=1, client_id=1, title="Ремонт кухни №2")
+        db.add(proposal)
+        db.commit()
+        proposal_id = proposal.id
+
+    response = client.get(f"/api/proposals/{proposal_id}/pdf")
+
+    assert response.status_code == 200, response.text
+    disposition = response.headers["content-disposition"]
+    ascii_name, utf8_name = disposition.split("; ")[1:]
+    assert ascii_name == f'filename="_____________2_{proposal_id}.pdf"'
+    assert unquote(utf8_name.removeprefix("filename*=UTF-8''")) == f"Ремонт_кухни_2_{proposal_id}.pdf"
+
+
+def test_content_disposition_escapes_quotes():
+    assert pdf_service.content_disposition('a "b"\\c.pdf', "attachment") == (
+        'attachment; filename="a _b__c.pdf"; filename*=UTF-8\'\'a%20%22b%22%5Cc.pdf'
+    )
+
+
+@pytest.mark.parametrize("url,allowed", [
+    ("https://logos.s3.amazonaws.com/acme.png", True),
+    ("https://LOGOS.s3.amazonaws.com:443/acme.png?v=2", True),
+    ("http://logos.s3.amazonaws.com/acme.png", False),
+    ("https://logos.s3.amazonaws.com:8443/acme.png", False),
+    ("https://logos.s3.amazonaws.com@169.254.169.254/latest/meta-data", False),
+    ("https://169.254.169.254/latest/meta-data", False),
+    ("https://other.s3.amazonaws.com/acme.png", False),
+    ("file:///etc/passwd", False),
+    ("https://[::1/", False),
+    (None, False),
+])
+def test_logo_url_allowed(monkeypatch, url, allowed):
+    monkeypatch.setattr(pdf_service, "LOGO_HOSTS", {"logos.s3.amazonaws.com"})
+    assert pdf_service.logo_url_allowed(url) is allowed
+
+
+@pytest.fixture
+def logo_server(tmp_path, monkeypatch):
+    """Serve logos through a mock transport and record every requested URL."""
+    requested = []
+
+    def handler(request):
+        requested.append(str(request.url))
+        if request.url.path == "/moved.png":
+            return httpx.Response(302, headers={"Location": "http://169.254.169.254/"})
+        if request.url.path == "/huge.png":
+            return httpx.Response(200, content=b"x" * 64)
+        return httpx.Response(200, content=png((10, 120, 10)))
+
+    client_class = httpx.AsyncClient
+    monkeypatch.setattr(httpx, "AsyncClient",
+                        lambda **kwargs: client_class(transport=httpx.MockTransport(handler), **kwargs))
+    monkeypatch.setattr(pdf_service, "LOGO_DIR", str(tmp_path))
+    monkeypatch.setattr(pdf_service, "LOGO_HOSTS", {"logos.s3.amazonaws.com"})
+    return requested
+
+
+def test_fetch_logo_from_allowed_host(logo_server):
+    path = asyncio.run(pdf_service.fetch_logo("https://logos.s3.amazonaws.com/acme.png"))
+    assert path and os.path.exists(path)
+    # Downloaded once
+    assert asyncio.run(pdf_service.fetch_logo("https://logos.s3.amazonaws.com/acme.png")) == path
+    assert logo_server == ["https://logos.s3.amazonaws.com/acme.png"]
+
+
+def test_fetch_logo_refuses_other_hosts_redirects_and_large_files(logo_server, monkeypatch):
+    monkeypatch.setattr(pdf_service, "MAX_LOGO_BYTES", 32)
+
+    assert asyncio.run(pdf_service.fetch_logo("http://169.254.169.254/latest/meta-data")) is None
+    assert asyncio.run(pdf_service.fetch_logo("https://logos.s3.amazonaws.com/moved.png")) is None
+    assert asyncio.run(pdf_service.fetch_logo("https://logos.s3.amazonaws.com/huge.png")) is None
+    assert logo_server == ["https://logos.s3.amazonaws.com/moved.png", "https://logos.s3.amazonaws.com/huge.png"]
+
+
+def test_pdf_of_missing_proposal(client):
+    assert client.get("/api/proposals/999/pdf").status_code == 404
+    assert client.post("/api/proposals/999/pdf").status_code == 404
@@ -0,0 +1,116 @@
+"""
+Connection pool metrics: checkout waits and timeouts, hold times, and the
+/metrics output.
+"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from auto_proposal.api.routes import metrics as metrics_route
+from auto_proposal.db import pool_metrics
+
+POOL = "test-async"
+LABELS = f'pool="{POOL}"'
+
+
+@pytest.fixture(scope="module")
+def engine(database):
+    pool_metrics.register_pool(POOL)
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{database.path}",
+        poolclass=pool_metrics.InstrumentedAsyncAdaptedQueuePool,
+        pool_logging_name=POOL,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.2,
+    )
+    pool_metrics.instrument_engine(engine.sync_engine)
+    yield engine
+    asyncio.run(engine.dispose())
+    del pool_metrics._registry[POOL]
+
+
+@pytest.fixture(scope="module")
+def client(api):
+    return TestClient(api)
+
+
+def scrape(client, **kwargs):
+    response = client.get("/metrics", **kwargs)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/plain")
+    samples = {}
+    for line in response.text.splitlines():
+        name, value = line.rsplit(" ", 1)
+        samples[name] = float(value)
+    return samples
+
+
+def test_checkouts_and_timeouts_are_counted(client, engine):
+    async def use_pool():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            await asyncio.sleep(0.03)
+            # The only connection is taken: a second checkout waits pool_timeout, then fails
+            with pytest.raises(exc.TimeoutError):
+                async with engine.connect():
+                    pass
+
+    asyncio.run(use_pool())
+    samples = scrape(client)
+
+    assert samples[f"db_pool_size{{{LABELS}}}"] == 1
+    assert samples[f"db_pool_checked_out{{{LABELS}}}"] == 0
+    assert samples[f"db_pool_connects_total{{{LABELS}}}"] == 1
+    assert samples[f"db_pool_checkouts_total{{{LABELS}}}"] == 1
+    assert samples[f"db_pool_timeouts_total{{{LABELS}}}"] == 1
+
+    # Two timed checkouts: the immediate one, and the one that waited out the 0.2 s timeout
+    assert samples[f"db_pool_wait_seconds_count{{{LABELS}}}"] == 2
+    assert samples[f'db_pool_wait_seconds_bucket{{{LABELS},le="0.1"}}'] == 1
+    assert samples[f'db_pool_wait_seconds_bucket{{{LABELS},le="0.25"}}'] == 2
+    assert samples[f'db_pool_wait_seconds_bucket{{{LABELS},le="+Inf"}}'] == 2
+    assert samples[f"db_pool_wait_seconds_sum{{{LABELS}}}"] >= 0.2
+
+    # Held across the sleep and the failed checkout
+    assert samples[f"db_pool_hold_seconds_count{{{LABELS}}}"] == 1
+    assert samples[f'db_pool_hold_seconds_bucket{{{LABELS},le="0.1"}}'] == 0
+    assert samples[f'db_pool_hold_seconds_bucket{{{LABELS},le="0.5"}}'] == 1
+
+    # Occupancy sampled after the checkout
+    assert samples[f'db_pool_checked_out_at_checkout_bucket{{{LABELS},le="0"}}'] == 0
+    assert samples[f'db_pool_checked_out_at_checkout_bucket{{{LABELS},le="1"}}'] == 1
+    assert samples[f'db_pool_overflow_at_checkout_bucket{{{LABELS},le="0"}}'] == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = pool_metrics.Histogram((1, 5))
+    for value in (0.5, 1, 3, 9):
+        histogram.observe(value)
+
+    assert histogram.render("h", 'pool="x"') == [
+        'h_bucket{pool="x",le="1"} 2',
+        'h_bucket{pool="x",le="5"} 3',
+        'h_bucket{pool="x",le="+Inf"} 4',
+        'h_sum{pool="x"} 13.5',
+        'h_count{pool="x"} 4',
+    ]
+
+
+def test_metrics_need_the_token(client, monkeypatch):
+    monkeypatch.setattr(metrics_route, "METRICS_TOKEN", "scrape-key")
+
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert "db_pool_checkouts_total" in client.get(
+        "/metrics", headers={"Authorization": "Bearer scrape-key"}).text
+
+
+def test_metrics_without_a_token_configured_need_anonymous_access(client, monkeypatch):
+    monkeypatch.setattr(metrics_route, "METRICS_TOKEN", None)
+    monkeypatch.setattr(metrics_route.security, "AUTH_REQUIRED", True)
+
+    assert client.get("/metrics").status_code == 401
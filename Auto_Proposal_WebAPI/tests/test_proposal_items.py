@@ -0,0 +1,129 @@
+"""
+Bulk replacement of a proposal's items: one transaction of inserts, updates and deletes.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from auto_proposal.core import models
+
+
+@pytest.fixture(scope="module")
+def client(database, api):
+    with Session(database.engine) as db:
+        company = models.CompanyDetails(company_name="Items Co")
+        db.add(company)
+        db.flush()
+        client_row = models.ClientDetails(company_id=company.id, client_name="Items Client")
+        db.add(client_row)
+        db.flush()
+        for title in ("First", "Second"):
+            db.add(models.Proposal(company_id=company.id, client_id=client_row.id, title=title))
+        db.commit()
+    return TestClient(api)
+
+
+def item(name, price=10.0, qty=1, **fields):
+    return {"item_name": name, "qty": qty, "unit_price": price, **fields}
+
+
+def bulk(client, proposal_id, items):
+    return client.put(f"/api/proposal-items/proposal/{proposal_id}/bulk", json={"items": items})
+
+
+def stored_items(database, proposal_id):
+    with Session(database.engine) as db:
+        rows = db.execute(select(models.ProposalItem).where(models.ProposalItem.proposal_id == proposal_id)
+                          .order_by(models.ProposalItem.id)).scalars().all()
+        return [(row.id, row.item_name, row.qty, row.unit_price) for row in rows]
+
+
+def test_mixed_insert_update_delete(client, database):
+    created = bulk(client, 1, [item("Keep"), item("Change"), item("Drop")]).json()["items"]
+    keep, change, _ = (entry["id"] for entry in created)
+
+    response = bulk(client, 1, [
+        item("Keep", id=keep),
+        item("Changed", price=25.0, qty=3, id=change),
+        item("New", price=5.0),
+    ])
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["inserted"], body["updated"], body["deleted"]) == (1, 2, 1)
+    assert [entry["item_name"] for entry in body["items"]] == ["Keep", "Changed", "New"]
+    stored = stored_items(database, 1)
+    assert [row[1] for row in stored] == ["Keep", "Changed", "New"]
+    assert stored[:2] == [(keep, "Keep", 1, 10.0), (change, "Changed", 3, 25.0)]
+
+
+def test_item_of_another_proposal_is_rejected(client, database):
+    other = bulk(client, 2, [item("Other")]).json()["items"][0]["id"]
+    before = stored_items(database, 1)
+
+    response = bulk(client, 1, [item("Stolen", id=other)])
+
+    assert response.status_code == 400
+    assert stored_items(database, 1) == before
+    assert stored_items(database, 2) == [(other, "Other", 1, 10.0)]
+
+
+def test_item_listed_twice_is_rejected(client, database):
+    existing = stored_items(database, 1)[0][0]
+    before = stored_items(database, 1)
+
+    response = bulk(client, 1, [item("A", id=existing), item("B", id=existing)])
+
+    assert response.status_code == 400
+    assert stored_items(database, 1) == before
+
+
+def test_empty_list_deletes_every_item(client, database):
+    bulk(client, 1, [item("One"), item("Two")])
+
+    response = bulk(client, 1, [])
+
+    assert response.status_code == 200, response.text
+    assert response.json()["deleted"] == 2
+    assert response.json()["items"] == []
+    assert stored_items(database, 1) == []
+    # Other proposals keep their items
+    assert stored_items(database, 2)
+
+
+def test_invalid_row_changes_nothing(client, database):
+    bulk(client, 1, [item("Stays")])
+    before = stored_items(database, 1)
+
+    response = bulk(client, 1, [item("Fine"), item("Bad", qty=0)])
+
+    assert response.status_code == 422
+    assert stored_items(database, 1) == before
+
+
+def test_database_error_rolls_back_the_whole_replace(database, api):
+    before = stored_items(database, 1)
+    assert before
+
+    def fail_inserts(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT"):
+            raise RuntimeError("insert failed")
+
+    # The delete and update have run by the time the insert fails
+    engine = database.async_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", fail_inserts)
+    try:
+        response = TestClient(api, raise_server_exceptions=False).put(
+            "/api/proposal-items/proposal/1/bulk",
+            json={"items": [item("Renamed", id=before[0][0]), item("Inserted")]},
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", fail_inserts)
+
+    assert response.status_code == 500
+    assert stored_items(database, 1) == before
+
+
+def test_unknown_proposal(client):
+    assert bulk(client, 999, [item("X")]).status_code == 404
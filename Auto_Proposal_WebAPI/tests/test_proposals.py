@@ -0,0 +1,147 @@
+"""
+Proposal routes: create with items, the aggregated /full response, and the
+company list with client names.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from auto_proposal.api import security
+from auto_proposal.core import models, schemas
+
+# Filled by the client fixture
+ids = {}
+
+
+@pytest.fixture(scope="module")
+def client(database, api):
+    with Session(database.engine) as db:
+        ours = models.CompanyDetails(company_name="Proposal Co")
+        theirs = models.CompanyDetails(company_name="Their Co")
+        db.add_all([ours, theirs])
+        db.flush()
+        user = models.UserDetails(company_id=ours.id, full_name="Proposal User", email="p@example.com")
+        our_client = models.ClientDetails(company_id=ours.id, client_name="Acme Builders", email_address="a@example.com")
+        their_client = models.ClientDetails(company_id=theirs.id, client_name="Their Client")
+        db.add_all([user, our_client, their_client])
+        db.flush()
+        their_proposal = models.Proposal(company_id=theirs.id, client_id=their_client.id, title="Theirs")
+        db.add(their_proposal)
+        db.add_all([
+            models.PseApBoqItems(company_id=ours.id, project_type="Interior", title="Tiles"),
+            models.PseApBoqItems(company_id=ours.id, project_type="Interior", title="Paint"),
+            models.PseApBoqItems(company_id=ours.id, title="Untyped"),
+        ])
+        db.commit()
+        ids.update(ours=ours.id, theirs=theirs.id, our_client=our_client.id, their_proposal=their_proposal.id)
+        token = security.issue_tokens(user)["access_token"]
+
+    return TestClient(api, headers={"Authorization": f"Bearer {token}"})
+
+
+def proposal_body(**fields):
+    return {"company_id": ids["ours"], "client_id": ids["our_client"], "title": "Fit-out", **fields}
+
+
+def count(database, model):
+    with Session(database.engine) as db:
+        return db.execute(select(func.count()).select_from(model)).scalar_one()
+
+
+def test_create_writes_the_items_and_returns_them(client, database):
+    items = [
+        {"item_name": "Tiles", "description": "Vitrified", "qty": 3, "unit_price": 12.5},
+        {"item_name": "Paint", "qty": 1, "unit_price": 40.0},
+    ]
+
+    response = client.post("/api/proposals/", json=proposal_body(items=items))
+
+    assert response.status_code == 201, response.text
+    body = response.json()
+    assert body["status"] == "Draft"
+    assert [(i["item_name"], i["qty"], i["unit_price"], i["total"]) for i in body["items"]] == [
+        ("Tiles", 3, 12.5, 37.5), ("Paint", 1, 40.0, 40.0),
+    ]
+    assert all(i["proposal_id"] == body["id"] for i in body["items"])
+    with Session(database.engine) as db:
+        stored = db.execute(select(models.ProposalItem.id).where(models.ProposalItem.proposal_id == body["id"])
+                            .order_by(models.ProposalItem.id)).scalars().all()
+    assert stored == [i["id"] for i in body["items"]]
+
+
+def test_create_without_items(client):
+    response = client.post("/api/proposals/", json=proposal_body())
+
+    assert response.status_code == 201, response.text
+    assert response.json()["items"] == []
+
+
+def test_create_is_one_transaction(client, database):
+    proposals, items = count(database, models.Proposal), count(database, models.ProposalItem)
+    engine = database.async_engine.sync_engine
+
+    def fail_items(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('INSERT INTO "PROPOSALITEM"'):
+            raise RuntimeError("disk full")
+
+    event.listen(engine, "before_cursor_execute", fail_items)
+    try:
+        with pytest.raises(RuntimeError, match="disk full"):
+            client.post("/api/proposals/", json=proposal_body(items=[{"item_name": "Tiles", "unit_price": 1.0}]))
+    finally:
+        event.remove(engine, "before_cursor_execute", fail_items)
+
+    # The proposal was flushed before the items failed, and rolled back with them
+    assert count(database, models.Proposal) == proposals
+    assert count(database, models.ProposalItem) == items
+
+
+def test_create_for_another_company_is_forbidden(client, database):
+    proposals = count(database, models.Proposal)
+
+    response = client.post("/api/proposals/", json=proposal_body(company_id=ids["theirs"]))
+
+    assert response.status_code == 403
+    assert count(database, models.Proposal) == proposals
+
+
+def test_full_has_the_client_items_and_project_types(client):
+    created = client.post("/api/proposals/", json=proposal_body(
+        items=[{"item_name": "Tiles", "qty": 2, "unit_price": 5.0}])).json()
+
+    response = client.get(f"/api/proposals/{created['id']}/full")
+
+    assert response.status_code == 200, response.text
+    full = response.json()
+    assert full["id"] == created["id"]
+    assert (full["client"]["id"], full["client"]["client_name"]) == (ids["our_client"], "Acme Builders")
+    assert full["items"] == created["items"]
+    assert full["project_types"] == ["Interior"]
+    assert full["clients"] is None
+
+    clients = client.get(f"/api/proposals/{created['id']}/full", params={"include_clients": True}).json()["clients"]
+    assert [c["client_name"] for c in clients] == ["Acme Builders"]
+
+
+def test_full_of_a_missing_proposal_is_not_found(client):
+    assert client.get("/api/proposals/999999/full").status_code == 404
+
+
+def test_full_of_another_companys_proposal_is_forbidden(client):
+    response = client.get(f"/api/proposals/{ids['their_proposal']}/full")
+
+    assert response.status_code == 403
+    assert response.json()["detail"]["error_code"] == "COMPANY_MISMATCH"
+    assert "Their Client" not in response.text
+
+
+def test_list_with_and_without_client_names(client):
+    url = f"/api/proposals/company/{ids['ours']}"
+    plain = client.get(url).json()
+    named = client.get(url, params={"include_client_name": True}).json()
+
+    assert plain and all(set(p) == set(schemas.ProposalResponse.model_fields) for p in plain)
+    assert [p["id"] for p in named] == [p["id"] for p in plain]
+    assert {p["client_name"] for p in named} == {"Acme Builders"}
+    assert [{k: v for k, v in p.items() if k != "client_name"} for p in named] == plain
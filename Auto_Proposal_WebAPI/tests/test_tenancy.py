@@ -0,0 +1,128 @@
+"""
+A token of one company cannot read or change another company's data.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from auto_proposal.api import security
+from auto_proposal.core import models
+from auto_proposal.services import import_jobs
+
+# Filled by the client fixture: ids of the rows of our company and of the other one
+ids = {}
+
+
+@pytest.fixture(scope="module")
+def client(database, api):
+    with Session(database.engine) as db:
+        ours = models.CompanyDetails(company_name="Our Co")
+        theirs = models.CompanyDetails(company_name="Their Co")
+        db.add_all([ours, theirs])
+        db.flush()
+        our_user = models.UserDetails(company_id=ours.id, full_name="Our User", email="us@example.com")
+        their_user = models.UserDetails(company_id=theirs.id, full_name="Their User", email="them@example.com")
+        their_client = models.ClientDetails(company_id=theirs.id, client_name="Their Client")
+        our_boq = models.PseApBoqItems(company_id=ours.id, title="Our item", description="Ours")
+        their_boq = models.PseApBoqItems(company_id=theirs.id, title="Their item", description="Theirs")
+        db.add_all([our_user, their_user, their_client, our_boq, their_boq])
+        db.flush()
+        their_proposal = models.Proposal(company_id=theirs.id, client_id=their_client.id, title="Theirs")
+        db.add(their_proposal)
+        db.flush()
+        their_item = models.ProposalItem(proposal_id=their_proposal.id, item_name="Tiles", qty=1, unit_price=5.0)
+        db.add(their_item)
+        db.commit()
+
+        ids.update(
+            ours=ours.id, theirs=theirs.id, our_user=our_user.id, their_user=their_user.id,
+            our_boq=our_boq.sno, their_boq=their_boq.sno,
+            their_proposal=their_proposal.id, their_item=their_item.id,
+        )
+        token = security.issue_tokens(our_user)["access_token"]
+
+    return TestClient(api, headers={"Authorization": f"Bearer {token}"})
+
+
+def cross_company_requests():
+    item = {"item_name": "X", "qty": 1, "unit_price": 1.0}
+    user = {"email": "new@example.com", "full_name": "New", "password": "secret1"}
+    return [
+        # Proposal items
+        ("POST", "/api/proposal-items/", lambda: {"proposal_id": ids["their_proposal"], **item}),
+        ("GET", "/api/proposal-items/proposal/{their_proposal}", None),
+        ("PUT", "/api/proposal-items/proposal/{their_proposal}/bulk", lambda: {"items": []}),
+        ("GET", "/api/proposal-items/{their_item}", None),
+        ("PUT", "/api/proposal-items/{their_item}", lambda: {"qty": 9}),
+        ("DELETE", "/api/proposal-items/{their_item}", None),
+        # BOQ items
+        ("POST", "/api/boq-items/", lambda: {"company_id": ids["theirs"], "title": "X", "description": "X"}),
+        ("GET", "/api/boq-items/?company_id={theirs}", None),
+        ("GET", "/api/boq-items/{their_boq}", None),
+        ("PUT", "/api/boq-items/{their_boq}", lambda: {"title": "Taken"}),
+        ("PUT", "/api/boq-items/{our_boq}", lambda: {"company_id": ids["theirs"]}),
+        ("DELETE", "/api/boq-items/{their_boq}", None),
+        ("GET", "/api/boq-items/import-jobs/their-job", None),
+        # Users
+        ("POST", "/api/users/", lambda: {"company_id": ids["theirs"], **user}),
+        ("GET", "/api/users/{their_user}", None),
+        ("PUT", "/api/users/{their_user}", lambda: {"full_name": "Renamed"}),
+        ("PUT", "/api/users/{our_user}", lambda: {"company_id": ids["theirs"]}),
+        ("PATCH", "/api/users/{their_user}/deactivate", None),
+        ("PATCH", "/api/users/{their_user}/activate", None),
+        ("DELETE", "/api/users/{their_user}", None),
+        # Companies
+        ("GET", "/api/companies/{theirs}", None),
+        ("PUT", "/api/companies/{theirs}", lambda: {"company_name": "Renamed"}),
+        ("PATCH", "/api/companies/{theirs}/deactivate", None),
+        ("PATCH", "/api/companies/{theirs}/activate", None),
+        ("DELETE", "/api/companies/{theirs}", None),
+        ("GET", "/api/companies/{theirs}/users", None),
+    ]
+
+
+@pytest.mark.parametrize("method,path,body", cross_company_requests(),
+                         ids=[f"{method} {path}" for method, path, _ in cross_company_requests()])
+def test_other_company_is_forbidden(client, monkeypatch, method, path, body):
+    monkeypatch.setattr(import_jobs, "get", lambda job_id: {"job_id": job_id, "company_id": ids["theirs"]})
+
+    response = client.request(method, path.format(**ids), json=body() if body else None)
+
+    assert response.status_code == 403, response.text
+    assert response.json()["detail"]["error_code"] == "COMPANY_MISMATCH"
+
+
+def test_nothing_of_the_other_company_changed(client, database):
+    with Session(database.engine) as db:
+        assert db.get(models.ProposalItem, ids["their_item"]).qty == 1
+        assert db.get(models.PseApBoqItems, ids["their_boq"]).title == "Their item"
+        assert db.get(models.PseApBoqItems, ids["our_boq"]).company_id == ids["ours"]
+        assert db.get(models.UserDetails, ids["their_user"]).full_name == "Their User"
+        assert db.get(models.UserDetails, ids["our_user"]).company_id == ids["ours"]
+        assert db.get(models.CompanyDetails, ids["theirs"]).company_name == "Their Co"
+
+
+def test_lists_only_show_the_callers_company(client):
+    companies = client.get("/api/companies/").json()
+    assert [company["id"] for company in companies] == [ids["ours"]]
+
+    found = client.get("/api/companies/search/name/Co").json()
+    assert [company["id"] for company in found] == [ids["ours"]]
+
+    users = client.get("/api/users/").json()
+    assert [user["id"] for user in users] == [ids["our_user"]]
+
+    # Without company_id the BOQ list defaults to the caller's company
+    items = client.get("/api/boq-items/").json()
+    assert [item["sno"] for item in items] == [ids["our_boq"]]
+
+
+def test_own_company_is_allowed(client):
+    assert client.get(f"/api/users/{ids['our_user']}").status_code == 200
+    assert client.get(f"/api/boq-items/{ids['our_boq']}").status_code == 200
+    assert client.get(f"/api/companies/{ids['ours']}").status_code == 200
+
+    created = client.post("/api/boq-items/", json={"title": "Mine", "description": "Mine"})
+    assert created.status_code == 201, created.text
+    assert created.json()["company_id"] == ids["ours"]
+    client.delete(f"/api/boq-items/{created.json()['sno']}")